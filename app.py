@@ -1,21 +1,32 @@
 import os
-from flask import Flask, request, jsonify, session
+import json
+from flask import Flask, Response, request, jsonify, session, stream_with_context
 from flask_cors import CORS
 from waitress import serve
 from flask_session import Session
 from sendgrid import SendGridAPIClient
 from sendgrid.helpers.mail import Mail
-from testeDaIa import perguntar_ollama, buscar_na_web, get_persona_texto
+from testeDaIa import (
+    perguntar_ollama, perguntar_ollama_stream, buscar_na_web, carregar_indice_respostas, gerar_texto_llm
+)
 import secrets
+import threading
+from collections import namedtuple
 from datetime import datetime, timedelta
 from banco.banco import (
     criar_banco, criarUsuario, procurarUsuarioPorEmail,
-    pegarHistorico, salvarMensagem, carregar_conversas, carregar_memorias,
+    pegarHistorico, carregar_conversas,
     pegarPersonaEscolhida, escolherApersona, deleta_conversa, criar_nova_conversa,
     salvar_token_redefinicao, procurarUsuarioPorToken, atualizar_senha,
-    carregar_mensagens_por_conversa_id
+    carregar_mensagens_por_conversa_id, carregar_resumo_conversa, salvar_resumo_conversa,
+    agregar_uso, pool_banco, cauda_conversas
 )
-from classificadorDaWeb.classificador_busca_web import deve_buscar_na_web
+from banco.turno import TurnoBanco, estatisticas_turnos
+from classificadorDaWeb.classificador_busca_web import avaliar_busca_web, avaliar_busca_web_com_historico
+from classificadorDaWeb.politica_busca import PoliticaBuscaEspeculativa
+from conversas.historico import turnos_nao_resumidos
+from conversas.resumo import MAX_PALAVRAS_RESUMO, ResumidorConversas
+import metricas
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY')
@@ -51,12 +62,32 @@ CORS(
     max_age=3600
 )
 
+politica_busca = PoliticaBuscaEspeculativa(buscar_na_web, avaliar_busca_web, avaliar_busca_web_com_historico)
+metricas.registrar_fonte("busca_web_especulativa", politica_busca.estatisticas)
+
+resumidor_conversas = ResumidorConversas(
+    # ~2 tokens por palavra em português, com folga
+    lambda pedido: gerar_texto_llm(pedido, max_tokens=MAX_PALAVRAS_RESUMO * 3),
+    carregar_resumo_conversa,
+    carregar_mensagens_por_conversa_id,
+    salvar_resumo_conversa,
+)
+metricas.registrar_fonte("resumo_conversas", resumidor_conversas.estatisticas)
+
+metricas.registrar_fonte("pool_banco", pool_banco.estatisticas)
+metricas.registrar_fonte("turnos_banco", estatisticas_turnos.estatisticas)
+metricas.registrar_fonte("cauda_conversas", cauda_conversas.estatisticas)
+
 try:
     criar_banco()
     print("✅ Tabelas criadas/verificadas com sucesso!")
+    pool_banco.aquecer()
 except Exception as e:
     print(f"❌ Erro ao criar tabelas: {e}")
 
+# O índice de respostas parecidas é montado fora do caminho de boot
+threading.Thread(target=carregar_indice_respostas, daemon=True, name="indice-respostas").start()
+
 def verificar_login():
     email = session.get('usuario_email')
     if email:
@@ -68,6 +99,77 @@ def verificar_login():
 def validar_persona(persona):
     return persona in ['professor', 'empresarial', 'social']
 
+# Maior página de /Lyria/conversas e /Lyria/historico; o restante vem pelo cursor `antes`
+LIMITE_PAGINA_MAXIMO = int(os.getenv("LIMITE_PAGINA_MAXIMO", 50))
+
+ContextoTurno = namedtuple(
+    "ContextoTurno", "persona_tipo historico_conversa resumo turnos_resumidos turnos_salvos memorias contexto_web"
+)
+
+def carregar_contexto_turno(turno, pergunta, conversa_id):
+    """Contexto de um turno logado (None se o usuário não tem persona), lido pela conexão do turno.
+
+    historico_conversa traz só os turnos da cauda da conversa que o resumo guardado ainda não cobre.
+    """
+    # A busca na web (se a pergunta pede) roda enquanto o histórico e as memórias são carregados
+    busca_web = politica_busca.iniciar(pergunta)
+
+    persona_tipo = turno.persona()
+    if not persona_tipo:
+        busca_web.descartar()
+        return None
+
+    resumo, turnos_resumidos = turno.carregar_resumo(conversa_id)
+    cauda, turnos_salvos = turno.carregar_cauda(conversa_id)
+    historico_conversa = turnos_nao_resumidos(cauda, turnos_salvos, turnos_resumidos)
+    print(f"🧠 Histórico da conversa ({conversa_id}): {len(historico_conversa)} de {turnos_salvos} turnos para a IA")
+
+    # Pergunta de baixa confiança: só especula se há turnos com que o classificador possa confirmá-la
+    busca_web.especular(historico_conversa)
+    memorias = turno.carregar_memorias()
+    turno.concluir_leitura()
+    contexto_web = busca_web.resultado(historico_conversa)
+    return ContextoTurno(
+        persona_tipo, historico_conversa, resumo, turnos_resumidos, turnos_salvos, memorias, contexto_web
+    )
+
+def agendar_resumo(conversa_id, contexto):
+    # +1: o turno que acabou de ser salvo
+    resumidor_conversas.agendar(conversa_id, contexto.turnos_salvos + 1, contexto.turnos_resumidos)
+
+def parametros_pagina(limite_padrao):
+    """(limite, antes) de ?limite=N&antes=<cursor>; o cursor é o id do último item da página anterior."""
+    limite = request.args.get('limite', limite_padrao, type=int)
+    limite = max(1, min(limite, LIMITE_PAGINA_MAXIMO))
+    return limite, request.args.get('antes', type=int)
+
+def paginar(itens, limite, campo_cursor):
+    """Corta a consulta feita com limite + 1; devolve (página, cursor da próxima ou None)."""
+    if len(itens) <= limite:
+        return itens, None
+    pagina = itens[:limite]
+    return pagina, pagina[-1][campo_cursor]
+
+def transmitir(fluxo):
+    """Repassa os pedaços do fluxo como eventos SSE; devolve o valor de retorno do fluxo (ResultadoLLM)."""
+    while True:
+        try:
+            pedaco = next(fluxo)
+        except StopIteration as fim:
+            return fim.value
+        yield evento_sse({"token": pedaco})
+
+def evento_sse(dados, evento=None):
+    prefixo = f"event: {evento}\n" if evento else ""
+    return f"{prefixo}data: {json.dumps(dados, ensure_ascii=False)}\n\n"
+
+def resposta_sse(gerador):
+    return Response(
+        stream_with_context(gerador),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/Lyria/login', methods=['POST'])
 def login():
     print(f"   Origin: {request.headers.get('Origin')}")
@@ -152,9 +254,9 @@ def conversar_sem_conta():
         return jsonify({"erro": "Campos 'pergunta' e 'persona' são obrigatórios"}), 400
 
     try:
-        contexto_web = buscar_na_web(pergunta) if deve_buscar_na_web(pergunta) else None
-        resposta = perguntar_ollama(pergunta, None, None, persona, contexto_web)
-        return jsonify({"resposta": resposta})
+        contexto_web = politica_busca.iniciar(pergunta).resultado()
+        resultado = perguntar_ollama(pergunta, None, None, persona, contexto_web, usar_cache=True)
+        return jsonify({"resposta": resultado.texto})
     except Exception as e:
         print(f"❌ Erro em conversar_sem_conta: {e}")
         return jsonify({"erro": str(e)}), 500
@@ -175,27 +277,105 @@ def conversar_logado():
     try:
         print(f"📌 Usando conversa_id recebido do frontend: {conversa_id}")
 
-        persona_tipo = pegarPersonaEscolhida(usuario)
-        if not persona_tipo:
-            return jsonify({"erro": "Usuário não tem persona definida"}), 400
-        
-        historico_conversa = carregar_mensagens_por_conversa_id(conversa_id)
-        print(f"🧠 Histórico da conversa ({conversa_id}) carregado para a IA: {historico_conversa}")
-        memorias = carregar_memorias(usuario)
-        contexto_web = buscar_na_web(pergunta) if deve_buscar_na_web(pergunta) else None
-        persona_texto = get_persona_texto(persona_tipo)
+        with TurnoBanco(usuario) as turno:
+            contexto = carregar_contexto_turno(turno, pergunta, conversa_id)
+            if not contexto:
+                return jsonify({"erro": "Usuário não tem persona definida"}), 400
 
-        resposta = perguntar_ollama(pergunta, historico_conversa, memorias, persona_texto, contexto_web)
-        
-        conversa_id_retornado = salvarMensagem(usuario, pergunta, resposta, modelo_usado="hf", tokens=None, conversa_id=conversa_id)
+            resultado = perguntar_ollama(
+                pergunta, contexto.historico_conversa, contexto.memorias, contexto.persona_tipo,
+                contexto.contexto_web, resumo=contexto.resumo
+            )
+
+            conversa_id_retornado = turno.salvar_turno(
+                conversa_id, pergunta, resultado.texto,
+                resultado=resultado, persona=contexto.persona_tipo
+            )
+        agendar_resumo(conversa_id_retornado, contexto)
 
-        return jsonify({"resposta": resposta, "conversa_id": conversa_id_retornado})
+        return jsonify({"resposta": resultado.texto, "conversa_id": conversa_id_retornado})
     except Exception as e:
         print(f"❌ Erro detalhado em conversar_logado: {str(e)}")
         import traceback
         print(f"❌ Traceback completo:\n{traceback.format_exc()}")
         return jsonify({"erro": str(e)}), 500
     
+@app.route('/Lyria/conversar/stream', methods=['POST'])
+def conversar_sem_conta_stream():
+    data = request.get_json() or {}
+    pergunta = data.get('pergunta')
+    persona = data.get('persona')
+
+    if not pergunta or not persona:
+        return jsonify({"erro": "Campos 'pergunta' e 'persona' são obrigatórios"}), 400
+
+    try:
+        contexto_web = politica_busca.iniciar(pergunta).resultado()
+    except Exception as e:
+        print(f"❌ Erro em conversar_sem_conta_stream: {e}")
+        return jsonify({"erro": str(e)}), 500
+
+    def gerar():
+        try:
+            yield from transmitir(perguntar_ollama_stream(pergunta, None, None, persona, contexto_web, usar_cache=True))
+            yield evento_sse({"status": "ok"}, evento="fim")
+        except Exception as e:
+            print(f"❌ Erro no stream de conversar_sem_conta: {e}")
+            yield evento_sse({"erro": str(e)}, evento="erro")
+
+    return resposta_sse(gerar())
+
+@app.route('/Lyria/conversar-logado/stream', methods=['POST'])
+def conversar_logado_stream():
+    usuario = verificar_login()
+    if not usuario:
+        return jsonify({"erro": "Usuário não está logado"}), 401
+
+    data = request.get_json() or {}
+    pergunta = data.get('pergunta')
+    conversa_id = data.get('conversa_id')
+
+    if not pergunta or not conversa_id:
+        return jsonify({"erro": "Campos 'pergunta' e 'conversa_id' são obrigatórios"}), 400
+
+    # A conexão do turno só volta ao pool quando o stream termina (ou o cliente desconecta)
+    turno = TurnoBanco(usuario)
+    try:
+        turno.abrir()
+        contexto = carregar_contexto_turno(turno, pergunta, conversa_id)
+        if not contexto:
+            turno.fechar()
+            return jsonify({"erro": "Usuário não tem persona definida"}), 400
+    except Exception as e:
+        turno.fechar(type(e), e, e.__traceback__)
+        print(f"❌ Erro em conversar_logado_stream: {e}")
+        return jsonify({"erro": str(e)}), 500
+
+    def gerar():
+        try:
+            resultado = yield from transmitir(perguntar_ollama_stream(
+                pergunta, contexto.historico_conversa, contexto.memorias, contexto.persona_tipo,
+                contexto.contexto_web, resumo=contexto.resumo
+            ))
+
+            # A resposta completa só é salva quando o stream termina
+            conversa_id_retornado = turno.salvar_turno(
+                conversa_id, pergunta, resultado.texto,
+                resultado=resultado, persona=contexto.persona_tipo
+            )
+            turno.fechar()
+            agendar_resumo(conversa_id_retornado, contexto)
+            yield evento_sse({"status": "ok", "conversa_id": conversa_id_retornado}, evento="fim")
+        except Exception as e:
+            turno.fechar(type(e), e, e.__traceback__)
+            print(f"❌ Erro no stream de conversar_logado: {e}")
+            yield evento_sse({"erro": str(e)}, evento="erro")
+
+    resposta = resposta_sse(gerar())
+    # Se o gerador nem chegar a rodar, a conexão é devolvida quando a resposta fecha
+    resposta.call_on_close(turno.fechar)
+    return resposta
+
 @app.route('/Lyria/conversas', methods=['GET'])
 def get_conversas_logado():
     usuario = verificar_login()
@@ -203,12 +383,16 @@ def get_conversas_logado():
         print("❌ Tentativa de acesso não autorizado em /conversas")
         return jsonify({"erro": "Usuário não está logado"}), 401
 
+    limite, antes = parametros_pagina(15)
     try:
-        conversas = carregar_conversas(usuario)
+        # Um item a mais só para saber se existe próxima página
+        conversas = carregar_conversas(usuario, limite + 1, antes)
+        conversas, proximo = paginar(conversas, limite, "conversa_id")
         conversa_ativa = session.get('conversa_id')
         return jsonify({
-            "conversas": conversas or [],
-            "conversa_ativa": conversa_ativa
+            "conversas": conversas,
+            "conversa_ativa": conversa_ativa,
+            "proximo": proximo
         })
     except Exception as e:
         print(f"❌ Erro em get_conversas_logado: {e}")
@@ -239,10 +423,11 @@ def get_historico_logado():
     if not usuario:
         return jsonify({"erro": "Usuário não está logado"}), 401
 
-    limite = min(request.args.get('limite', 10, type=int), 50)
+    limite, antes = parametros_pagina(10)
     try:
-        historico = pegarHistorico(usuario, limite)
-        return jsonify({"historico": historico})
+        historico = pegarHistorico(usuario, limite + 1, antes)
+        historico, proximo = paginar(historico, limite, "id_historico")
+        return jsonify({"historico": historico, "proximo": proximo})
     except Exception as e:
         print(f"❌ Erro em get_historico_logado: {e}")
         return jsonify({"erro": str(e)}), 500
@@ -332,6 +517,44 @@ def listar_personas():
         print(f"❌ Erro em /Lyria/personas: {e}")
         return jsonify({"erro": str(e)}), 500
 
+def metricas_autorizadas():
+    # Sem METRICAS_TOKEN configurado as métricas ficam fechadas
+    token_metricas = os.environ.get('METRICAS_TOKEN')
+    if not token_metricas:
+        return False
+    return secrets.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token_metricas}")
+
+@app.route('/Lyria/metricas', methods=['GET'])
+def get_metricas():
+    if not metricas_autorizadas():
+        return jsonify({"erro": "Não autorizado"}), 401
+
+    try:
+        return jsonify({"metricas": metricas.coletar()}), 200
+    except Exception as e:
+        print(f"❌ Erro em /Lyria/metricas: {e}")
+        return jsonify({"erro": str(e)}), 500
+
+@app.route('/Lyria/metricas/uso', methods=['GET'])
+def get_metricas_uso():
+    """Tokens e latência agregados: ?agrupar=usuario|persona|dia|provedor&dias=30 (usuário vem pelo id, sem email)"""
+    if not metricas_autorizadas():
+        return jsonify({"erro": "Não autorizado"}), 401
+
+    agrupar = request.args.get('agrupar', 'persona')
+    try:
+        dias = int(request.args.get('dias', 30))
+    except ValueError:
+        return jsonify({"erro": "Parâmetro 'dias' deve ser inteiro"}), 400
+
+    try:
+        return jsonify({"agrupar": agrupar, "dias": dias, "uso": agregar_uso(agrupar, dias)}), 200
+    except ValueError as e:
+        return jsonify({"erro": str(e)}), 400
+    except Exception as e:
+        print(f"❌ Erro em /Lyria/metricas/uso: {e}")
+        return jsonify({"erro": str(e)}), 500
+
 def send_password_reset_email(user_email, token):
     """Envia um e-mail de redefinição de senha usando SendGrid."""
     frontend_url = os.environ.get('FRONTEND_URL', 'http://localhost:5173')
@@ -3,265 +3,221 @@ import psycopg2.extras
 from datetime import datetime
 import os
 
+from banco.migracoes import aplicar_migracoes
+from banco.pool import PoolConexoes
+from conversas.historico import CaudaConversas
+
 DB_URL = os.getenv("BANCO_API")
 
+# Conexões abertas sob demanda: importar o módulo não exige banco acessível
+pool_banco = PoolConexoes(DB_URL)
+
+# Últimos turnos das conversas ativas; quem grava um turno anexa aqui
+cauda_conversas = CaudaConversas()
+
 def criar_banco():
-    conn = psycopg2.connect(DB_URL)
-    cursor = conn.cursor()
-
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS usuarios (
-        id SERIAL PRIMARY KEY,
-        nome TEXT NOT NULL,
-        email TEXT NOT NULL UNIQUE,
-        senha_hash TEXT,
-        persona_escolhida TEXT,
-        criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        ultimo_acesso TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        token_redefinicao_senha TEXT,
-        token_redefinicao_expiracao TIMESTAMP
-    );
-    """)
-
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS conversas (
-        id SERIAL PRIMARY KEY,
-        usuario_id INTEGER NOT NULL,
-        mensagens TEXT,
-        iniciado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        status TEXT,
-        FOREIGN KEY (usuario_id) REFERENCES usuarios(id) ON DELETE CASCADE
-    );
-    """)
-
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS user_requests (
-        id SERIAL PRIMARY KEY,
-        usuario_id INTEGER NOT NULL,
-        conversa_id INTEGER NOT NULL,
-        conteudo TEXT NOT NULL,
-        criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (usuario_id) REFERENCES usuarios(id) ON DELETE CASCADE,
-        FOREIGN KEY (conversa_id) REFERENCES conversas(id) ON DELETE CASCADE
-    );
-    """)
-
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS ai_responses (
-        id SERIAL PRIMARY KEY,
-        request_id INTEGER NOT NULL,
-        conteudo TEXT NOT NULL,
-        criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        modelo_usado TEXT,
-        tokens INTEGER,
-        FOREIGN KEY (request_id) REFERENCES user_requests(id) ON DELETE CASCADE
-    );
-    """)
-
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS mensagens (
-        id SERIAL PRIMARY KEY,
-        conversa_id INTEGER NOT NULL,
-        request_id INTEGER NOT NULL,
-        response_id INTEGER NOT NULL,
-        criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (conversa_id) REFERENCES conversas(id) ON DELETE CASCADE,
-        FOREIGN KEY (request_id) REFERENCES user_requests(id) ON DELETE CASCADE,
-        FOREIGN KEY (response_id) REFERENCES ai_responses(id) ON DELETE CASCADE
-    );
-    """)
-
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS memorias (
-        id SERIAL PRIMARY KEY,
-        usuario_id INTEGER NOT NULL,
-        chave TEXT NOT NULL,
-        valor TEXT NOT NULL,
-        tipo TEXT,
-        relevancia INTEGER DEFAULT 0,
-        conversa_origem INTEGER,
-        criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        expira_em TIMESTAMP,
-        FOREIGN KEY (usuario_id) REFERENCES usuarios(id) ON DELETE CASCADE,
-        FOREIGN KEY (conversa_origem) REFERENCES conversas(id) ON DELETE CASCADE
-    );
-    """)
-
-    conn.commit()
-    conn.close()
+    """Cria ou atualiza o schema aplicando as migrações pendentes (banco/migracoes.py)."""
+    return aplicar_migracoes(pool_banco)
 
 def pegarPersonaEscolhida(usuario):
-    conn = psycopg2.connect(DB_URL)
-    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cursor.execute("SELECT persona_escolhida FROM usuarios WHERE email = %s", (usuario,))
-    result = cursor.fetchone()
-    conn.close()
+    with pool_banco.conexao() as conn:
+        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cursor.execute("SELECT persona_escolhida FROM usuarios WHERE email = %s", (usuario,))
+        result = cursor.fetchone()
     return result["persona_escolhida"] if result else None
 
 def escolherApersona(persona, usuario):
-    conn = psycopg2.connect(DB_URL)
-    cursor = conn.cursor()
-    cursor.execute("UPDATE usuarios SET persona_escolhida = %s WHERE email = %s", (persona, usuario))
-    conn.commit()
-    conn.close()
+    with pool_banco.conexao() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE usuarios SET persona_escolhida = %s WHERE email = %s", (persona, usuario))
+        conn.commit()
 
 def deleta_conversa(id):
-    conn = psycopg2.connect(DB_URL)
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM conversas WHERE id = %s", (id,))
-    conn.commit()
-    conn.close()
+    with pool_banco.conexao() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM conversas WHERE id = %s", (id,))
+        conn.commit()
+    cauda_conversas.descartar(int(id))
 
 def criarUsuario(nome, email, persona, senha_hash=None):
-    conn = psycopg2.connect(DB_URL)
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO usuarios (nome, email, persona_escolhida, senha_hash, criado_em, ultimo_acesso)
-        VALUES (%s, %s, %s, %s, %s, %s)
-        RETURNING id
-    """, (nome, email, persona, senha_hash, datetime.now(), datetime.now()))
-    usuario_id = cursor.fetchone()[0]
-    conn.commit()
-    conn.close()
+    with pool_banco.conexao() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO usuarios (nome, email, persona_escolhida, senha_hash, criado_em, ultimo_acesso)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            RETURNING id
+        """, (nome, email, persona, senha_hash, datetime.now(), datetime.now()))
+        usuario_id = cursor.fetchone()[0]
+        conn.commit()
     return usuario_id
 
 def procurarUsuarioPorEmail(usuarioEmail):
-    conn = psycopg2.connect(DB_URL)
-    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cursor.execute("SELECT * FROM usuarios WHERE email = %s", (usuarioEmail,))
-    result = cursor.fetchone()
-    conn.close()
+    with pool_banco.conexao() as conn:
+        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cursor.execute("SELECT * FROM usuarios WHERE email = %s", (usuarioEmail,))
+        result = cursor.fetchone()
     return dict(result) if result else None
 
 def salvar_token_redefinicao(email, token, expiracao):
-    conn = psycopg2.connect(DB_URL)
-    cursor = conn.cursor()
-    cursor.execute("""
-        UPDATE usuarios
-        SET token_redefinicao_senha = %s, token_redefinicao_expiracao = %s
-        WHERE email = %s
-    """, (token, expiracao, email))
-    conn.commit()
-    conn.close()
+    with pool_banco.conexao() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE usuarios
+            SET token_redefinicao_senha = %s, token_redefinicao_expiracao = %s
+            WHERE email = %s
+        """, (token, expiracao, email))
+        conn.commit()
+
+# As consultas quentes ficam em constantes: banco/migracoes.py faz EXPLAIN do mesmo texto
+SQL_USUARIO_POR_TOKEN = "SELECT * FROM usuarios WHERE token_redefinicao_senha = %s"
 
 def procurarUsuarioPorToken(token):
-    conn = psycopg2.connect(DB_URL)
-    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cursor.execute("SELECT * FROM usuarios WHERE token_redefinicao_senha = %s", (token,))
-    result = cursor.fetchone()
-    conn.close()
+    with pool_banco.conexao() as conn:
+        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cursor.execute(SQL_USUARIO_POR_TOKEN, (token,))
+        result = cursor.fetchone()
     return dict(result) if result else None
 
 def atualizar_senha(token, nova_senha_hash):
-    conn = psycopg2.connect(DB_URL)
-    cursor = conn.cursor()
-    cursor.execute("""
-        UPDATE usuarios
-        SET senha_hash = %s, token_redefinicao_senha = NULL, token_redefinicao_expiracao = NULL
-        WHERE token_redefinicao_senha = %s
-    """, (nova_senha_hash, token))
-    conn.commit()
-    conn.close()
-
-def carregar_conversas(usuario_email, limite_conversas=15):
-    conn = psycopg2.connect(DB_URL)
-    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cursor.execute("""
-        SELECT c.id AS conversa_id,
-        ur.conteudo AS pergunta,
-        ar.conteudo AS resposta
-        FROM mensagens m
-        JOIN user_requests ur ON m.request_id = ur.id
-        JOIN ai_responses ar ON m.response_id = ar.id
-        JOIN conversas c ON m.conversa_id = c.id
-        JOIN usuarios u ON c.usuario_id = u.id
-        WHERE u.email = %s
-        ORDER BY c.iniciado_em DESC, m.criado_em ASC
-    """, (usuario_email,))
-    
-    results = cursor.fetchall()
-    conn.close()
+    with pool_banco.conexao() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE usuarios
+            SET senha_hash = %s, token_redefinicao_senha = NULL, token_redefinicao_expiracao = NULL
+            WHERE token_redefinicao_senha = %s
+        """, (nova_senha_hash, token))
+        conn.commit()
+
+SQL_CONVERSAS_DO_USUARIO = """
+    SELECT c.id
+    FROM conversas c
+    JOIN usuarios u ON c.usuario_id = u.id
+    WHERE u.email = %(email)s
+      AND EXISTS (SELECT 1 FROM mensagens m WHERE m.conversa_id = c.id)
+      AND (%(antes)s::integer IS NULL
+           OR (c.iniciado_em, c.id) < (SELECT iniciado_em, id FROM conversas WHERE id = %(antes)s::integer))
+    ORDER BY c.iniciado_em DESC, c.id DESC
+    LIMIT %(limite)s
+"""
+
+SQL_TURNOS_DAS_CONVERSAS = """
+    SELECT m.conversa_id,
+           ur.conteudo AS pergunta,
+           ar.conteudo AS resposta
+    FROM mensagens m
+    JOIN user_requests ur ON m.request_id = ur.id
+    JOIN ai_responses ar ON m.response_id = ar.id
+    WHERE m.conversa_id = ANY(%s)
+    ORDER BY m.conversa_id, m.criado_em ASC, m.id ASC
+"""
+
+def carregar_conversas(usuario_email, limite_conversas=15, antes=None):
+    """Página de conversas (com turnos), mais recentes primeiro.
+
+    antes é o conversa_id do último item da página anterior (paginação por
+    chave): o limite é aplicado em `conversas` e só os turnos da página são lidos.
+    """
+    with pool_banco.conexao() as conn:
+        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cursor.execute(SQL_CONVERSAS_DO_USUARIO, {"email": usuario_email, "antes": antes, "limite": limite_conversas})
+        ids = [row["id"] for row in cursor.fetchall()]
+        if not ids:
+            return []
+
+        cursor.execute(SQL_TURNOS_DAS_CONVERSAS, (ids,))
+        results = cursor.fetchall()
 
-    conversas = {}
+    conversas = {cid: [] for cid in ids}
     for row in results:
-        cid = row["conversa_id"]
-        if cid not in conversas:
-            conversas[cid] = []
-        conversas[cid].append({"pergunta": row["pergunta"], "resposta": row["resposta"]})
-
-    sorted_conversas = sorted(conversas.items(), key=lambda x: x[0], reverse=True)[:limite_conversas]
-
-    return [{"conversa_id": cid, "mensagens": msgs} for cid, msgs in sorted_conversas]
-
-def carregar_mensagens_por_conversa_id(conversa_id):
-    conn = psycopg2.connect(DB_URL)
-    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cursor.execute("""
-        SELECT ur.conteudo AS pergunta,
-               ar.conteudo AS resposta
-        FROM mensagens m
-        JOIN user_requests ur ON m.request_id = ur.id
-        JOIN ai_responses ar ON m.response_id = ar.id
-        WHERE m.conversa_id = %s
-        ORDER BY m.criado_em ASC
-    """, (conversa_id,))
-    
-    results = cursor.fetchall()
-    conn.close()
+        conversas[row["conversa_id"]].append({"pergunta": row["pergunta"], "resposta": row["resposta"]})
+
+    return [{"conversa_id": cid, "mensagens": msgs} for cid, msgs in conversas.items()]
+
+def carregar_mensagens_por_conversa_id(conversa_id, a_partir_de=0):
+    """Turnos da conversa em ordem; a_partir_de pula os primeiros (ex.: os já resumidos)."""
+    with pool_banco.conexao() as conn:
+        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cursor.execute("""
+            SELECT ur.conteudo AS pergunta,
+                   ar.conteudo AS resposta
+            FROM mensagens m
+            JOIN user_requests ur ON m.request_id = ur.id
+            JOIN ai_responses ar ON m.response_id = ar.id
+            WHERE m.conversa_id = %s
+            ORDER BY m.criado_em ASC, m.id ASC
+            OFFSET %s
+        """, (conversa_id, a_partir_de))
+
+        results = cursor.fetchall()
     
     return [{"pergunta": row["pergunta"], "resposta": row["resposta"]} for row in results]
 
+def carregar_resumo_conversa(conversa_id):
+    """(resumo, turnos_resumidos) da conversa; (None, 0) se ainda não há resumo."""
+    with pool_banco.conexao() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT resumo, turnos_resumidos FROM conversas WHERE id = %s", (conversa_id,))
+        result = cursor.fetchone()
+    return (result[0], result[1]) if result else (None, 0)
+
+def salvar_resumo_conversa(conversa_id, resumo, turnos_resumidos, turnos_resumidos_anterior):
+    """Grava o resumo só se ninguém o atualizou desde a leitura; devolve se gravou."""
+    with pool_banco.conexao() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE conversas
+            SET resumo = %s, turnos_resumidos = %s, resumo_atualizado_em = %s
+            WHERE id = %s AND turnos_resumidos = %s
+        """, (resumo, turnos_resumidos, datetime.now(), conversa_id, turnos_resumidos_anterior))
+        gravou = cursor.rowcount == 1
+        conn.commit()
+    return gravou
+
 def criar_nova_conversa(usuario_email):
-    conn = psycopg2.connect(DB_URL)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT id FROM usuarios WHERE email = %s
-    """, (usuario_email,))
-    
-    usuario_result = cursor.fetchone()
-    if not usuario_result:
-        conn.close()
-        raise Exception(f"Usuário com email {usuario_email} não encontrado")
-    
-    usuario_id = usuario_result[0]
-    
-    cursor.execute("""
-        INSERT INTO conversas (usuario_id, iniciado_em, atualizado_em)
-        VALUES (%s, %s, %s)
-        RETURNING id
-    """, (usuario_id, datetime.now(), datetime.now()))
-    
-    conversa_id = cursor.fetchone()[0]
-    
-    conn.commit()
-    conn.close()
+    with pool_banco.conexao() as conn:
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            SELECT id FROM usuarios WHERE email = %s
+        """, (usuario_email,))
+
+        usuario_result = cursor.fetchone()
+        if not usuario_result:
+            raise Exception(f"Usuário com email {usuario_email} não encontrado")
+
+        usuario_id = usuario_result[0]
+
+        cursor.execute("""
+            INSERT INTO conversas (usuario_id, iniciado_em, atualizado_em)
+            VALUES (%s, %s, %s)
+            RETURNING id
+        """, (usuario_id, datetime.now(), datetime.now()))
+
+        conversa_id = cursor.fetchone()[0]
+
+        conn.commit()
     
     print(f"✅ Nova conversa criada com ID {conversa_id} para usuário {usuario_email}")
     return conversa_id
 
 def carregar_memorias(usuario_email, limite=20):
     try:
-        conn = psycopg2.connect(DB_URL)
-        conn.autocommit = True
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        cursor.execute("""
-            SELECT ur.conteudo AS usuario_disse,
-                ar.conteudo AS ia_respondeu,
-                m.criado_em AS quando
-            FROM mensagens m
-            JOIN user_requests ur ON m.request_id = ur.id
-            JOIN ai_responses ar ON m.response_id = ar.id
-            JOIN conversas c ON m.conversa_id = c.id
-            JOIN usuarios u ON c.usuario_id = u.id
-            WHERE u.email = %s  -- ✅ CORRIGIDO
-            ORDER BY m.criado_em DESC
-            LIMIT %s
-        """, (usuario_email, limite))
-        results = cursor.fetchall()
-        conn.close()
+        with pool_banco.conexao() as conn:
+            cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            cursor.execute("""
+                SELECT ur.conteudo AS usuario_disse,
+                    ar.conteudo AS ia_respondeu,
+                    m.criado_em AS quando
+                FROM mensagens m
+                JOIN user_requests ur ON m.request_id = ur.id
+                JOIN ai_responses ar ON m.response_id = ar.id
+                JOIN conversas c ON m.conversa_id = c.id
+                JOIN usuarios u ON c.usuario_id = u.id
+                WHERE u.email = %s  -- ✅ CORRIGIDO
+                ORDER BY m.criado_em DESC
+                LIMIT %s
+            """, (usuario_email, limite))
+            results = cursor.fetchall()
         memorias = []
         for row in results:
             memorias.append(f"Usuário: {row['usuario_disse']}")
@@ -272,103 +228,211 @@ def carregar_memorias(usuario_email, limite=20):
         return []
 
 
-def pegarHistorico(usuario_email, limite=3):
-    try:
-        conn = psycopg2.connect(DB_URL)
+def carregar_primeiras_perguntas(limite=5000):
+    """Primeira pergunta de cada usuário, respondida por um provedor real; base do índice de reaproveitamento.
+
+    Só o primeiro turno do usuário conta: a partir dele o prompt leva as
+    memórias do usuário (turnos anteriores) e a resposta fica pessoal. A
+    persona é a gravada com a resposta (ai_responses.persona), não a escolhida
+    hoje pelo usuário; respostas anteriores a essa coluna ficam de fora.
+    """
+    with pool_banco.conexao() as conn:
         cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
         cursor.execute("""
-            SELECT m.id AS id_historico,
-                ur.conteudo AS pergunta,
-                ar.conteudo AS resposta,
-                m.criado_em AS timestamp
-            FROM mensagens m
-            JOIN user_requests ur ON m.request_id = ur.id
-            JOIN ai_responses ar ON m.response_id = ar.id
-            JOIN conversas c ON m.conversa_id = c.id
-            JOIN usuarios u ON c.usuario_id = u.id
-            WHERE u.email = %s  -- ✅ CORRIGIDO
-            ORDER BY m.criado_em DESC
+            SELECT persona, pergunta, resposta FROM (
+                SELECT DISTINCT ON (c.usuario_id)
+                    ar.persona,
+                    ar.provedor,
+                    ur.conteudo AS pergunta,
+                    ar.conteudo AS resposta,
+                    m.criado_em
+                FROM mensagens m
+                JOIN user_requests ur ON m.request_id = ur.id
+                JOIN ai_responses ar ON m.response_id = ar.id
+                JOIN conversas c ON m.conversa_id = c.id
+                ORDER BY c.usuario_id, m.criado_em ASC, m.id ASC
+            ) primeiras
+            WHERE persona IS NOT NULL
+              AND provedor NOT IN ('offline', 'cache', 'reuso')
+            ORDER BY criado_em DESC
             LIMIT %s
-        """, (usuario_email, limite))
+        """, (limite,))
         results = cursor.fetchall()
-        conn.close()
+    return [dict(row) for row in results]
+
+SQL_HISTORICO_DO_USUARIO = """
+    SELECT m.id AS id_historico,
+        ur.conteudo AS pergunta,
+        ar.conteudo AS resposta,
+        m.criado_em AS timestamp
+    FROM mensagens m
+    JOIN user_requests ur ON m.request_id = ur.id
+    JOIN ai_responses ar ON m.response_id = ar.id
+    JOIN conversas c ON m.conversa_id = c.id
+    JOIN usuarios u ON c.usuario_id = u.id
+    WHERE u.email = %(email)s
+      AND (%(antes)s::integer IS NULL
+           OR (m.criado_em, m.id) < (SELECT criado_em, id FROM mensagens WHERE id = %(antes)s::integer))
+    ORDER BY m.criado_em DESC, m.id DESC
+    LIMIT %(limite)s
+"""
+
+def pegarHistorico(usuario_email, limite=3, antes=None):
+    """Turnos mais recentes do usuário; antes é o id_historico do último item da página anterior."""
+    try:
+        with pool_banco.conexao() as conn:
+            cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            cursor.execute(SQL_HISTORICO_DO_USUARIO, {"email": usuario_email, "antes": antes, "limite": limite})
+            results = cursor.fetchall()
         return [dict(row) for row in results]
     except Exception as e:
         print(f"⚠️ Erro ao carregar histórico: {e}")
         return []
     
-def salvarMensagem(usuario_email, pergunta, resposta, modelo_usado=None, tokens=None, conversa_id=None):
-    conn = psycopg2.connect(DB_URL)
-    cursor = conn.cursor()
-
-    cursor.execute("""
-        SELECT id FROM usuarios WHERE email = %s
-    """, (usuario_email,))
-    
-    usuario_result = cursor.fetchone()
-    if not usuario_result:
-        conn.close()
-        raise Exception(f"Usuário com email {usuario_email} não encontrado")
-    
-    usuario_id = usuario_result[0]
+def arredondar_ms(valor):
+    return int(round(valor)) if valor is not None else None
+
+def dados_uso(resultado=None, modelo_usado=None, tokens=None):
+    """Colunas de uso de ai_responses; resultado (ResultadoLLM) preenche modelo, provedor, tokens e tempos."""
+    uso = {
+        "modelo_usado": modelo_usado,
+        "tokens": tokens,
+        "provedor": None,
+        "tokens_prompt": None,
+        "tokens_resposta": None,
+        "tokens_estimados": False,
+        "latencia_ms": None,
+        "tempo_primeiro_token_ms": None,
+    }
+    if resultado is not None:
+        uso.update(
+            modelo_usado=resultado.modelo or resultado.provedor,
+            tokens=resultado.tokens_total,
+            provedor=resultado.provedor,
+            tokens_prompt=resultado.tokens_prompt,
+            tokens_resposta=resultado.tokens_resposta,
+            tokens_estimados=resultado.tokens_estimados,
+            latencia_ms=arredondar_ms(resultado.latencia_ms),
+            tempo_primeiro_token_ms=arredondar_ms(resultado.tempo_primeiro_token_ms),
+        )
+    return uso
+
+SQL_ULTIMA_CONVERSA = "SELECT id FROM conversas WHERE usuario_id = %s ORDER BY iniciado_em DESC LIMIT 1"
+
+def salvarMensagem(usuario_email, pergunta, resposta, modelo_usado=None, tokens=None, conversa_id=None,
+                   resultado=None, persona=None):
+    """resultado (ResultadoLLM) preenche as colunas de uso da resposta (ver dados_uso)."""
+    uso = dados_uso(resultado, modelo_usado, tokens)
+
+    with pool_banco.conexao() as conn:
+        cursor = conn.cursor()
 
-    if conversa_id:
         cursor.execute("""
-            SELECT id FROM conversas WHERE id = %s AND usuario_id = %s
-        """, (conversa_id, usuario_id))
-        conversa = cursor.fetchone()
-        if not conversa:
-            conn.close()
-            raise Exception(f"Conversa {conversa_id} não encontrada para este usuário")
-        conversa_id = conversa[0]
-    else:
-        cursor.execute("""
-            SELECT id FROM conversas 
-            WHERE usuario_id = %s
-            ORDER BY iniciado_em DESC LIMIT 1
-        """, (usuario_id,))
-        
-        conversa = cursor.fetchone()
-        if conversa:
+            SELECT id FROM usuarios WHERE email = %s
+        """, (usuario_email,))
+
+        usuario_result = cursor.fetchone()
+        if not usuario_result:
+            raise Exception(f"Usuário com email {usuario_email} não encontrado")
+
+        usuario_id = usuario_result[0]
+
+        if conversa_id:
+            cursor.execute("""
+                SELECT id FROM conversas WHERE id = %s AND usuario_id = %s
+            """, (conversa_id, usuario_id))
+            conversa = cursor.fetchone()
+            if not conversa:
+                raise Exception(f"Conversa {conversa_id} não encontrada para este usuário")
             conversa_id = conversa[0]
         else:
-            cursor.execute("""
-                INSERT INTO conversas (usuario_id) VALUES (%s)
-                RETURNING id
-            """, (usuario_id,))
-            conversa_id = cursor.fetchone()[0]
-
-    cursor.execute("""
-        INSERT INTO user_requests (usuario_id, conversa_id, conteudo)
-        VALUES (%s, %s, %s)
-        RETURNING id
-    """, (usuario_id, conversa_id, pergunta))
-    request_id = cursor.fetchone()[0]
-
-    cursor.execute("""
-        INSERT INTO ai_responses (request_id, conteudo, modelo_usado, tokens)
-        VALUES (%s, %s, %s, %s)
-        RETURNING id
-    """, (request_id, resposta, modelo_usado, tokens))
-    response_id = cursor.fetchone()[0]
-
-    cursor.execute("""
-        INSERT INTO mensagens (conversa_id, request_id, response_id)
-        VALUES (%s, %s, %s)
-    """, (conversa_id, request_id, response_id))
-
-    cursor.execute("""
-        INSERT INTO memorias (usuario_id, chave, valor, tipo, conversa_origem)
-        VALUES (%s, %s, %s, 'conversa', %s)
-    """, (usuario_id, f"pergunta_{request_id}", pergunta, conversa_id))
-
-    cursor.execute("""
-        INSERT INTO memorias (usuario_id, chave, valor, tipo, conversa_origem)
-        VALUES (%s, %s, %s, 'conversa', %s)
-    """, (usuario_id, f"resposta_{response_id}", resposta, conversa_id))
-
-    conn.commit()
-    conn.close()
+            cursor.execute(SQL_ULTIMA_CONVERSA, (usuario_id,))
+
+            conversa = cursor.fetchone()
+            if conversa:
+                conversa_id = conversa[0]
+            else:
+                cursor.execute("""
+                    INSERT INTO conversas (usuario_id) VALUES (%s)
+                    RETURNING id
+                """, (usuario_id,))
+                conversa_id = cursor.fetchone()[0]
+
+        cursor.execute("""
+            INSERT INTO user_requests (usuario_id, conversa_id, conteudo)
+            VALUES (%s, %s, %s)
+            RETURNING id
+        """, (usuario_id, conversa_id, pergunta))
+        request_id = cursor.fetchone()[0]
+
+        cursor.execute("""
+            INSERT INTO ai_responses (
+                request_id, conteudo, modelo_usado, tokens, provedor, persona,
+                tokens_prompt, tokens_resposta, tokens_estimados, latencia_ms, tempo_primeiro_token_ms
+            )
+            VALUES (
+                %(request_id)s, %(conteudo)s, %(modelo_usado)s, %(tokens)s, %(provedor)s, %(persona)s,
+                %(tokens_prompt)s, %(tokens_resposta)s, %(tokens_estimados)s, %(latencia_ms)s, %(tempo_primeiro_token_ms)s
+            )
+            RETURNING id
+        """, dict(uso, request_id=request_id, conteudo=resposta, persona=persona))
+        response_id = cursor.fetchone()[0]
+
+        cursor.execute("""
+            INSERT INTO mensagens (conversa_id, request_id, response_id)
+            VALUES (%s, %s, %s)
+        """, (conversa_id, request_id, response_id))
+
+        cursor.execute("""
+            INSERT INTO memorias (usuario_id, chave, valor, tipo, conversa_origem)
+            VALUES (%s, %s, %s, 'conversa', %s)
+        """, (usuario_id, f"pergunta_{request_id}", pergunta, conversa_id))
+
+        cursor.execute("""
+            INSERT INTO memorias (usuario_id, chave, valor, tipo, conversa_origem)
+            VALUES (%s, %s, %s, 'conversa', %s)
+        """, (usuario_id, f"resposta_{response_id}", resposta, conversa_id))
+
+        conn.commit()
+    cauda_conversas.anexar(conversa_id, pergunta, resposta)
     print(f"✅ Mensagem salva para usuário {usuario_email} na conversa {conversa_id}")
     
-    return conversa_id 
\ No newline at end of file
+    return conversa_id 
+
+# Agrupamentos aceitos por agregar_uso (a expressão SQL nunca vem da requisição)
+AGRUPAMENTOS_USO = {
+    # Pelo id: o email não sai no relatório
+    "usuario": "ur.usuario_id",
+    "persona": "COALESCE(ar.persona, u.persona_escolhida)",
+    "dia": "to_char(date_trunc('day', ar.criado_em), 'YYYY-MM-DD')",
+    "provedor": "COALESCE(ar.provedor, ar.modelo_usado)",
+}
+
+def agregar_uso(agrupar="persona", dias=30, limite=100):
+    """Tokens e latência das respostas dos últimos `dias`, somados por usuário, persona, dia ou provedor."""
+    if agrupar not in AGRUPAMENTOS_USO:
+        raise ValueError(f"Agrupamento inválido: {agrupar}. Use um de {sorted(AGRUPAMENTOS_USO)}")
+    ordem = "chave DESC" if agrupar == "dia" else "tokens DESC"
+
+    with pool_banco.conexao() as conn:
+        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cursor.execute(f"""
+            SELECT {AGRUPAMENTOS_USO[agrupar]} AS chave,
+                   COUNT(*) AS respostas,
+                   COALESCE(SUM(ar.tokens_prompt), 0) AS tokens_prompt,
+                   COALESCE(SUM(ar.tokens_resposta), 0) AS tokens_resposta,
+                   COALESCE(SUM(ar.tokens), 0) AS tokens,
+                   COUNT(*) FILTER (WHERE ar.tokens_estimados) AS respostas_com_tokens_estimados,
+                   AVG(ar.latencia_ms)::float AS latencia_media_ms,
+                   percentile_cont(0.95) WITHIN GROUP (ORDER BY ar.latencia_ms) AS latencia_p95_ms,
+                   AVG(ar.tempo_primeiro_token_ms)::float AS tempo_primeiro_token_medio_ms
+            FROM ai_responses ar
+            JOIN user_requests ur ON ar.request_id = ur.id
+            JOIN usuarios u ON ur.usuario_id = u.id
+            WHERE ar.criado_em >= NOW() - %s * INTERVAL '1 day'
+            GROUP BY 1
+            ORDER BY {ordem}
+            LIMIT %s
+        """, (dias, limite))
+        results = cursor.fetchall()
+    return [dict(row) for row in results]
@@ -0,0 +1,384 @@
+"""Migrações versionadas do schema, aplicadas no boot por criar_banco().
+
+Cada migração roda uma única vez, na sua própria transação, e fica registrada
+em schema_migracoes. Um advisory lock impede que duas instâncias subindo ao
+mesmo tempo apliquem a mesma versão. Mudança de schema nova entra como uma
+migração nova no fim de MIGRACOES; as já aplicadas nunca são editadas.
+
+As migrações 1 a 3 são o schema que criar_banco montava antes (com IF NOT
+EXISTS), então bancos já existentes passam por elas sem mudança.
+
+Migrações em SEM_TRANSACAO (índices em tabelas que já têm dados) usam CREATE
+INDEX CONCURRENTLY, que não bloqueia escritas mas não roda dentro de
+transação: elas rodam em autocommit, comando a comando, sob o advisory lock de
+sessão (que disputa a mesma chave com o lock das outras migrações).
+
+Verificação dos planos das consultas quentes, num banco de teste. Sai com
+código 1 se algum plano não usa o índice esperado ou faz Seq Scan:
+    BANCO_API=postgresql://postgres@localhost/lyria_teste python -m banco.migracoes
+"""
+import json
+import os
+import re
+import sys
+import uuid
+from datetime import datetime
+
+# Chave do advisory lock das migrações (qualquer bigint fixo)
+CHAVE_LOCK = 7314_0001
+
+# Versões aplicadas fora de transação (CREATE INDEX CONCURRENTLY)
+SEM_TRANSACAO = {4}
+
+_INDICE_CONCORRENTE = re.compile(r"CREATE INDEX CONCURRENTLY IF NOT EXISTS (\w+)")
+
+MIGRACOES = [
+    (1, "tabelas iniciais", """
+    CREATE TABLE IF NOT EXISTS usuarios (
+        id SERIAL PRIMARY KEY,
+        nome TEXT NOT NULL,
+        email TEXT NOT NULL UNIQUE,
+        senha_hash TEXT,
+        persona_escolhida TEXT,
+        criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        ultimo_acesso TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        token_redefinicao_senha TEXT,
+        token_redefinicao_expiracao TIMESTAMP
+    );
+
+    CREATE TABLE IF NOT EXISTS conversas (
+        id SERIAL PRIMARY KEY,
+        usuario_id INTEGER NOT NULL,
+        mensagens TEXT,
+        iniciado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        status TEXT,
+        FOREIGN KEY (usuario_id) REFERENCES usuarios(id) ON DELETE CASCADE
+    );
+
+    CREATE TABLE IF NOT EXISTS user_requests (
+        id SERIAL PRIMARY KEY,
+        usuario_id INTEGER NOT NULL,
+        conversa_id INTEGER NOT NULL,
+        conteudo TEXT NOT NULL,
+        criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (usuario_id) REFERENCES usuarios(id) ON DELETE CASCADE,
+        FOREIGN KEY (conversa_id) REFERENCES conversas(id) ON DELETE CASCADE
+    );
+
+    CREATE TABLE IF NOT EXISTS ai_responses (
+        id SERIAL PRIMARY KEY,
+        request_id INTEGER NOT NULL,
+        conteudo TEXT NOT NULL,
+        criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        modelo_usado TEXT,
+        tokens INTEGER,
+        FOREIGN KEY (request_id) REFERENCES user_requests(id) ON DELETE CASCADE
+    );
+
+    CREATE TABLE IF NOT EXISTS mensagens (
+        id SERIAL PRIMARY KEY,
+        conversa_id INTEGER NOT NULL,
+        request_id INTEGER NOT NULL,
+        response_id INTEGER NOT NULL,
+        criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (conversa_id) REFERENCES conversas(id) ON DELETE CASCADE,
+        FOREIGN KEY (request_id) REFERENCES user_requests(id) ON DELETE CASCADE,
+        FOREIGN KEY (response_id) REFERENCES ai_responses(id) ON DELETE CASCADE
+    );
+
+    CREATE TABLE IF NOT EXISTS memorias (
+        id SERIAL PRIMARY KEY,
+        usuario_id INTEGER NOT NULL,
+        chave TEXT NOT NULL,
+        valor TEXT NOT NULL,
+        tipo TEXT,
+        relevancia INTEGER DEFAULT 0,
+        conversa_origem INTEGER,
+        criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        expira_em TIMESTAMP,
+        FOREIGN KEY (usuario_id) REFERENCES usuarios(id) ON DELETE CASCADE,
+        FOREIGN KEY (conversa_origem) REFERENCES conversas(id) ON DELETE CASCADE
+    );
+    """),
+
+    # Resumo incremental das conversas longas (conversas/resumo.py)
+    (2, "resumo das conversas", """
+    ALTER TABLE conversas
+        ADD COLUMN IF NOT EXISTS resumo TEXT,
+        ADD COLUMN IF NOT EXISTS turnos_resumidos INTEGER NOT NULL DEFAULT 0,
+        ADD COLUMN IF NOT EXISTS resumo_atualizado_em TIMESTAMP;
+    """),
+
+    # Uso real de cada resposta: provedor, tokens (do `usage` da API) e tempos
+    (3, "uso das respostas", """
+    ALTER TABLE ai_responses
+        ADD COLUMN IF NOT EXISTS provedor TEXT,
+        ADD COLUMN IF NOT EXISTS persona TEXT,
+        ADD COLUMN IF NOT EXISTS tokens_prompt INTEGER,
+        ADD COLUMN IF NOT EXISTS tokens_resposta INTEGER,
+        ADD COLUMN IF NOT EXISTS tokens_estimados BOOLEAN NOT NULL DEFAULT FALSE,
+        ADD COLUMN IF NOT EXISTS latencia_ms INTEGER,
+        ADD COLUMN IF NOT EXISTS tempo_primeiro_token_ms INTEGER;
+    """),
+
+    # Postgres não indexa FKs sozinho: sem estes índices o histórico e cada ON DELETE CASCADE varrem a tabela.
+    # CONCURRENTLY: em produção as tabelas já têm dados e um CREATE INDEX comum travaria as escritas
+    (4, "índices das consultas quentes", """
+    -- Turnos de uma conversa em ordem (histórico do prompt, resumo, listagem)
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_mensagens_conversa_criado ON mensagens (conversa_id, criado_em, id);
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_mensagens_request ON mensagens (request_id);
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_mensagens_response ON mensagens (response_id);
+    -- Conversas de um usuário, mais recentes primeiro
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_conversas_usuario_iniciado ON conversas (usuario_id, iniciado_em);
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_user_requests_usuario ON user_requests (usuario_id);
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_user_requests_conversa ON user_requests (conversa_id);
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_ai_responses_request ON ai_responses (request_id);
+    -- Janela de dias de agregar_uso
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_ai_responses_criado ON ai_responses (criado_em);
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_memorias_usuario ON memorias (usuario_id);
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_memorias_conversa ON memorias (conversa_origem);
+    -- Só quem pediu redefinição de senha tem token: índice parcial e pequeno
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_usuarios_token_redefinicao ON usuarios (token_redefinicao_senha)
+        WHERE token_redefinicao_senha IS NOT NULL;
+    """),
+]
+
+def aplicar_migracoes(pool):
+    """Aplica as migrações pendentes; devolve as versões aplicadas agora."""
+    with pool.conexao() as conn:
+        cursor = conn.cursor()
+        # Dois CREATE TABLE IF NOT EXISTS simultâneos podem colidir no catálogo: a criação também fica sob o lock
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", (CHAVE_LOCK,))
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migracoes (
+            versao INTEGER PRIMARY KEY,
+            nome TEXT NOT NULL,
+            aplicada_em TIMESTAMP NOT NULL
+        );
+        """)
+        conn.commit()
+
+        aplicadas = []
+        for versao, nome, sql in MIGRACOES:
+            if versao in SEM_TRANSACAO:
+                if _aplicar_sem_transacao(conn, versao, nome, sql):
+                    aplicadas.append(versao)
+                continue
+            # O lock vale até o commit: outra instância espera e depois vê a versão já registrada
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", (CHAVE_LOCK,))
+            cursor.execute("SELECT 1 FROM schema_migracoes WHERE versao = %s", (versao,))
+            if cursor.fetchone():
+                conn.rollback()
+                continue
+            cursor.execute(sql)
+            cursor.execute(
+                "INSERT INTO schema_migracoes (versao, nome, aplicada_em) VALUES (%s, %s, %s)",
+                (versao, nome, datetime.now()),
+            )
+            conn.commit()
+            aplicadas.append(versao)
+            print(f"🗄️ Migração {versao} aplicada: {nome}")
+        return aplicadas
+
+def _comandos(sql):
+    """Os comandos de uma migração, um a um (as de SEM_TRANSACAO não têm ';' dentro de strings)."""
+    for comando in sql.split(";"):
+        linhas = [linha for linha in comando.strip().splitlines() if not linha.strip().startswith("--")]
+        if linhas:
+            yield "\n".join(linhas)
+
+def _aplicar_sem_transacao(conn, versao, nome, sql):
+    cursor = conn.cursor()
+    conn.autocommit = True
+    try:
+        cursor.execute("SELECT pg_advisory_lock(%s)", (CHAVE_LOCK,))
+        try:
+            cursor.execute("SELECT 1 FROM schema_migracoes WHERE versao = %s", (versao,))
+            if cursor.fetchone():
+                return False
+            for comando in _comandos(sql):
+                indice = _INDICE_CONCORRENTE.search(comando)
+                if indice:
+                    # Um build concorrente interrompido deixa o índice inválido, e o IF NOT EXISTS o pularia
+                    cursor.execute("""
+                        SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                        WHERE c.relname = %s AND NOT i.indisvalid
+                    """, (indice.group(1),))
+                    if cursor.fetchone():
+                        cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {indice.group(1)}")
+                cursor.execute(comando)
+            cursor.execute(
+                "INSERT INTO schema_migracoes (versao, nome, aplicada_em) VALUES (%s, %s, %s)",
+                (versao, nome, datetime.now()),
+            )
+            print(f"🗄️ Migração {versao} aplicada (sem transação): {nome}")
+            return True
+        finally:
+            # Conexão caída já soltou o lock de sessão
+            if not conn.closed:
+                cursor.execute("SELECT pg_advisory_unlock(%s)", (CHAVE_LOCK,))
+    finally:
+        if not conn.closed:
+            conn.autocommit = False
+
+# Tamanho da semente do EXPLAIN: usuários x conversas x turnos (40 mil turnos). Muitos usuários com poucas
+# conversas: com uma tabela de usuários pequena o planejador varre em vez de usar o índice do email
+SEMENTE_USUARIOS = 2000
+SEMENTE_CONVERSAS = 4
+SEMENTE_TURNOS = 5
+
+SQL_SEMENTE = """
+INSERT INTO usuarios (nome, email, persona_escolhida)
+SELECT 'Plano ' || u, %(prefixo)s || u || '@lyria.local', 'professor'
+FROM generate_series(1, %(usuarios)s) u;
+
+INSERT INTO conversas (usuario_id, iniciado_em)
+SELECT u.id, NOW() - c * INTERVAL '1 day'
+FROM usuarios u, generate_series(1, %(conversas)s) c
+WHERE u.email LIKE %(prefixo)s || '%%';
+
+WITH pedidos AS (
+    INSERT INTO user_requests (usuario_id, conversa_id, conteudo, criado_em)
+    SELECT c.usuario_id, c.id, 'pergunta ' || t, c.iniciado_em + t * INTERVAL '1 minute'
+    FROM conversas c
+    JOIN usuarios u ON c.usuario_id = u.id, generate_series(1, %(turnos)s) t
+    WHERE u.email LIKE %(prefixo)s || '%%'
+    RETURNING id, usuario_id, conversa_id, criado_em
+), respostas AS (
+    INSERT INTO ai_responses (request_id, conteudo, criado_em, provedor, persona)
+    SELECT id, 'resposta', criado_em, 'groq', 'professor' FROM pedidos
+    RETURNING id, request_id
+), mensagem AS (
+    INSERT INTO mensagens (conversa_id, request_id, response_id, criado_em)
+    SELECT p.conversa_id, p.id, r.id, p.criado_em FROM pedidos p JOIN respostas r ON r.request_id = p.id
+)
+INSERT INTO memorias (usuario_id, chave, valor, tipo, conversa_origem)
+SELECT usuario_id, 'pergunta_' || id, 'pergunta', 'conversa', conversa_id FROM pedidos;
+
+ANALYZE usuarios, conversas, user_requests, ai_responses, mensagens, memorias;
+"""
+
+def consultas_quentes(cursor, prefixo):
+    """[(nome, SQL, parâmetros, índices esperados)] com o texto que o app executa e ids da semente."""
+    from banco.banco import (
+        SQL_CONVERSAS_DO_USUARIO, SQL_HISTORICO_DO_USUARIO, SQL_TURNOS_DAS_CONVERSAS,
+        SQL_ULTIMA_CONVERSA, SQL_USUARIO_POR_TOKEN
+    )
+    from conversas.historico import TURNOS_NO_PROMPT
+
+    email = f"{prefixo}{SEMENTE_USUARIOS // 2}@lyria.local"
+    cursor.execute("""
+        SELECT c.usuario_id, c.id FROM conversas c JOIN usuarios u ON c.usuario_id = u.id
+        WHERE u.email = %s ORDER BY c.iniciado_em DESC
+    """, (email,))
+    linhas = cursor.fetchall()
+    usuario_id = linhas[0][0]
+    conversas = [linha[1] for linha in linhas]
+    cursor.execute("SELECT id, request_id, response_id FROM mensagens WHERE conversa_id = %s LIMIT 1", (conversas[0],))
+    mensagem_id, request_id, response_id = cursor.fetchone()
+
+    pagina = {"email": email, "antes": None, "limite": 16}
+    return [
+        ("conversas do usuário (carregar_conversas)", SQL_CONVERSAS_DO_USUARIO, pagina,
+         {"usuarios_email_key", "idx_conversas_usuario_iniciado", "idx_mensagens_conversa_criado"}),
+        ("próxima página de conversas", SQL_CONVERSAS_DO_USUARIO, dict(pagina, antes=conversas[len(conversas) // 2]),
+         {"usuarios_email_key", "idx_conversas_usuario_iniciado", "idx_mensagens_conversa_criado"}),
+        ("turnos da página de conversas", SQL_TURNOS_DAS_CONVERSAS, (conversas,),
+         {"idx_mensagens_conversa_criado"}),
+        # Os comandos de banco/turno.py: EXPLAIN do EXECUTE, como a rota roda
+        ("cauda da conversa (lyria_cauda)", "EXECUTE lyria_cauda (%s, %s)", (conversas[0], TURNOS_NO_PROMPT),
+         {"idx_mensagens_conversa_criado"}),
+        ("memórias do usuário (lyria_memorias)", "EXECUTE lyria_memorias (%s, %s)", (usuario_id, 20),
+         {"idx_conversas_usuario_iniciado", "idx_mensagens_conversa_criado"}),
+        ("histórico do usuário (pegarHistorico)", SQL_HISTORICO_DO_USUARIO, {"email": email, "antes": None, "limite": 3},
+         {"usuarios_email_key", "idx_mensagens_conversa_criado"}),
+        ("próxima página do histórico", SQL_HISTORICO_DO_USUARIO, {"email": email, "antes": mensagem_id, "limite": 3},
+         {"usuarios_email_key", "idx_mensagens_conversa_criado"}),
+        ("última conversa do usuário", SQL_ULTIMA_CONVERSA, (usuario_id,),
+         {"idx_conversas_usuario_iniciado"}),
+        ("usuário pelo token de redefinição", SQL_USUARIO_POR_TOKEN, ("token",),
+         {"idx_usuarios_token_redefinicao"}),
+        # O que os ON DELETE CASCADE procuram ao apagar uma conversa ou um usuário
+        ("cascata: pedidos da conversa", "SELECT 1 FROM user_requests WHERE conversa_id = %s", (conversas[0],),
+         {"idx_user_requests_conversa"}),
+        ("cascata: pedidos do usuário", "SELECT 1 FROM user_requests WHERE usuario_id = %s", (usuario_id,),
+         {"idx_user_requests_usuario"}),
+        ("cascata: respostas do pedido", "SELECT 1 FROM ai_responses WHERE request_id = %s", (request_id,),
+         {"idx_ai_responses_request"}),
+        ("cascata: mensagens do pedido", "SELECT 1 FROM mensagens WHERE request_id = %s", (request_id,),
+         {"idx_mensagens_request"}),
+        ("cascata: mensagens da resposta", "SELECT 1 FROM mensagens WHERE response_id = %s", (response_id,),
+         {"idx_mensagens_response"}),
+        ("cascata: memórias do usuário", "SELECT 1 FROM memorias WHERE usuario_id = %s", (usuario_id,),
+         {"idx_memorias_usuario"}),
+        ("cascata: memórias da conversa", "SELECT 1 FROM memorias WHERE conversa_origem = %s", (conversas[0],),
+         {"idx_memorias_conversa"}),
+    ]
+
+def _percorrer_plano(no, indices, varridas):
+    if "Index Name" in no:
+        indices.add(no["Index Name"])
+    if no.get("Node Type") == "Seq Scan":
+        varridas.add(no["Relation Name"])
+    for filho in no.get("Plans", []):
+        _percorrer_plano(filho, indices, varridas)
+
+def verificar_planos(pool):
+    """EXPLAIN de cada consulta quente; devolve {consulta: (esperados, índices usados, tabelas varridas, ok)}.
+
+    O planejador fica nas configurações padrão; para ele escolher como em
+    produção, as tabelas recebem uma semente (SQL_SEMENTE) e ANALYZE antes. Tudo
+    roda numa transação desfeita no fim, então o banco não guarda a semente.
+    Use um banco de teste mesmo assim: a semente trava as tabelas enquanto roda.
+    """
+    from banco.turno import preparar
+
+    resultado = {}
+    with pool.conexao() as conn:
+        # PREPARE não é desfeito pelo rollback; a conexão volta ao pool já com os comandos preparados
+        for nome in ("lyria_cauda", "lyria_memorias"):
+            preparar(conn, nome)
+        cursor = conn.cursor()
+        prefixo = f"plano-{uuid.uuid4().hex[:8]}-"
+        cursor.execute(SQL_SEMENTE, {
+            "prefixo": prefixo, "usuarios": SEMENTE_USUARIOS,
+            "conversas": SEMENTE_CONVERSAS, "turnos": SEMENTE_TURNOS,
+        })
+        try:
+            for nome, sql, parametros, esperados in consultas_quentes(cursor, prefixo):
+                cursor.execute("EXPLAIN (FORMAT JSON) " + sql, parametros)
+                plano = cursor.fetchone()[0]
+                if isinstance(plano, str):
+                    plano = json.loads(plano)
+                indices, varridas = set(), set()
+                _percorrer_plano(plano[0]["Plan"], indices, varridas)
+                # Nenhuma consulta quente pode varrer tabela inteira, nem a de usuários
+                ok = esperados <= indices and not varridas
+                resultado[nome] = (sorted(esperados), sorted(indices), sorted(varridas), ok)
+        finally:
+            conn.rollback()
+    return resultado
+
+def checar_planos(pool):
+    """verificar_planos que falha: AssertionError listando os planos ruins."""
+    resultado = verificar_planos(pool)
+    for nome, (esperados, usados, varridas, ok) in resultado.items():
+        varredura = f", Seq Scan em {varridas}" if varridas else ""
+        print(f"{'✅' if ok else '❌'} {nome}: espera {esperados}, plano usa {usados or 'nenhum índice'}{varredura}")
+    falhas = [nome for nome, (*_, ok) in resultado.items() if not ok]
+    assert not falhas, f"Planos sem o índice esperado ou com Seq Scan: {', '.join(falhas)}"
+
+if __name__ == "__main__":
+    if not os.getenv("BANCO_API"):
+        sys.exit("Defina BANCO_API apontando para um Postgres de teste")
+
+    from banco.banco import criar_banco, pool_banco
+
+    criar_banco()
+    try:
+        checar_planos(pool_banco)
+    except AssertionError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
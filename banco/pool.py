@@ -0,0 +1,253 @@
+"""Pool de conexões Postgres compartilhado entre as threads do servidor.
+
+Cada função de banco/banco.py pega uma conexão com `pool_banco.conexao()` em vez
+de abrir uma nova (handshake TCP + TLS + autenticação a cada consulta). Na
+retirada, conexões ociosas há mais de VERIFICAR_APOS segundos passam por um
+`SELECT 1`, e conexões mais velhas que VIDA_MAXIMA são trocadas por novas (o
+Postgres gerenciado derruba conexões antigas sem avisar). Com o pool cheio, a
+retirada espera até TIMEOUT segundos e então levanta PoolEsgotado.
+"""
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+
+POOL_MIN = int(os.getenv("BANCO_POOL_MIN", 1))
+POOL_MAX = int(os.getenv("BANCO_POOL_MAX", 10))
+TIMEOUT = float(os.getenv("BANCO_POOL_TIMEOUT", 5.0))
+VIDA_MAXIMA = float(os.getenv("BANCO_POOL_VIDA_MAXIMA", 1800))
+VERIFICAR_APOS = float(os.getenv("BANCO_POOL_VERIFICAR_APOS", 30))
+# Conexões além do mínimo ociosas por mais tempo que isso são fechadas
+OCIOSA_MAXIMA = float(os.getenv("BANCO_POOL_OCIOSA_MAXIMA", 300))
+
+class PoolEsgotado(Exception):
+    pass
+
+class ConexaoPreparada(psycopg2.extensions.connection):
+    """Conexão que lembra quais comandos já recebeu PREPARE (eles valem até a sessão fechar)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.preparadas = set()
+
+class _Conexao:
+    __slots__ = ("conn", "criada_em", "devolvida_em", "retirada_em")
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.criada_em = self.devolvida_em = self.retirada_em = time.monotonic()
+
+class PoolConexoes:
+    def __init__(self, dsn, minimo=POOL_MIN, maximo=POOL_MAX, timeout=TIMEOUT,
+                 vida_maxima=VIDA_MAXIMA, verificar_apos=VERIFICAR_APOS, ociosa_maxima=OCIOSA_MAXIMA):
+        self.dsn = dsn
+        self.minimo = minimo
+        self.maximo = maximo
+        self.timeout = timeout
+        self.vida_maxima = vida_maxima
+        self.verificar_apos = verificar_apos
+        self.ociosa_maxima = ociosa_maxima
+        self._cond = threading.Condition()
+        # Pilha: a conexão devolvida por último é a próxima a sair (mais chance de estar quente)
+        self._ociosas = deque()
+        # Conexões abertas ou sendo abertas, em uso ou ociosas
+        self._total = 0
+        self.em_uso = 0
+        self.pico_em_uso = 0
+        self.retiradas = 0
+        self.esperaram = 0
+        self.tempo_espera = 0.0
+        self.maior_espera = 0.0
+        self.timeouts = 0
+        self.criadas = 0
+        self.descartadas_saude = 0
+        self.descartadas_vida = 0
+        self.descartadas_ociosas = 0
+        self.tempo_em_uso = 0.0
+
+    def _abrir(self):
+        conn = psycopg2.connect(self.dsn, connection_factory=ConexaoPreparada)
+        with self._cond:
+            self.criadas += 1
+        return _Conexao(conn)
+
+    def _fechar(self, conexao):
+        try:
+            conexao.conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _saudavel(self, conexao, agora):
+        conn = conexao.conn
+        if conn.closed or conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        if agora - conexao.devolvida_em < self.verificar_apos:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _retirar(self):
+        inicio = time.monotonic()
+        prazo = inicio + self.timeout
+        with self._cond:
+            while not self._ociosas and self._total >= self.maximo:
+                restante = prazo - time.monotonic()
+                if restante <= 0:
+                    self.timeouts += 1
+                    raise PoolEsgotado(
+                        f"Pool do banco esgotado: {self.maximo} conexões em uso há {self.timeout:.1f}s"
+                    )
+                self._cond.wait(restante)
+            espera = time.monotonic() - inicio
+            self.retiradas += 1
+            self.tempo_espera += espera
+            self.maior_espera = max(self.maior_espera, espera)
+            if espera > 0.001:
+                self.esperaram += 1
+            self.em_uso += 1
+            self.pico_em_uso = max(self.pico_em_uso, self.em_uso)
+            conexao = self._ociosas.pop() if self._ociosas else None
+            if conexao is None:
+                self._total += 1
+
+        # Verificação e abertura ficam fora do lock: são idas ao servidor
+        try:
+            while conexao is not None:
+                agora = time.monotonic()
+                if agora - conexao.criada_em >= self.vida_maxima:
+                    motivo = "descartadas_vida"
+                elif not self._saudavel(conexao, agora):
+                    motivo = "descartadas_saude"
+                else:
+                    return conexao
+                self._fechar(conexao)
+                with self._cond:
+                    setattr(self, motivo, getattr(self, motivo) + 1)
+                    if not self._ociosas:
+                        # A vaga da descartada passa para a conexão nova
+                        break
+                    self._total -= 1
+                    conexao = self._ociosas.pop()
+            return self._abrir()
+        except BaseException:
+            with self._cond:
+                self._total -= 1
+                self.em_uso -= 1
+                self._cond.notify()
+            raise
+
+    def _devolver(self, conexao, quebrada):
+        conn = conexao.conn
+        if not quebrada and not conn.closed:
+            # Consultas de leitura deixam uma transação aberta: não volta "idle in transaction" ao pool
+            try:
+                if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                quebrada = True
+
+        agora = time.monotonic()
+        with self._cond:
+            self.em_uso -= 1
+            self.tempo_em_uso += agora - conexao.retirada_em
+            if quebrada or conn.closed:
+                self._total -= 1
+                descartar = [conexao]
+                self.descartadas_saude += 1
+            else:
+                conexao.devolvida_em = agora
+                self._ociosas.append(conexao)
+                descartar = self._podar(agora)
+            self._cond.notify()
+        for velha in descartar:
+            self._fechar(velha)
+
+    def _podar(self, agora):
+        # As mais antigas ficam no início da pilha; o mínimo nunca é fechado
+        podadas = []
+        while (self._total > self.minimo and self._ociosas
+               and agora - self._ociosas[0].devolvida_em > self.ociosa_maxima):
+            podadas.append(self._ociosas.popleft())
+            self._total -= 1
+            self.descartadas_ociosas += 1
+        return podadas
+
+    @contextmanager
+    def conexao(self):
+        """Conexão emprestada durante o bloco `with`.
+
+        Quem escreve faz o próprio commit; o que sobrar de transação aberta na
+        saída é desfeito. Exceção dentro do bloco desfaz a transação, e se a
+        conexão caiu ela é descartada em vez de voltar ao pool.
+        """
+        conexao = self._retirar()
+        conexao.retirada_em = time.monotonic()
+        quebrada = False
+        try:
+            yield conexao.conn
+        except BaseException as e:
+            quebrada = isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError))
+            if not quebrada and not conexao.conn.closed:
+                try:
+                    conexao.conn.rollback()
+                except psycopg2.Error:
+                    quebrada = True
+            raise
+        finally:
+            self._devolver(conexao, quebrada)
+
+    def aquecer(self):
+        """Abre as conexões mínimas antes da primeira requisição."""
+        with self._cond:
+            faltam = max(self.minimo - self._total, 0)
+            self._total += faltam
+        for _ in range(faltam):
+            try:
+                conexao = self._abrir()
+            except psycopg2.Error as e:
+                with self._cond:
+                    self._total -= 1
+                print(f"⚠️ Pool do banco: não foi possível abrir conexão: {e}")
+                continue
+            with self._cond:
+                self._ociosas.appendleft(conexao)
+                self._cond.notify()
+
+    def fechar(self):
+        with self._cond:
+            ociosas = list(self._ociosas)
+            self._ociosas.clear()
+            self._total -= len(ociosas)
+        for conexao in ociosas:
+            self._fechar(conexao)
+
+    def estatisticas(self):
+        with self._cond:
+            return {
+                "minimo": self.minimo,
+                "maximo": self.maximo,
+                "abertas": self._total,
+                "ociosas": len(self._ociosas),
+                "em_uso": self.em_uso,
+                "pico_em_uso": self.pico_em_uso,
+                "utilizacao": round(self.em_uso / self.maximo, 2),
+                "retiradas": self.retiradas,
+                "esperaram": self.esperaram,
+                "espera_media_ms": round(self.tempo_espera / max(self.retiradas, 1) * 1000, 2),
+                "maior_espera_ms": round(self.maior_espera * 1000, 1),
+                "uso_medio_ms": round(self.tempo_em_uso / max(self.retiradas, 1) * 1000, 2),
+                "timeouts": self.timeouts,
+                "criadas": self.criadas,
+                "descartadas_saude": self.descartadas_saude,
+                "descartadas_vida": self.descartadas_vida,
+                "descartadas_ociosas": self.descartadas_ociosas,
+            }
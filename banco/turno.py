@@ -0,0 +1,225 @@
+"""Unidade de trabalho de um turno de conversa logado.
+
+Um TurnoBanco pega uma conexão do pool no início da requisição e a devolve no
+fim. O usuário (id e persona) é resolvido uma única vez, e as consultas
+quentes passam por PREPARE uma vez por conexão e depois só por EXECUTE. O
+turno é gravado num único comando (pergunta, resposta, ligação na conversa e
+memórias) e confirmado num único commit.
+
+Idas ao banco num turno: usuário, conversa, cauda da conversa (só quando ela
+não está em conversas/historico.py), memórias, fim da leitura, gravação e
+commit. Antes eram cinco conexões novas e uns doze comandos.
+"""
+import threading
+
+import psycopg2.extras
+
+from banco.banco import cauda_conversas, dados_uso, pool_banco
+from conversas.historico import TURNOS_NO_PROMPT
+
+# nome -> (tipos dos parâmetros, SQL com $n)
+COMANDOS = {
+    "lyria_usuario": ("text", """
+        SELECT id, persona_escolhida FROM usuarios WHERE email = $1
+    """),
+    "lyria_conversa": ("integer, integer", """
+        SELECT resumo, turnos_resumidos FROM conversas WHERE id = $1 AND usuario_id = $2
+    """),
+    # Só a cauda da conversa, do fim para o começo; o total vem do índice de mensagens
+    "lyria_cauda": ("integer, integer", """
+        SELECT ur.conteudo AS pergunta,
+               ar.conteudo AS resposta,
+               (SELECT COUNT(*) FROM mensagens WHERE conversa_id = $1) AS total
+        FROM mensagens m
+        JOIN user_requests ur ON m.request_id = ur.id
+        JOIN ai_responses ar ON m.response_id = ar.id
+        WHERE m.conversa_id = $1
+        ORDER BY m.criado_em DESC, m.id DESC
+        LIMIT $2
+    """),
+    # Igual a carregar_memorias, mas pelo id já resolvido: sem o JOIN com usuarios
+    "lyria_memorias": ("integer, integer", """
+        SELECT ur.conteudo AS usuario_disse,
+               ar.conteudo AS ia_respondeu
+        FROM mensagens m
+        JOIN user_requests ur ON m.request_id = ur.id
+        JOIN ai_responses ar ON m.response_id = ar.id
+        JOIN conversas c ON m.conversa_id = c.id
+        WHERE c.usuario_id = $1
+        ORDER BY m.criado_em DESC
+        LIMIT $2
+    """),
+    # Os cinco INSERTs de salvarMensagem num comando só (CTEs que modificam dados)
+    "lyria_salvar_turno": (
+        "integer, integer, text, text, text, integer, text, text, integer, integer, boolean, integer, integer",
+        """
+        WITH pedido AS (
+            INSERT INTO user_requests (usuario_id, conversa_id, conteudo)
+            VALUES ($1, $2, $3)
+            RETURNING id
+        ), resposta AS (
+            INSERT INTO ai_responses (
+                request_id, conteudo, modelo_usado, tokens, provedor, persona,
+                tokens_prompt, tokens_resposta, tokens_estimados, latencia_ms, tempo_primeiro_token_ms
+            )
+            SELECT pedido.id, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13 FROM pedido
+            RETURNING id, request_id
+        ), mensagem AS (
+            INSERT INTO mensagens (conversa_id, request_id, response_id)
+            SELECT $2, resposta.request_id, resposta.id FROM resposta
+            RETURNING conversa_id
+        ), memoria AS (
+            INSERT INTO memorias (usuario_id, chave, valor, tipo, conversa_origem)
+            SELECT $1, 'pergunta_' || resposta.request_id, $3, 'conversa', $2 FROM resposta
+            UNION ALL
+            SELECT $1, 'resposta_' || resposta.id, $4, 'conversa', $2 FROM resposta
+        )
+        SELECT resposta.request_id, resposta.id, mensagem.conversa_id FROM resposta, mensagem
+        """,
+    ),
+}
+
+def preparar(conn, nome):
+    """PREPARE do comando na conexão, se ela ainda não o tem; devolve True se preparou agora."""
+    if nome in conn.preparadas:
+        return False
+    tipos, sql = COMANDOS[nome]
+    conn.cursor().execute(f"PREPARE {nome} ({tipos}) AS {sql}")
+    conn.preparadas.add(nome)
+    return True
+
+class EstatisticasTurnos:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.turnos = 0
+        self.idas_ao_banco = 0
+        self.preparados = 0
+
+    def registrar(self, idas_ao_banco, preparados):
+        with self._lock:
+            self.turnos += 1
+            self.idas_ao_banco += idas_ao_banco
+            self.preparados += preparados
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                "turnos": self.turnos,
+                "idas_ao_banco_por_turno": round(self.idas_ao_banco / max(self.turnos, 1), 1),
+                "preparados": self.preparados,
+            }
+
+estatisticas_turnos = EstatisticasTurnos()
+
+class TurnoBanco:
+    """Acesso ao banco de um turno: use com `with`, ou abrir()/fechar() quando o turno termina num stream."""
+
+    def __init__(self, usuario_email, pool=None):
+        self.usuario_email = usuario_email
+        self.pool = pool or pool_banco
+        self.conn = None
+        self._emprestimo = None
+        self._usuario = None
+        self.idas_ao_banco = 0
+        self.preparados = 0
+
+    def abrir(self):
+        self._emprestimo = self.pool.conexao()
+        self.conn = self._emprestimo.__enter__()
+        return self
+
+    def fechar(self, tipo=None, erro=None, rastro=None):
+        if self._emprestimo is None:
+            return
+        emprestimo, self._emprestimo, self.conn = self._emprestimo, None, None
+        estatisticas_turnos.registrar(self.idas_ao_banco, self.preparados)
+        emprestimo.__exit__(tipo, erro, rastro)
+
+    def __enter__(self):
+        return self.abrir()
+
+    def __exit__(self, tipo, erro, rastro):
+        self.fechar(tipo, erro, rastro)
+
+    def _executar(self, nome, parametros, cursor_factory=None):
+        if preparar(self.conn, nome):
+            self.idas_ao_banco += 1
+            self.preparados += 1
+        cursor = self.conn.cursor(cursor_factory=cursor_factory)
+        marcadores = ", ".join(["%s"] * len(parametros))
+        cursor.execute(f"EXECUTE {nome} ({marcadores})", parametros)
+        self.idas_ao_banco += 1
+        return cursor
+
+    def usuario(self):
+        """{'id', 'persona_escolhida'} do usuário do turno, consultado uma vez só."""
+        if self._usuario is None:
+            linha = self._executar("lyria_usuario", (self.usuario_email,)).fetchone()
+            if not linha:
+                raise Exception(f"Usuário com email {self.usuario_email} não encontrado")
+            self._usuario = {"id": linha[0], "persona_escolhida": linha[1]}
+        return self._usuario
+
+    def persona(self):
+        return self.usuario()["persona_escolhida"]
+
+    def carregar_resumo(self, conversa_id):
+        """(resumo, turnos_resumidos); a conversa precisa ser do usuário."""
+        linha = self._executar("lyria_conversa", (conversa_id, self.usuario()["id"])).fetchone()
+        if not linha:
+            raise Exception(f"Conversa {conversa_id} não encontrada para este usuário")
+        return linha[0], linha[1]
+
+    def carregar_cauda(self, conversa_id, limite=TURNOS_NO_PROMPT):
+        """(últimos turnos em ordem cronológica, total de turnos); sem ir ao banco se a conversa está em memória."""
+        conversa_id = int(conversa_id)
+        cauda = cauda_conversas.obter(conversa_id)
+        if cauda is not None:
+            return cauda
+        marca = cauda_conversas.marca()
+        cursor = self._executar("lyria_cauda", (conversa_id, limite), psycopg2.extras.RealDictCursor)
+        linhas = cursor.fetchall()
+        turnos = [{"pergunta": row["pergunta"], "resposta": row["resposta"]} for row in reversed(linhas)]
+        total = linhas[0]["total"] if linhas else 0
+        cauda_conversas.guardar(conversa_id, turnos, total, marca)
+        return turnos, total
+
+    def carregar_memorias(self, limite=20):
+        """Como banco.carregar_memorias: sem memórias ([]) em caso de erro, o turno segue."""
+        try:
+            cursor = self._executar("lyria_memorias", (self.usuario()["id"], limite), psycopg2.extras.RealDictCursor)
+            linhas = cursor.fetchall()
+        except psycopg2.Error as e:
+            print(f"⚠️ Erro ao carregar memórias: {e}")
+            # O erro aborta a transação; as leituras anteriores já foram lidas, então só desfaz.
+            # Se nem o rollback passa, a conexão caiu e o turno não teria como ser salvo.
+            self.conn.rollback()
+            self.idas_ao_banco += 1
+            return []
+        memorias = []
+        for row in linhas:
+            memorias.append(f"Usuário: {row['usuario_disse']}")
+            memorias.append(f"IA: {row['ia_respondeu']}")
+        return list(reversed(memorias))
+
+    def concluir_leitura(self):
+        """Fecha a transação das leituras: a conexão não fica "idle in transaction" enquanto o LLM responde."""
+        self.conn.commit()
+        self.idas_ao_banco += 1
+
+    def salvar_turno(self, conversa_id, pergunta, resposta, resultado=None, persona=None,
+                     modelo_usado=None, tokens=None):
+        """Grava o turno inteiro numa transação; devolve o conversa_id (inteiro, vindo do banco)."""
+        uso = dados_uso(resultado, modelo_usado, tokens)
+        cursor = self._executar("lyria_salvar_turno", (
+            self.usuario()["id"], conversa_id, pergunta, resposta,
+            uso["modelo_usado"], uso["tokens"], uso["provedor"], persona,
+            uso["tokens_prompt"], uso["tokens_resposta"], uso["tokens_estimados"],
+            uso["latencia_ms"], uso["tempo_primeiro_token_ms"],
+        ))
+        conversa_id = cursor.fetchone()[2]
+        self.conn.commit()
+        self.idas_ao_banco += 1
+        cauda_conversas.anexar(conversa_id, pergunta, resposta)
+        print(f"✅ Mensagem salva para usuário {self.usuario_email} na conversa {conversa_id}")
+        return conversa_id
@@ -0,0 +1,119 @@
+"""Rajada contra um provedor com cota: sem controle de admissão vs com ControleAdmissao.
+
+Sobe um provedor falso que aceita no máximo CONCORRENCIA_PROVEDOR chamadas em
+paralelo e COTA_JANELA chamadas por JANELA segundos, respondendo 429 com
+Retry-After acima disso. Dispara RAJADA chamadas ao mesmo tempo e conta quantas
+viraram 429 no provedor, quantas foram recusadas localmente (sem gastar cota)
+e a latência das que deram certo.
+
+Uso (na raiz do projeto): python -m benchmarks.benchmark_admissao
+"""
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from provedores.admissao import AdmissaoNegada, ControleAdmissao, ler_retry_after
+from rede import cliente_http
+
+RAJADA = 60
+CONCORRENCIA_PROVEDOR = 4
+COTA_JANELA = 20
+JANELA = 2.0
+ATRASO = 0.05
+
+class ProvedorComCota(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    lock = threading.Lock()
+    em_uso = 0
+    janela_inicio = time.monotonic()
+    na_janela = 0
+    respostas_429 = 0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        cls = ProvedorComCota
+        with cls.lock:
+            agora = time.monotonic()
+            if agora - cls.janela_inicio >= JANELA:
+                cls.janela_inicio, cls.na_janela = agora, 0
+            aceita = cls.em_uso < CONCORRENCIA_PROVEDOR and cls.na_janela < COTA_JANELA
+            if aceita:
+                cls.em_uso += 1
+                cls.na_janela += 1
+            else:
+                cls.respostas_429 += 1
+            restantes = COTA_JANELA - cls.na_janela
+            retry_after = JANELA - (agora - cls.janela_inicio)
+
+        if not aceita:
+            self.responder(429, {"Retry-After": f"{retry_after:.2f}"})
+            return
+        time.sleep(ATRASO)
+        with cls.lock:
+            cls.em_uso -= 1
+        self.responder(200, {"x-ratelimit-remaining-requests": str(restantes)})
+
+    def responder(self, status, cabecalhos):
+        corpo = b"{}"
+        self.send_response(status)
+        for nome, valor in cabecalhos.items():
+            self.send_header(nome, valor)
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *args):
+        pass
+
+def chamar(url, admissao):
+    inicio = time.perf_counter()
+    if admissao is None:
+        resp = cliente_http.post(url, json={}, timeout=10)
+        return resp.status_code, time.perf_counter() - inicio
+    try:
+        with admissao.admitir():
+            resp = cliente_http.post(url, json={}, timeout=10)
+            admissao.sincronizar(requisicoes_restantes=int(resp.headers.get("x-ratelimit-remaining-requests", 0))
+                                 if resp.status_code == 200 else None)
+            if resp.status_code == 429:
+                admissao.registrar_429(ler_retry_after(resp.headers.get("Retry-After")))
+    except AdmissaoNegada:
+        return "recusada", time.perf_counter() - inicio
+    if resp.status_code == 200:
+        admissao.registrar_sucesso()
+    return resp.status_code, time.perf_counter() - inicio
+
+def rajada(url, admissao):
+    ProvedorComCota.respostas_429 = 0
+    ProvedorComCota.janela_inicio = time.monotonic()
+    ProvedorComCota.na_janela = 0
+    with ThreadPoolExecutor(max_workers=RAJADA) as executor:
+        resultados = list(executor.map(lambda _: chamar(url, admissao), range(RAJADA)))
+    ok = [t for status, t in resultados if status == 200]
+    recusadas = sum(1 for status, _ in resultados if status == "recusada")
+    return len(ok), ProvedorComCota.respostas_429, recusadas, ok
+
+if __name__ == "__main__":
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), ProvedorComCota)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{servidor.server_address[1]}/v1/chat/completions"
+
+    cenarios = [
+        ("sem admissão", None),
+        ("com admissão", ControleAdmissao(
+            "falso", CONCORRENCIA_PROVEDOR, rpm=COTA_JANELA * 60 / JANELA, espera_maxima=JANELA,
+            max_fila=RAJADA,
+        )),
+    ]
+    print(f"Rajada de {RAJADA} chamadas; provedor aceita {CONCORRENCIA_PROVEDOR} em paralelo e {COTA_JANELA} a cada {JANELA:.0f}s\n")
+    for nome, admissao in cenarios:
+        time.sleep(JANELA)  # começa com a cota do provedor cheia
+        sucesso, erros_429, recusadas, tempos = rajada(url, admissao)
+        latencia = f"mediana {statistics.median(tempos) * 1000:.0f}ms" if tempos else "-"
+        print(f"{nome:>13}: {sucesso:2d} ok, {erros_429:2d} respostas 429 do provedor, "
+              f"{recusadas:2d} recusadas localmente ({latencia})")
+        if admissao is not None:
+            print(f"{'':>15}{admissao.estatisticas()}")
+    servidor.shutdown()
@@ -0,0 +1,82 @@
+"""Latência de banco por turno de /Lyria/conversar-logado: conexão nova por consulta, pool e TurnoBanco.
+
+Roda contra o Postgres de BANCO_API (use um banco local de teste: o script cria
+um usuário descartável e o apaga no fim). Cada turno faz as mesmas chamadas de
+banco da rota: persona escolhida, resumo, turnos da conversa, memórias e
+salvarMensagem. O cenário "sem pool" usa um pool com vida máxima zero, que
+abre uma conexão nova a cada retirada como antes. O cenário "TurnoBanco" faz
+o mesmo turno pela unidade de trabalho: uma conexão, comandos preparados, um
+commit só para a gravação e a cauda da conversa vinda da memória.
+
+Uso (na raiz do projeto):
+    BANCO_API=postgresql://postgres@localhost/lyria_teste python -m benchmarks.benchmark_banco
+"""
+import os
+import statistics
+import time
+import uuid
+
+TURNOS = int(os.getenv("BENCH_TURNOS", 30))
+
+def turno(banco, email, conversa_id, numero):
+    inicio = time.perf_counter()
+    banco.pegarPersonaEscolhida(email)
+    banco.carregar_resumo_conversa(conversa_id)
+    banco.carregar_mensagens_por_conversa_id(conversa_id)
+    banco.carregar_memorias(email)
+    banco.salvarMensagem(email, f"pergunta {numero}", f"resposta {numero}", conversa_id=conversa_id)
+    return (time.perf_counter() - inicio) * 1000
+
+def turno_unidade(banco, email, conversa_id, numero):
+    from banco.turno import TurnoBanco
+    from conversas.historico import turnos_nao_resumidos
+
+    inicio = time.perf_counter()
+    with TurnoBanco(email, pool=banco.pool_banco) as unidade:
+        unidade.persona()
+        _, resumidos = unidade.carregar_resumo(conversa_id)
+        cauda, total = unidade.carregar_cauda(conversa_id)
+        turnos_nao_resumidos(cauda, total, resumidos)
+        unidade.carregar_memorias()
+        unidade.concluir_leitura()
+        unidade.salvar_turno(conversa_id, f"pergunta {numero}", f"resposta {numero}")
+    return (time.perf_counter() - inicio) * 1000
+
+def medir(banco, email, conversa_id, executar):
+    tempos = [executar(banco, email, conversa_id, i) for i in range(TURNOS)]
+    tempos.sort()
+    return statistics.median(tempos), tempos[int(len(tempos) * 0.95) - 1]
+
+if __name__ == "__main__":
+    if not os.getenv("BANCO_API"):
+        raise SystemExit("Defina BANCO_API apontando para um Postgres de teste")
+
+    from banco import banco
+    from banco.pool import PoolConexoes
+
+    banco.criar_banco()
+    email = f"benchmark-{uuid.uuid4().hex[:8]}@lyria.local"
+    banco.criarUsuario("Benchmark", email, "professor")
+    conversa_id = banco.criar_nova_conversa(email)
+
+    try:
+        cenarios = [
+            ("sem pool", PoolConexoes(banco.DB_URL, minimo=0, vida_maxima=0), turno),
+            ("com pool", PoolConexoes(banco.DB_URL), turno),
+            ("TurnoBanco", PoolConexoes(banco.DB_URL), turno_unidade),
+        ]
+        print(f"{TURNOS} turnos por cenário\n")
+        for nome, pool, executar in cenarios:
+            banco.pool_banco = pool
+            pool.aquecer()
+            mediana, p95 = medir(banco, email, conversa_id, executar)
+            estatisticas = pool.estatisticas()
+            print(f"{nome:>10}: mediana {mediana:6.1f}ms  p95 {p95:6.1f}ms por turno  "
+                  f"({estatisticas['criadas']} conexões abertas, espera média {estatisticas['espera_media_ms']}ms)")
+            pool.fechar()
+    finally:
+        banco.pool_banco = PoolConexoes(banco.DB_URL)
+        with banco.pool_banco.conexao() as conn:
+            conn.cursor().execute("DELETE FROM usuarios WHERE email = %s", (email,))
+            conn.commit()
+        banco.pool_banco.fechar()
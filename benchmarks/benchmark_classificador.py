@@ -0,0 +1,83 @@
+"""Latência por chamada do classificador de busca na web.
+
+Compara o comportamento antigo (joblib.load dos dois pickles a cada pergunta)
+com o classificador carregado uma vez por processo, e o laço pergunta a
+pergunta com a API em lote. As medições chamam obter_classificador().prever_lote
+direto: pelo deve_buscar_na_web as perguntas repetidas sairiam do CacheDecisoes
+e o número mediria o cache, não o classificador.
+
+Uso (na raiz do projeto): python -m benchmarks.benchmark_classificador
+"""
+import json
+import os
+import statistics
+import time
+
+import joblib
+
+from classificadorDaWeb.classificador_busca_web import (
+    ARTEFATOS_DIR, CAMINHO_CSV, NOME_MANIFEST, carregar_dados_csv,
+    deve_buscar_na_web_lote, obter_classificador
+)
+
+PERGUNTAS = [
+    "Qual a cotação do dólar hoje?",
+    "oi, tudo bem?",
+    "Quem venceu o jogo do Flamengo ontem?",
+    "O que é fotossíntese?",
+    "Como calcular o ROI de um projeto?",
+]
+
+with open(os.path.join(ARTEFATOS_DIR, NOME_MANIFEST), encoding="utf-8") as f:
+    _arquivos = json.load(f)["arquivos"]
+CAMINHO_MODELO = os.path.join(ARTEFATOS_DIR, _arquivos["modelo"]["caminho"])
+CAMINHO_VETOR = os.path.join(ARTEFATOS_DIR, _arquivos["vetor"]["caminho"])
+
+def deve_buscar_na_web_antigo(pergunta):
+    modelo = joblib.load(CAMINHO_MODELO)
+    vetor = joblib.load(CAMINHO_VETOR)
+    entrada = vetor.transform([pergunta])
+    return bool(modelo.predict(entrada)[0])
+
+def deve_buscar_na_web_sem_cache(pergunta):
+    decisoes, _ = obter_classificador().prever_lote([pergunta])
+    return decisoes[0]
+
+def medir(funcao, repeticoes):
+    tempos = []
+    for i in range(repeticoes):
+        pergunta = PERGUNTAS[i % len(PERGUNTAS)]
+        inicio = time.perf_counter()
+        funcao(pergunta)
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    tempos.sort()
+    return {
+        "media_ms": statistics.mean(tempos),
+        "p50_ms": tempos[len(tempos) // 2],
+        "p95_ms": tempos[int(len(tempos) * 0.95) - 1],
+    }
+
+if __name__ == "__main__":
+    deve_buscar_na_web_sem_cache(PERGUNTAS[0])  # aquecimento: primeira carga fica fora da medição
+
+    for nome, funcao, repeticoes in (
+        ("antes (joblib.load por chamada)", deve_buscar_na_web_antigo, 200),
+        ("depois (carregado uma vez)", deve_buscar_na_web_sem_cache, 2000),
+    ):
+        r = medir(funcao, repeticoes)
+        print(f"{nome:35s} média={r['media_ms']:.3f}ms p50={r['p50_ms']:.3f}ms p95={r['p95_ms']:.3f}ms")
+
+    perguntas, _ = carregar_dados_csv(CAMINHO_CSV)
+    perguntas = perguntas * 10
+
+    inicio = time.perf_counter()
+    decisoes_laco = [deve_buscar_na_web_sem_cache(p) for p in perguntas]
+    tempo_laco = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    decisoes_lote, _ = deve_buscar_na_web_lote(perguntas)
+    tempo_lote = time.perf_counter() - inicio
+
+    assert decisoes_laco == decisoes_lote
+    print(f"{len(perguntas)} perguntas: laço={tempo_laco * 1000:.1f}ms lote={tempo_lote * 1000:.1f}ms "
+          f"({tempo_laco / tempo_lote:.0f}x)")
@@ -0,0 +1,78 @@
+"""Handshake por chamada (requests.post solto) vs cliente HTTP com pool keep-alive.
+
+Sobe um servidor HTTPS local (certificado autoassinado gerado com openssl) que
+responde como um endpoint de chat, e mede a latência de N chamadas sequenciais
+nos dois modos.
+
+Uso (na raiz do projeto): python -m benchmarks.benchmark_cliente_http
+"""
+import json
+import os
+import ssl
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+import warnings
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from urllib3.exceptions import InsecureRequestWarning
+
+from rede.cliente_http import ClienteHttp
+
+REPETICOES = 200
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        corpo = json.dumps({"choices": [{"message": {"content": "ok"}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *args):
+        pass
+
+def subir_servidor(pasta):
+    cert = os.path.join(pasta, "cert.pem")
+    chave = os.path.join(pasta, "chave.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-subj", "/CN=localhost", "-keyout", chave, "-out", cert],
+        check=True, capture_output=True,
+    )
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    contexto = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    contexto.load_cert_chain(cert, chave)
+    servidor.socket = contexto.wrap_socket(servidor.socket, server_side=True)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, f"https://localhost:{servidor.server_address[1]}/openai/v1/chat/completions"
+
+def medir(chamar, url):
+    tempos = []
+    for _ in range(REPETICOES):
+        inicio = time.perf_counter()
+        resp = chamar(url, json={"messages": [{"role": "user", "content": "Teste"}]}, timeout=10, verify=False)
+        resp.json()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    tempos.sort()
+    return statistics.mean(tempos), tempos[len(tempos) // 2], tempos[int(len(tempos) * 0.95) - 1]
+
+if __name__ == "__main__":
+    warnings.simplefilter("ignore", InsecureRequestWarning)
+    with tempfile.TemporaryDirectory() as pasta:
+        servidor, url = subir_servidor(pasta)
+        cliente = ClienteHttp()
+        for nome, chamar in (("requests.post (sem pool)", requests.post), ("cliente_http (keep-alive)", cliente.post)):
+            media, p50, p95 = medir(chamar, url)
+            print(f"{nome:28s} média={media:.2f}ms p50={p50:.2f}ms p95={p95:.2f}ms")
+        print(f"conexões abertas pelo cliente_http: {sum(d.get('conexoes_abertas', 0) for d in cliente.estatisticas().values())}"
+              f" para {REPETICOES} requisições")
+        servidor.shutdown()
@@ -0,0 +1,40 @@
+"""Cold start do classificador: formato compacto (NumPy) vs pickles sklearn.
+
+Cada formato roda num processo novo, medindo o tempo até a primeira resposta
+(imports + carga dos artefatos + uma classificação) e o pico de memória (RSS).
+
+Uso (na raiz do projeto): python -m benchmarks.benchmark_cold_start
+"""
+import json
+import os
+import subprocess
+import sys
+
+CODIGO_FILHO = """
+import json, resource, sys, time
+inicio = time.perf_counter()
+from classificadorDaWeb.classificador_busca_web import deve_buscar_na_web
+deve_buscar_na_web("qual a cotação do dólar hoje")
+print(json.dumps({
+    "tempo_ms": (time.perf_counter() - inicio) * 1000,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "sklearn_importado": "sklearn" in sys.modules,
+}))
+"""
+
+def medir(formato, repeticoes=5):
+    resultados = []
+    for _ in range(repeticoes):
+        env = dict(os.environ, CLASSIFICADOR_FORMATO=formato)
+        saida = subprocess.run(
+            [sys.executable, "-c", CODIGO_FILHO], env=env, capture_output=True, text=True, check=True
+        ).stdout
+        resultados.append(json.loads(saida.strip().splitlines()[-1]))
+    resultados.sort(key=lambda r: r["tempo_ms"])
+    return resultados[len(resultados) // 2]
+
+if __name__ == "__main__":
+    for formato in ("sklearn", "compacto"):
+        r = medir(formato)
+        print(f"{formato:10s} primeira resposta={r['tempo_ms']:.0f}ms RSS={r['rss_mb']:.1f}MB "
+              f"sklearn importado={r['sklearn_importado']}")
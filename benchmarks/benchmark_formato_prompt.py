@@ -0,0 +1,77 @@
+"""Tokens de prompt por turno: formato plano vs mensagens de chat.
+
+Simula uma conversa turno a turno e, para cada pedido, conta os tokens
+(estimativa local de prompt.montador) do prompt plano numa única mensagem user
+e das mensagens system/user/assistant. Também mede quantos tokens do início de
+cada pedido são idênticos aos do pedido anterior, que é o que um provedor com
+cache de prefixo consegue reaproveitar.
+
+Uso (na raiz do projeto): python -m benchmarks.benchmark_formato_prompt
+"""
+import contextlib
+import io
+import os
+
+os.environ.setdefault("GROQ_API_KEY", "benchmark")
+
+from prompt.montador import TOKENS_POR_MENSAGEM, contar_tokens, contar_tokens_mensagens
+from testeDaIa import montar_prompt
+
+PERGUNTAS = [
+    "O que é fotossíntese?",
+    "E qual o papel da clorofila nisso?",
+    "Por que as folhas mudam de cor no outono?",
+    "Isso acontece com todas as árvores?",
+    "Como explicar isso para uma criança de oito anos?",
+    "Me dá um exemplo de experimento simples?",
+    "Quanto tempo leva para ver o resultado?",
+    "E se eu usar luz artificial?",
+]
+RESPOSTA = "A fotossíntese transforma luz, água e gás carbônico em glicose e oxigênio nas folhas. " * 3
+MEMORIAS = ["O usuário é professor de ciências do ensino fundamental.", "Prefere exemplos práticos e curtos."]
+
+def prefixo_comum(texto, anterior):
+    tamanho = 0
+    for a, b in zip(texto, anterior):
+        if a != b:
+            break
+        tamanho += 1
+    return contar_tokens(texto[:tamanho])
+
+def prefixo_comum_mensagens(mensagens, anteriores):
+    tokens = 0
+    for atual, anterior in zip(mensagens, anteriores):
+        if atual != anterior:
+            return tokens + prefixo_comum(atual["content"], anterior["content"])
+        tokens += contar_tokens(atual["content"]) + TOKENS_POR_MENSAGEM
+    return tokens
+
+if __name__ == "__main__":
+    historico = []
+    anterior_plano, anteriores_chat = "", []
+    totais = {"plano": 0, "chat": 0, "cache_plano": 0, "cache_chat": 0}
+
+    print(f"{'turno':>5} {'plano':>7} {'chat':>7} {'prefixo igual (plano)':>22} {'prefixo igual (chat)':>21}")
+    for turno, pergunta in enumerate(PERGUNTAS, 1):
+        with contextlib.redirect_stdout(io.StringIO()):
+            prompt = montar_prompt(pergunta, list(historico), MEMORIAS, "professor")
+
+        mensagem_plana = [{"role": "user", "content": prompt.texto}]
+        tokens_plano = contar_tokens_mensagens(mensagem_plana)
+        tokens_chat = contar_tokens_mensagens(prompt.mensagens)
+        cache_plano = prefixo_comum(prompt.texto, anterior_plano)
+        cache_chat = prefixo_comum_mensagens(prompt.mensagens, anteriores_chat)
+
+        print(f"{turno:>5} {tokens_plano:>7} {tokens_chat:>7} {cache_plano:>22} {cache_chat:>21}")
+        for chave, valor in (("plano", tokens_plano), ("chat", tokens_chat),
+                             ("cache_plano", cache_plano), ("cache_chat", cache_chat)):
+            totais[chave] += valor
+
+        anterior_plano, anteriores_chat = prompt.texto, prompt.mensagens
+        historico.append({"pergunta": pergunta, "resposta": RESPOSTA})
+
+    print(f"Total: plano={totais['plano']} chat={totais['chat']} "
+          f"({(1 - totais['chat'] / totais['plano']) * 100:.1f}% menos tokens)")
+    print(f"Reaproveitável por cache de prefixo: plano={totais['cache_plano'] / totais['plano'] * 100:.1f}% "
+          f"chat={totais['cache_chat'] / totais['chat'] * 100:.1f}%")
+    assert totais["chat"] <= totais["plano"], "formato chat não deveria gastar mais tokens que o plano"
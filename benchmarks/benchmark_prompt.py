@@ -0,0 +1,131 @@
+"""Tempo de montagem do prompt e estabilidade do prefixo estático por persona.
+
+Compara a montagem antiga do prefixo (dict de personas e format() refeitos a
+cada chamada) com os templates pré-renderizados, mede montar_prompt inteiro e
+confere que todo prompt de uma mesma (persona, primeira mensagem/continuação)
+começa exatamente pelos mesmos bytes, iguais aos da montagem antiga.
+
+Uso (na raiz do projeto): python -m benchmarks.benchmark_prompt
+"""
+import contextlib
+import io
+import statistics
+import time
+
+from prompt.personas import PERSONAS, identificar_persona, obter_persona
+from testeDaIa import montar_prompt
+
+HISTORICO = [{"pergunta": f"pergunta anterior {i}", "resposta": f"resposta anterior {i} " * 20} for i in range(6)]
+
+def prefixo_antigo(persona, historico_conversa):
+    """Montagem do prefixo antes dos templates: dict e format() refeitos a cada chamada."""
+    is_first_message = not historico_conversa
+
+    # Define a base do prompt com placeholders para personalização
+    prompt_base = """
+    MODO: {modo}
+
+    O QUE VOCÊ DEVE SER:
+    {instrucao_comportamento}
+
+    OBJETIVOS:
+    {objetivos}
+
+    ABORDAGEM:
+    {abordagem}
+
+    ESTILO DE COMUNICAÇÃO:
+    {estilo}
+
+    RESTRIÇÕES DE CONTEÚDO E ESTILO - INSTRUÇÃO CRÍTICA:
+    - NUNCA use qualquer tipo de formatação especial (asteriscos, negrito, itálico, listas numeradas ou marcadores).
+    - NUNCA invente informações. Se não houver certeza, declare a limitação e sugira buscar dados na web.
+    - NUNCA use palavrões ou linguagem ofensiva.
+    - NUNCA mencione ou apoie atividades ilegais.
+
+    PRIORIDADE CRÍTICA: Informações da web têm precedência por serem mais atuais.
+    """
+
+    # Conteúdo específico de cada persona
+    personas_config = {
+        'professor': {
+            'modo': 'EDUCACIONAL',
+            'instrucao_inicio': '- Você é a Professora Lyria. Apresente-se calorosamente como uma professora de IA pronta para ajudar a aprender qualquer assunto de forma clara e objetiva, e então pergunte qual é a dúvida do usuário.',
+            'instrucao_continua': '- Você é a Professora Lyria. Responda diretamente à pergunta do usuário, sem se apresentar novamente.',
+            'objetivos': '- Explicar conceitos de forma clara e objetiva\n- Adaptar linguagem ao nível do usuário\n- Fornecer exemplos práticos e relevantes\n- Incentivar aprendizado progressivo\n- Conectar novos conhecimentos com conhecimentos prévios',
+            'abordagem': '- Priorizar informações atualizadas da web quando disponíveis\n- Estruturar respostas de forma lógica e sem rodeios\n- Explicar apenas o necessário, evitando repetições\n- Usar linguagem simples e direta\n- Confirmar compreensão antes de avançar para conceitos mais complexos',
+            'estilo': '- Tom didático, acessível e objetivo\n- Respostas curtas e bem estruturadas\n- Exemplos concretos\n- Clareza acima de detalhes supérfluos'
+        },
+        'empresarial': {
+            'modo': 'CORPORATIVO',
+            'instrucao_inicio': '- Você é a assistente Lyria. Apresente-se como uma assistente de IA para negócios, focada em fornecer análises práticas e otimizar resultados, e pergunte como pode ajudar a empresa.',
+            'instrucao_continua': '- Você é a assistente Lyria. Responda diretamente à necessidade do usuário, sem se apresentar novamente.',
+            'objetivos': '- Fornecer análises práticas e diretas\n- Focar em resultados mensuráveis e ROI\n- Otimizar processos e recursos\n- Apresentar soluções implementáveis\n- Considerar impactos financeiros e operacionais',
+            'abordagem': '- Priorizar dados atualizados da web sobre mercado e tendências\n- Apresentar informações de forma hierárquica e clara\n- Ser objetiva e evitar rodeios\n- Foco em eficiência, produtividade e ação imediata',
+            'estilo': '- Linguagem profissional, direta e objetiva\n- Respostas concisas e estruturadas\n- Terminologia empresarial apropriada\n- Ênfase em ação e resultados práticos'
+        },
+        'social': {
+            'modo': 'SOCIAL E COMPORTAMENTAL',
+            'instrucao_inicio': '- Você é a Lyria, uma assistente social e comportamental. Apresente-se de forma acolhedora, explique seu propósito de promover o autoconhecimento e o bem-estar, e convide o usuário a compartilhar o que gostaria de discutir.',
+            'instrucao_continua': '- Você é a Lyria. Continue a conversa de forma empática e direta, respondendo à pergunta do usuário sem se apresentar novamente.',
+            'objetivos': '- Oferecer suporte em questões sociais e relacionais\n- Compreender diferentes perspectivas culturais e geracionais\n- Fornecer conselhos equilibrados, claros e objetivos\n- Promover autoconhecimento e bem-estar\n- Sugerir recursos de apoio quando necessário',
+            'abordagem': '- Considerar informações atuais da web sobre comportamento social\n- Adaptar conselhos ao contexto cultural específico\n- Ser direta e empática, evitando excesso de explicações\n- Promover reflexão prática e crescimento pessoal',
+            'estilo': '- Linguagem natural, acolhededora e objetiva\n- Respostas claras e sem enrolação\n- Tom compreensivo, mas honesto\n- Perguntas que incentivem insights rápidos'
+        }
+    }
+    
+    # Seleciona a persona correta
+    persona_selecionada = identificar_persona(persona)
+
+    config = personas_config[persona_selecionada]
+
+    # Define a instrução de comportamento com base no estado da conversa
+    instrucao_comportamento = config['instrucao_inicio'] if is_first_message else config['instrucao_continua']
+
+    # Formata o prompt final
+    intro = prompt_base.format(
+        modo=config['modo'],
+        instrucao_comportamento=instrucao_comportamento,
+        objetivos=config['objetivos'],
+        abordagem=config['abordagem'],
+        estilo=config['estilo']
+    )
+    return intro
+
+def medir(funcao, repeticoes=20000):
+    tempos = []
+    for i in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao(i)
+        tempos.append((time.perf_counter() - inicio) * 1e6)
+    tempos.sort()
+    return statistics.mean(tempos), tempos[len(tempos) // 2], tempos[int(len(tempos) * 0.95) - 1]
+
+if __name__ == "__main__":
+    nomes = list(PERSONAS)
+
+    for nome, funcao in (
+        ("prefixo antes (dict + format)", lambda i: prefixo_antigo(nomes[i % 3], HISTORICO if i % 2 else None)),
+        ("prefixo depois (template)", lambda i: obter_persona(nomes[i % 3]).prefixo(primeira_mensagem=not i % 2)),
+    ):
+        media, p50, p95 = medir(funcao)
+        print(f"{nome:32s} média={media:.2f}µs p50={p50:.2f}µs p95={p95:.2f}µs")
+
+    # montar_prompt loga cada montagem; o print fica fora da medição
+    with contextlib.redirect_stdout(io.StringIO()):
+        media, p50, p95 = medir(
+            lambda i: montar_prompt(f"pergunta {i}", HISTORICO if i % 2 else None, None, nomes[i % 3]), 5000
+        )
+    print(f"{'montar_prompt completo':32s} média={media:.2f}µs p50={p50:.2f}µs p95={p95:.2f}µs")
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        for nome in nomes:
+            for historico in (None, HISTORICO):
+                esperado = prefixo_antigo(nome, historico)
+                assert obter_persona(nome).prefixo(primeira_mensagem=not historico) == esperado
+                prefixos = {
+                    montar_prompt(f"pergunta {i}", historico, [f"memória número {i}"], nome).texto[:len(esperado)]
+                    for i in range(200)
+                }
+                assert prefixos == {esperado}, f"prefixo instável para {nome}"
+    print(f"✅ Prefixos estáveis e idênticos à montagem antiga ({len(nomes)} personas x 2 estados)")
@@ -0,0 +1,93 @@
+"""Tempo até o primeiro token: /Lyria/conversar vs /Lyria/conversar/stream.
+
+Sobe um provedor falso compatível com a API do Groq que gera um token a cada
+ATRASO_TOKEN segundos (com stream=true manda SSE; sem stream responde tudo no fim)
+e compara, pelo test client do Flask, quando o primeiro pedaço chega ao cliente.
+
+Uso (na raiz do projeto): python -m benchmarks.benchmark_streaming
+"""
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TOKENS = [f"palavra{i} " for i in range(30)]
+ATRASO_TOKEN = 0.03
+USO = {"prompt_tokens": 420, "completion_tokens": len(TOKENS), "total_tokens": 420 + len(TOKENS)}
+
+class ProvedorFalso(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def escrever_pedaco(self, dados):
+        # Transfer-Encoding: chunked, como o endpoint real do Groq
+        self.wfile.write(f"{len(dados):X}\r\n".encode() + dados + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        if payload.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for token in TOKENS:
+                time.sleep(ATRASO_TOKEN)
+                evento = {"choices": [{"delta": {"content": token}}]}
+                self.escrever_pedaco(f"data: {json.dumps(evento)}\n\n".encode())
+            # Com stream_options.include_usage, o `usage` vem num último evento sem choices
+            uso = {"choices": [], "usage": USO}
+            self.escrever_pedaco(f"data: {json.dumps(uso)}\n\n".encode())
+            self.escrever_pedaco(b"data: [DONE]\n\n")
+            self.escrever_pedaco(b"")
+            return
+
+        time.sleep(ATRASO_TOKEN * len(TOKENS))
+        corpo = json.dumps({"choices": [{"message": {"content": "".join(TOKENS)}}], "usage": USO}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *args):
+        pass
+
+def medir(cliente, rota):
+    inicio = time.perf_counter()
+    resposta = cliente.post(rota, json={"pergunta": "O que é fotossíntese?", "persona": "professor"}, buffered=False)
+    primeiro = None
+    texto = []
+    for pedaco in resposta.response:
+        if primeiro is None:
+            primeiro = time.perf_counter() - inicio
+        texto.append(pedaco.decode() if isinstance(pedaco, bytes) else pedaco)
+    total = time.perf_counter() - inicio
+    resposta.close()
+    return primeiro * 1000, total * 1000, "".join(texto)
+
+if __name__ == "__main__":
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), ProvedorFalso)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    os.environ["GROQ_API_URL"] = f"http://127.0.0.1:{servidor.server_address[1]}/openai/v1/chat/completions"
+    os.environ["GROQ_API_KEY"] = "chave-falsa"
+    os.environ.pop("HUGGING_FACE_API_KEY", None)
+    os.environ["CACHE_RESPOSTAS_TTL"] = "0"  # mede o provedor, não o cache de respostas
+    os.environ["REUSO_LIMIAR_SIMILARIDADE"] = "2"  # nem o reaproveitamento por similaridade (cosseno <= 1)
+
+    from app import app
+
+    cliente = app.test_client()
+    _, _, corpo_normal = medir(cliente, "/Lyria/conversar")
+    _, _, corpo_stream = medir(cliente, "/Lyria/conversar/stream")
+    tokens_stream = "".join(
+        json.loads(linha[len("data: "):]).get("token", "")
+        for linha in corpo_stream.splitlines() if linha.startswith("data: ")
+    )
+    assert json.loads(corpo_normal)["resposta"] == tokens_stream == "".join(TOKENS), "respostas divergentes"
+
+    for rota in ("/Lyria/conversar", "/Lyria/conversar/stream"):
+        primeiro, total, _ = medir(cliente, rota)
+        print(f"{rota:28s} primeiro pedaço={primeiro:.0f}ms total={total:.0f}ms")
+    servidor.shutdown()
@@ -0,0 +1,159 @@
+"""Cache persistente (SQLite) dos resultados da SerpAPI.
+
+Sobrevive a reinícios e é compartilhado por todas as threads do waitress.
+Entradas vencidas ainda são servidas durante a janela de "stale" enquanto uma
+atualização roda em segundo plano (stale-while-revalidate).
+"""
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from classificadorDaWeb.normalizacao import normalizar_pergunta
+
+BASE_DIR = os.path.dirname(__file__)
+CAMINHO_CACHE = os.getenv("CACHE_BUSCA_WEB_DB", os.path.join(BASE_DIR, "busca_web.sqlite3"))
+
+# Perguntas sobre coisas que mudam rápido (placar, cotação, "hoje") expiram cedo
+TTL_CURTO = int(os.getenv("CACHE_BUSCA_WEB_TTL_CURTO", 15 * 60))
+TTL_LONGO = int(os.getenv("CACHE_BUSCA_WEB_TTL_LONGO", 24 * 60 * 60))
+# Por quanto tempo, depois de vencida, uma entrada ainda pode ser servida (em múltiplos do TTL)
+FATOR_STALE = float(os.getenv("CACHE_BUSCA_WEB_FATOR_STALE", 1.0))
+
+PALAVRAS_VOLATEIS = (
+    "hoje", "agora", "ontem", "amanha", "ao vivo", "resultado", "placar", "jogo",
+    "cotacao", "noticia", "ultima", "ultimas", "atual", "previsao", "tempo em",
+)
+
+LIMPAR_A_CADA_ESCRITAS = 200
+
+def ttl_para(consulta_normalizada):
+    if any(palavra in consulta_normalizada for palavra in PALAVRAS_VOLATEIS):
+        return TTL_CURTO
+    return TTL_LONGO
+
+class CacheBuscaWeb:
+    def __init__(self, caminho=CAMINHO_CACHE, fator_stale=FATOR_STALE):
+        self.caminho = caminho
+        self.fator_stale = fator_stale
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._atualizando = set()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cache-busca-web")
+        self._escritas = 0
+        self._contadores = {
+            "acertos": 0,
+            "acertos_stale": 0,
+            "falhas": 0,
+            "atualizacoes_fundo": 0,
+            "erros_sqlite": 0,
+        }
+        self._criar_tabela()
+
+    def _conexao(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.caminho, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _criar_tabela(self):
+        conn = self._conexao()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS buscas (
+                chave TEXT PRIMARY KEY,
+                resultado TEXT NOT NULL,
+                criado_em REAL NOT NULL,
+                expira_em REAL NOT NULL,
+                stale_ate REAL NOT NULL
+            )
+        """)
+        conn.commit()
+
+    def _contar(self, nome):
+        with self._lock:
+            self._contadores[nome] += 1
+
+    def _ler(self, chave):
+        try:
+            return self._conexao().execute(
+                "SELECT resultado, expira_em, stale_ate FROM buscas WHERE chave = ?", (chave,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            self._contar("erros_sqlite")
+            print(f"⚠️ Cache busca web: erro de leitura: {e}")
+            return None
+
+    def _gravar(self, chave, consulta_normalizada, resultado):
+        agora = time.time()
+        ttl = ttl_para(consulta_normalizada)
+        try:
+            conn = self._conexao()
+            conn.execute(
+                "INSERT OR REPLACE INTO buscas (chave, resultado, criado_em, expira_em, stale_ate) VALUES (?, ?, ?, ?, ?)",
+                (chave, resultado, agora, agora + ttl, agora + ttl * (1 + self.fator_stale)),
+            )
+            with self._lock:
+                self._escritas += 1
+                limpar = self._escritas % LIMPAR_A_CADA_ESCRITAS == 0
+            if limpar:
+                conn.execute("DELETE FROM buscas WHERE stale_ate < ?", (agora,))
+            conn.commit()
+        except sqlite3.Error as e:
+            self._contar("erros_sqlite")
+            print(f"⚠️ Cache busca web: erro de escrita: {e}")
+
+    def _atualizar_em_fundo(self, chave, consulta, consulta_normalizada, buscar):
+        with self._lock:
+            if chave in self._atualizando:
+                return
+            self._atualizando.add(chave)
+
+        def tarefa():
+            try:
+                resultado = buscar(consulta)
+                if resultado is not None:
+                    self._gravar(chave, consulta_normalizada, resultado)
+                self._contar("atualizacoes_fundo")
+            finally:
+                with self._lock:
+                    self._atualizando.discard(chave)
+
+        self._executor.submit(tarefa)
+
+    def obter_ou_buscar(self, consulta, hl, gl, buscar):
+        """Devolve o resultado em cache para (consulta, hl, gl) ou chama `buscar(consulta)`.
+
+        Resultados None (erro ou sem trechos) não são guardados.
+        """
+        consulta_normalizada = normalizar_pergunta(consulta)
+        chave = f"{hl}|{gl}|{consulta_normalizada}"
+        agora = time.time()
+
+        linha = self._ler(chave)
+        if linha is not None:
+            resultado, expira_em, stale_ate = linha
+            if agora < expira_em:
+                self._contar("acertos")
+                return resultado
+            if agora < stale_ate:
+                self._contar("acertos_stale")
+                self._atualizar_em_fundo(chave, consulta, consulta_normalizada, buscar)
+                return resultado
+
+        self._contar("falhas")
+        resultado = buscar(consulta)
+        if resultado is not None:
+            self._gravar(chave, consulta_normalizada, resultado)
+        return resultado
+
+    def estatisticas(self):
+        with self._lock:
+            dados = dict(self._contadores)
+            dados["atualizando_agora"] = len(self._atualizando)
+        consultas = dados["acertos"] + dados["acertos_stale"] + dados["falhas"]
+        dados["taxa_acerto"] = (dados["acertos"] + dados["acertos_stale"]) / consultas if consultas else 0.0
+        return dados
@@ -0,0 +1,84 @@
+"""Cache em memória de respostas do LLM, por hash do prompt final.
+
+Limitado em bytes (não em número de entradas), com TTL por entrada e
+despejo LRU. Só faz sentido para prompts totalmente determinados pela
+entrada, como os do endpoint anônimo (sem histórico nem memórias).
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+LIMITE_BYTES = int(os.getenv("CACHE_RESPOSTAS_LIMITE_BYTES", 32 * 1024 * 1024))
+TTL_PADRAO = int(os.getenv("CACHE_RESPOSTAS_TTL", 6 * 60 * 60))
+# Respostas que usaram contexto da web envelhecem rápido; 0 desliga o cache para elas
+TTL_WEB = int(os.getenv("CACHE_RESPOSTAS_TTL_WEB", 5 * 60))
+# Custo fixo estimado por entrada (chave, tupla, nó do OrderedDict)
+SOBRECARGA_ENTRADA = 200
+
+class CacheRespostas:
+    def __init__(self, limite_bytes=LIMITE_BYTES, ttl_padrao=TTL_PADRAO):
+        self.limite_bytes = limite_bytes
+        self.ttl_padrao = ttl_padrao
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()
+        self._bytes = 0
+        self.acertos = 0
+        self.falhas = 0
+        self.expiradas = 0
+        self.despejadas = 0
+        self._tempo_economizado = 0.0
+
+    def _remover(self, chave):
+        _, _, tamanho, _ = self._entradas.pop(chave)
+        self._bytes -= tamanho
+
+    def obter(self, chave):
+        agora = time.monotonic()
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is None:
+                self.falhas += 1
+                return None
+            resposta, expira_em, _, custo = entrada
+            if agora >= expira_em:
+                self._remover(chave)
+                self.expiradas += 1
+                self.falhas += 1
+                return None
+            self._entradas.move_to_end(chave)
+            self.acertos += 1
+            self._tempo_economizado += custo
+            return resposta
+
+    def guardar(self, chave, resposta, ttl=None, custo=0.0):
+        """Guarda `resposta` por `ttl` segundos; `custo` é o tempo que ela levou para ser gerada."""
+        ttl = self.ttl_padrao if ttl is None else ttl
+        tamanho = len(resposta.encode("utf-8")) + len(chave) + SOBRECARGA_ENTRADA
+        if ttl <= 0 or tamanho > self.limite_bytes:
+            return
+
+        with self._lock:
+            if chave in self._entradas:
+                self._remover(chave)
+            self._entradas[chave] = (resposta, time.monotonic() + ttl, tamanho, custo)
+            self._bytes += tamanho
+            while self._bytes > self.limite_bytes:
+                chave_antiga = next(iter(self._entradas))
+                self._remover(chave_antiga)
+                self.despejadas += 1
+
+    def estatisticas(self):
+        with self._lock:
+            consultas = self.acertos + self.falhas
+            return {
+                "entradas": len(self._entradas),
+                "bytes": self._bytes,
+                "limite_bytes": self.limite_bytes,
+                "acertos": self.acertos,
+                "falhas": self.falhas,
+                "expiradas": self.expiradas,
+                "despejadas": self.despejadas,
+                "taxa_acerto": self.acertos / consultas if consultas else 0.0,
+                "tempo_economizado_ms": self._tempo_economizado * 1000,
+            }
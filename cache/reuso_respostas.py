@@ -0,0 +1,135 @@
+"""Reaproveitamento de respostas por similaridade com perguntas já respondidas.
+
+Cada persona tem uma matriz NumPy com os vetores (unigramas + bigramas de
+palavras, via hashing) das perguntas já respondidas sem contexto. Uma pergunta
+nova cujo cosseno com alguma delas passa do limiar recebe a resposta guardada,
+sem chamar o LLM. A matriz tem capacidade fixa e funciona como buffer circular.
+
+O cosseno sozinho não separa perguntas longas que mudam numa palavra só
+("fotossíntese" x "respiração", "50 mil" x "500 mil"). Por isso, antes do
+cosseno, termos_compativeis exige que toda palavra de conteúdo da pergunta
+guardada (tudo menos PALAVRAS_VAZIAS) apareça na nova e que os números sejam os
+mesmos. Palavras a mais, outra ordem ou outra forma de perguntar ficam para o
+limiar de similaridade decidir.
+"""
+import os
+import re
+import threading
+import zlib
+
+import numpy as np
+
+from classificadorDaWeb.normalizacao import normalizar_pergunta
+
+DIMENSAO = int(os.getenv("REUSO_DIMENSAO", 1024))
+CAPACIDADE_POR_PERSONA = int(os.getenv("REUSO_CAPACIDADE_POR_PERSONA", 2000))
+LIMIAR_SIMILARIDADE = float(os.getenv("REUSO_LIMIAR_SIMILARIDADE", 0.9))
+# Perguntas quase idênticas substituem a entrada existente em vez de ocupar outra linha
+LIMIAR_DUPLICATA = 0.99
+
+_PALAVRA = re.compile(r"\w+")
+
+# Artigos, preposições e formas de perguntar que não mudam o assunto (já normalizados).
+# Negação e interrogativos como "quando", "onde", "por" ficam de fora: mudam a resposta.
+PALAVRAS_VAZIAS = frozenset("""
+    a o as os um uma uns umas de da do das dos em na no nas nos para pra pro
+    ao aos e eh que qual quais me mim sobre voce vc favor
+""".split())
+
+def termos_conteudo(pergunta):
+    """Palavras de conteúdo e números da pergunta, para a checagem léxica."""
+    return frozenset(p for p in _PALAVRA.findall(normalizar_pergunta(pergunta)) if p not in PALAVRAS_VAZIAS)
+
+def termos_compativeis(guardados, novos):
+    """A pergunta nova cobre o assunto da guardada: nenhum termo dela some e nenhum número muda."""
+    return guardados <= novos and {t for t in guardados if t.isdigit()} == {t for t in novos if t.isdigit()}
+
+def vetorizar(pergunta, dimensao=DIMENSAO):
+    palavras = _PALAVRA.findall(normalizar_pergunta(pergunta))
+    termos = palavras + [f"{a} {b}" for a, b in zip(palavras, palavras[1:])]
+    vetor = np.zeros(dimensao, dtype=np.float32)
+    for termo in termos:
+        h = zlib.crc32(termo.encode("utf-8"))
+        # O bit de sinal evita que colisões do hashing sempre somem
+        vetor[h % dimensao] += 1.0 if (h >> 31) & 1 else -1.0
+    norma = np.linalg.norm(vetor)
+    return vetor / norma if norma else vetor
+
+class _IndicePersona:
+    def __init__(self, dimensao, capacidade):
+        self.matriz = np.zeros((capacidade, dimensao), dtype=np.float32)
+        self.respostas = [None] * capacidade
+        self.termos = [None] * capacidade
+        self.tamanho = 0
+        self.proxima = 0
+
+    def mais_parecida(self, vetor, termos, limiar):
+        """Posição da entrada mais parecida acima do limiar com termos compatíveis, ou -1."""
+        if not self.tamanho:
+            return -1
+        similaridades = self.matriz[:self.tamanho] @ vetor
+        candidatas = np.flatnonzero(similaridades >= limiar)
+        for indice in candidatas[np.argsort(-similaridades[candidatas])]:
+            if termos_compativeis(self.termos[indice], termos):
+                return int(indice)
+        return -1
+
+    def adicionar(self, vetor, termos, resposta):
+        indice = self.mais_parecida(vetor, termos, LIMIAR_DUPLICATA)
+        if indice < 0:
+            indice = self.proxima
+            self.proxima = (self.proxima + 1) % len(self.respostas)
+            self.tamanho = min(self.tamanho + 1, len(self.respostas))
+        self.matriz[indice] = vetor
+        self.respostas[indice] = resposta
+        self.termos[indice] = termos
+
+class IndiceRespostas:
+    def __init__(self, dimensao=DIMENSAO, capacidade=CAPACIDADE_POR_PERSONA, limiar=LIMIAR_SIMILARIDADE):
+        self.dimensao = dimensao
+        self.capacidade = capacidade
+        self.limiar = limiar
+        self._lock = threading.Lock()
+        self._personas = {}
+        self.acertos = 0
+        self.falhas = 0
+        self.adicionadas = 0
+
+    def adicionar(self, persona, pergunta, resposta):
+        vetor = vetorizar(pergunta, self.dimensao)
+        if not vetor.any():
+            return
+        with self._lock:
+            indice = self._personas.get(persona)
+            if indice is None:
+                indice = self._personas[persona] = _IndicePersona(self.dimensao, self.capacidade)
+            indice.adicionar(vetor, termos_conteudo(pergunta), resposta)
+            self.adicionadas += 1
+
+    def buscar(self, persona, pergunta):
+        """Resposta guardada para a pergunta mais parecida, se a similaridade passar do limiar e os termos forem compatíveis."""
+        vetor = vetorizar(pergunta, self.dimensao)
+        termos = termos_conteudo(pergunta)
+        with self._lock:
+            indice = self._personas.get(persona)
+            if indice is None or not vetor.any():
+                self.falhas += 1
+                return None
+            posicao = indice.mais_parecida(vetor, termos, self.limiar)
+            if posicao < 0:
+                self.falhas += 1
+                return None
+            self.acertos += 1
+            return indice.respostas[posicao]
+
+    def estatisticas(self):
+        with self._lock:
+            consultas = self.acertos + self.falhas
+            return {
+                "limiar": self.limiar,
+                "entradas_por_persona": {p: i.tamanho for p, i in self._personas.items()},
+                "adicionadas": self.adicionadas,
+                "acertos": self.acertos,
+                "falhas": self.falhas,
+                "taxa_acerto": self.acertos / consultas if consultas else 0.0,
+            }
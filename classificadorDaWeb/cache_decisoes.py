@@ -0,0 +1,91 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+_ESPACOS = re.compile(r"\s+")
+
+def chave_decisao(pergunta):
+    """Minúsculas e espaços colapsados, mantendo os acentos.
+
+    O TfidfVectorizer do classificador também passa tudo para minúsculas e
+    ignora espaços, mas não tira acentos: "cotação" e "cotacao" são termos
+    diferentes para o modelo e podem ter decisões diferentes.
+    """
+    return _ESPACOS.sub(" ", pergunta or "").strip().lower()
+
+class CacheDecisoes:
+    """LRU limitado e thread-safe de decisões do classificador.
+
+    A chave é a pergunta em minúsculas e com espaços colapsados, então
+    "Qual a cotação do dólar hoje" e "qual a cotação do dólar  hoje" compartilham
+    a mesma entrada; só entram juntas perguntas que o modelo classifica igual.
+    O cache é esvaziado sozinho quando a versão do classificador muda.
+    """
+
+    def __init__(self, classificador, capacidade):
+        self.classificador = classificador
+        self.capacidade = capacidade
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()
+        self._versao = None
+        self.acertos = 0
+        self.falhas = 0
+        self.invalidacoes = 0
+        self._tempo_total_falhas = 0.0
+
+    def _conferir_versao(self, versao):
+        if versao != self._versao:
+            if self._versao is not None:
+                self.invalidacoes += 1
+            self._entradas.clear()
+            self._versao = versao
+
+    def avaliar(self, pergunta):
+        """Retorna (decisao, probabilidade) de a pergunta precisar de busca na web."""
+        chave = chave_decisao(pergunta)
+        versao = self.classificador.versao
+
+        with self._lock:
+            self._conferir_versao(versao)
+            resultado = self._entradas.get(chave)
+            if resultado is not None:
+                self._entradas.move_to_end(chave)
+                self.acertos += 1
+                return resultado
+
+        inicio = time.perf_counter()
+        decisoes, probabilidades = self.classificador.prever_lote([pergunta])
+        duracao = time.perf_counter() - inicio
+        resultado = (decisoes[0], probabilidades[0])
+
+        with self._lock:
+            self.falhas += 1
+            self._tempo_total_falhas += duracao
+            # Se a versão trocou durante a classificação, o resultado não vai para o cache
+            if self._versao == versao and self.capacidade > 0:
+                self._entradas[chave] = resultado
+                self._entradas.move_to_end(chave)
+                while len(self._entradas) > self.capacidade:
+                    self._entradas.popitem(last=False)
+        return resultado
+
+    def limpar(self):
+        with self._lock:
+            self._entradas.clear()
+
+    def estatisticas(self):
+        with self._lock:
+            consultas = self.acertos + self.falhas
+            tempo_medio_falha = self._tempo_total_falhas / self.falhas if self.falhas else 0.0
+            return {
+                "versao": self._versao,
+                "tamanho": len(self._entradas),
+                "capacidade": self.capacidade,
+                "acertos": self.acertos,
+                "falhas": self.falhas,
+                "invalidacoes": self.invalidacoes,
+                "taxa_acerto": self.acertos / consultas if consultas else 0.0,
+                "tempo_medio_classificacao_ms": tempo_medio_falha * 1000,
+                "tempo_economizado_ms": self.acertos * tempo_medio_falha * 1000,
+            }
@@ -1,55 +1,190 @@
-import random
 import csv
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.linear_model import LogisticRegression
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import classification_report
-import joblib
+import hashlib
+import json
+import threading
+import time
 import os
+import numpy as np
+from classificadorDaWeb.compacto import ClassificadorCompacto
+from classificadorDaWeb.cache_decisoes import CacheDecisoes
+import metricas
 
 def carregar_dados_csv(arquivo):
     perguntas = []
     rotulos = []
-    
+
     with open(arquivo, mode='r', encoding='utf-8') as file:
         reader = csv.reader(file)
         next(reader)
         for row in reader:
             perguntas.append(row[0])
             rotulos.append(int(row[1]))
-    
-    return perguntas, rotulos
 
-import os
+    return perguntas, rotulos
 
 BASE_DIR = os.path.dirname(__file__)
 CAMINHO_CSV = os.path.join(BASE_DIR, "dados.csv")
+ARTEFATOS_DIR = os.getenv("CLASSIFICADOR_ARTEFATOS_DIR", os.path.join(BASE_DIR, "artefatos"))
+NOME_MANIFEST = "manifest.json"
+
+# De quanto em quanto tempo (segundos) o classificador confere se há artefatos novos em disco
+INTERVALO_VERIFICACAO = float(os.getenv("CLASSIFICADOR_INTERVALO_VERIFICACAO", 5))
+
+# "compacto" (NumPy puro, padrão quando o manifest tem o .npz) ou "sklearn" (pickles)
+FORMATO = os.getenv("CLASSIFICADOR_FORMATO", "compacto")
+
+# Quantas perguntas normalizadas distintas ficam no cache de decisões (0 desliga)
+CAPACIDADE_CACHE = int(os.getenv("CLASSIFICADOR_CAPACIDADE_CACHE", 5000))
+
+class ArtefatoInvalidoError(Exception):
+    pass
+
+def verificar_artefato(artefatos_dir, info):
+    caminho = os.path.join(artefatos_dir, info["caminho"])
+    with open(caminho, "rb") as f:
+        conteudo = f.read()
+    if hashlib.sha256(conteudo).hexdigest() != info["sha256"]:
+        raise ArtefatoInvalidoError(f"Checksum inválido para {caminho}")
+    return caminho
+
+def carregar_artefato(artefatos_dir, info):
+    # joblib (e com ele sklearn/scipy) só é importado quando os pickles são realmente usados
+    import joblib
+    return joblib.load(verificar_artefato(artefatos_dir, info))
+
+class PontuadorSklearn:
+    def __init__(self, modelo, vetor):
+        self.modelo = modelo
+        self.vetor = vetor
+
+    def pontuar(self, perguntas):
+        return self.modelo.decision_function(self.vetor.transform(perguntas))
+
+class ClassificadorBuscaWeb:
+    """Mantém modelo e vetor carregados uma única vez por processo.
+
+    A versão servida é sempre a apontada pelo manifest.json gerado por
+    `python -m classificadorDaWeb.treinar`. O par (versao, pontuador) fica
+    numa única tupla, trocada de uma vez só: as threads do waitress sempre
+    enxergam um estado consistente, mesmo durante um recarregamento.
+    """
 
-perguntas, rotulos = carregar_dados_csv(CAMINHO_CSV)
+    def __init__(self, artefatos_dir=ARTEFATOS_DIR, intervalo_verificacao=INTERVALO_VERIFICACAO, formato=FORMATO):
+        self.artefatos_dir = artefatos_dir
+        self.formato = formato
+        self.caminho_manifest = os.path.join(artefatos_dir, NOME_MANIFEST)
+        self.intervalo_verificacao = intervalo_verificacao
+        self._lock = threading.Lock()
+        self._estado = None
+        self._assinatura_manifest = None
+        self._proxima_verificacao = 0.0
 
-random.shuffle(list(zip(perguntas, rotulos)))
+    def _ler_manifest(self):
+        with open(self.caminho_manifest, encoding="utf-8") as f:
+            return json.load(f)
 
-vetor = TfidfVectorizer()
-X = vetor.fit_transform(perguntas)
-y = rotulos
+    def _carregar(self, manifest):
+        arquivos = manifest["arquivos"]
+        if self.formato == "compacto" and "compacto" in arquivos:
+            pontuador = ClassificadorCompacto(verificar_artefato(self.artefatos_dir, arquivos["compacto"]))
+        else:
+            modelo = carregar_artefato(self.artefatos_dir, arquivos["modelo"])
+            vetor = carregar_artefato(self.artefatos_dir, arquivos["vetor"])
+            pontuador = PontuadorSklearn(modelo, vetor)
+        return (manifest["versao"], pontuador)
+
+    def _estado_atual(self):
+        agora = time.monotonic()
+        estado = self._estado
+        if estado is not None and agora < self._proxima_verificacao:
+            return estado
+
+        with self._lock:
+            estado = self._estado
+            if estado is not None and agora < self._proxima_verificacao:
+                return estado
+
+            # Atualiza o prazo antes de carregar: as outras threads seguem com o estado antigo sem esperar
+            self._proxima_verificacao = agora + self.intervalo_verificacao
+
+            try:
+                info = os.stat(self.caminho_manifest)
+                assinatura = (info.st_mtime_ns, info.st_size)
+                if estado is not None and assinatura == self._assinatura_manifest:
+                    return estado
+
+                manifest = self._ler_manifest()
+                if estado is None or manifest["versao"] != estado[0]:
+                    self._estado = self._carregar(manifest)
+                    print(f"✅ Classificador carregado (versão {manifest['versao']})")
+                self._assinatura_manifest = assinatura
+            except Exception as e:
+                if estado is None:
+                    if isinstance(e, FileNotFoundError):
+                        raise FileNotFoundError(
+                            f"Manifest do classificador não encontrado em {self.caminho_manifest}. "
+                            "Rode: python -m classificadorDaWeb.treinar"
+                        ) from e
+                    raise
+                print(f"⚠️ Erro ao recarregar classificador, mantendo versão {estado[0]}: {e}")
+
+            return self._estado
 
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.3, random_state=42)
+    @property
+    def versao(self):
+        return self._estado_atual()[0]
 
-modelo = LogisticRegression()
-modelo.fit(X_train, y_train)
+    def prever(self, pergunta):
+        _, pontuador = self._estado_atual()
+        return bool(pontuador.pontuar([pergunta])[0] > 0)
 
-y_pred = modelo.predict(X_test)
-print("Relatório de Classificação:")
-print(classification_report(y_test, y_pred))
+    def prever_lote(self, perguntas):
+        """Classifica várias perguntas numa única passada vetorizada.
 
-joblib.dump(modelo, "modelo_busca_web.pkl")
-joblib.dump(vetor, "vetor_busca_web.pkl")
+        Retorna (decisoes, probabilidades), na mesma ordem de `perguntas`;
+        probabilidades é a chance estimada de a pergunta precisar de busca na web.
+        """
+        perguntas = list(perguntas)
+        if not perguntas:
+            return [], []
+        _, pontuador = self._estado_atual()
+        pontuacoes = np.asarray(pontuador.pontuar(perguntas), dtype=np.float64)
+        # Mesmo critério do predict() da regressão logística binária
+        decisoes = (pontuacoes > 0).tolist()
+        probabilidades = 1.0 / (1.0 + np.exp(-pontuacoes))
+        return decisoes, probabilidades.tolist()
+
+_classificador = ClassificadorBuscaWeb()
+_cache_decisoes = CacheDecisoes(_classificador, CAPACIDADE_CACHE)
+metricas.registrar_fonte("cache_classificador", _cache_decisoes.estatisticas)
+
+def obter_classificador():
+    return _classificador
+
+def avaliar_busca_web(pergunta):
+    """Retorna (decisao, probabilidade) de a pergunta precisar de busca na web."""
+    return _cache_decisoes.avaliar(pergunta)
+
+def avaliar_busca_web_com_historico(pergunta, historico):
+    """(decisao, probabilidade) da pergunta lida junto com a última pergunta do histórico.
+
+    Vai direto ao classificador: o texto combinado não é uma pergunta de
+    usuário e não entra no cache de decisões.
+    """
+    ultima_pergunta = (historico[-1].get('pergunta') or '') if historico else ''
+    decisoes, probabilidades = _classificador.prever_lote([f"{ultima_pergunta} {pergunta}".strip()])
+    return decisoes[0], probabilidades[0]
 
 def deve_buscar_na_web(pergunta):
-    modelo = joblib.load("modelo_busca_web.pkl")
-    vetor = joblib.load("vetor_busca_web.pkl")
-    entrada = vetor.transform([pergunta])
-    return bool(modelo.predict(entrada)[0])
+    decisao, _ = avaliar_busca_web(pergunta)
+    return decisao
+
+def probabilidade_busca_web(pergunta):
+    _, probabilidade = avaliar_busca_web(pergunta)
+    return probabilidade
+
+def deve_buscar_na_web_lote(perguntas):
+    return _classificador.prever_lote(perguntas)
 
 #Teste:
 if __name__ == "__main__":
@@ -0,0 +1,136 @@
+"""Formato compacto do classificador (.npz) e pontuador em NumPy puro.
+
+Guarda só o necessário para reproduzir TfidfVectorizer + LogisticRegression:
+vocabulário, pesos idf, coeficientes e intercepto. Servir a partir dele não
+importa scikit-learn, scipy nem joblib.
+
+Conferência de paridade com o modelo sklearn da versão atual:
+    python -m classificadorDaWeb.compacto
+"""
+import re
+
+import numpy as np
+
+class FormatoNaoSuportadoError(Exception):
+    pass
+
+def exportar_compacto(modelo, vetor, caminho):
+    """Exporta um par (LogisticRegression, TfidfVectorizer) já treinado para `caminho` (.npz)."""
+    configuracao_suportada = (
+        vetor.analyzer == "word"
+        and tuple(vetor.ngram_range) == (1, 1)
+        and vetor.norm == "l2"
+        and vetor.use_idf
+        and not vetor.sublinear_tf
+        and not vetor.binary
+        and vetor.strip_accents is None
+        and vetor.stop_words is None
+        and vetor.preprocessor is None
+        and vetor.tokenizer is None
+    )
+    if not configuracao_suportada:
+        raise FormatoNaoSuportadoError("Configuração do TfidfVectorizer não suportada pelo formato compacto")
+    if list(modelo.classes_) != [0, 1]:
+        raise FormatoNaoSuportadoError(f"Classes inesperadas no modelo: {list(modelo.classes_)}")
+
+    termos = sorted(vetor.vocabulary_, key=vetor.vocabulary_.get)
+    np.savez_compressed(
+        caminho,
+        termos=np.array(termos),
+        idf=vetor.idf_.astype(np.float64),
+        coeficientes=modelo.coef_[0].astype(np.float64),
+        intercepto=np.float64(modelo.intercept_[0]),
+        token_pattern=np.array(vetor.token_pattern),
+        lowercase=np.bool_(vetor.lowercase),
+    )
+
+class ClassificadorCompacto:
+    """Reproduz vetor.transform + modelo.decision_function a partir do .npz exportado."""
+
+    def __init__(self, caminho):
+        with np.load(caminho, allow_pickle=False) as dados:
+            termos = dados["termos"].tolist()
+            self.idf = dados["idf"]
+            self.coeficientes = dados["coeficientes"]
+            self.intercepto = float(dados["intercepto"])
+            self.lowercase = bool(dados["lowercase"])
+            self.padrao_token = re.compile(str(dados["token_pattern"]))
+        self.vocabulario = {termo: i for i, termo in enumerate(termos)}
+        # idf * coef pré-calculado: cada termo contribui com contagem * peso_idf * coef
+        self.peso_idf_coef = self.idf * self.coeficientes
+
+    def pontuar(self, perguntas):
+        """Equivalente ao decision_function do sklearn: valores > 0 indicam busca na web.
+
+        Só a tokenização é feita pergunta a pergunta; contagens, normas e produtos
+        com os coeficientes são calculados de uma vez para o lote inteiro.
+        """
+        linhas = []
+        indices = []
+        for linha, pergunta in enumerate(perguntas):
+            if self.lowercase:
+                pergunta = pergunta.lower()
+            for token in self.padrao_token.findall(pergunta):
+                indice = self.vocabulario.get(token)
+                if indice is not None:
+                    linhas.append(linha)
+                    indices.append(indice)
+
+        total = len(perguntas)
+        pontuacoes = np.full(total, self.intercepto, dtype=np.float64)
+        if not indices:
+            return pontuacoes
+
+        # Cada par (linha, termo) distinto vira uma entrada da matriz tf-idf esparsa
+        tamanho_vocabulario = len(self.idf)
+        pares, tf = np.unique(
+            np.asarray(linhas, dtype=np.int64) * tamanho_vocabulario + np.asarray(indices, dtype=np.int64),
+            return_counts=True,
+        )
+        linhas_pares = pares // tamanho_vocabulario
+        termos_pares = pares % tamanho_vocabulario
+        tf = tf.astype(np.float64)
+
+        tfidf = tf * self.idf[termos_pares]
+        normas = np.sqrt(np.bincount(linhas_pares, weights=tfidf * tfidf, minlength=total))
+        numeradores = np.bincount(linhas_pares, weights=tf * self.peso_idf_coef[termos_pares], minlength=total)
+        com_termos = normas > 0
+        pontuacoes[com_termos] += numeradores[com_termos] / normas[com_termos]
+        return pontuacoes
+
+def conferir_paridade(perguntas, modelo, vetor, compacto):
+    entrada = vetor.transform(perguntas)
+    esperadas = modelo.predict(entrada).astype(bool)
+    probabilidades_esperadas = modelo.predict_proba(entrada)[:, 1]
+
+    pontuacoes = compacto.pontuar(perguntas)
+    obtidas = pontuacoes > 0
+    probabilidades = 1.0 / (1.0 + np.exp(-pontuacoes))
+
+    divergencias = int(np.sum(esperadas != obtidas))
+    maior_diferenca = float(np.max(np.abs(probabilidades - probabilidades_esperadas)))
+    return divergencias, maior_diferenca
+
+if __name__ == "__main__":
+    import json
+    import os
+
+    from classificadorDaWeb.classificador_busca_web import (
+        ARTEFATOS_DIR, CAMINHO_CSV, NOME_MANIFEST, carregar_artefato, carregar_dados_csv
+    )
+
+    with open(os.path.join(ARTEFATOS_DIR, NOME_MANIFEST), encoding="utf-8") as f:
+        manifest = json.load(f)
+    arquivos = manifest["arquivos"]
+    modelo = carregar_artefato(ARTEFATOS_DIR, arquivos["modelo"])
+    vetor = carregar_artefato(ARTEFATOS_DIR, arquivos["vetor"])
+    compacto = ClassificadorCompacto(os.path.join(ARTEFATOS_DIR, arquivos["compacto"]["caminho"]))
+
+    perguntas, _ = carregar_dados_csv(CAMINHO_CSV)
+    perguntas += ["", "oi", "QUAL A COTAÇÃO DO DÓLAR HOJE???", "palavra_que_nao_existe_no_vocabulario"]
+    divergencias, maior_diferenca = conferir_paridade(perguntas, modelo, vetor, compacto)
+    print(f"Versão {manifest['versao']}: {len(perguntas)} perguntas, {divergencias} divergências, "
+          f"maior diferença de probabilidade {maior_diferenca:.2e}")
+    if divergencias or maior_diferenca > 1e-9:
+        raise SystemExit("❌ Formato compacto diverge do modelo sklearn")
+    print("✅ Formato compacto reproduz o modelo sklearn")
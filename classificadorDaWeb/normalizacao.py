@@ -0,0 +1,10 @@
+import re
+import unicodedata
+
+_ESPACOS = re.compile(r"\s+")
+
+def normalizar_pergunta(texto):
+    """Forma canônica de uma pergunta: minúsculas, sem acentos e com espaços colapsados."""
+    texto = unicodedata.normalize("NFKD", texto or "")
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return _ESPACOS.sub(" ", texto).strip().lower()
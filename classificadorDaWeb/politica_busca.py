@@ -0,0 +1,123 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Abaixo desta probabilidade a busca nunca é feita; entre ela e 0.5 a busca é especulativa
+LIMIAR_ESPECULACAO = float(os.getenv("BUSCA_WEB_LIMIAR_ESPECULACAO", 0.3))
+MAX_BUSCAS_PARALELAS = int(os.getenv("BUSCA_WEB_MAX_PARALELAS", 8))
+
+class BuscaPendente:
+    def __init__(self, politica, pergunta, decisao, probabilidade, futuro, candidata=False):
+        self.politica = politica
+        self.pergunta = pergunta
+        self.decisao = decisao
+        self.probabilidade = probabilidade
+        self.futuro = futuro
+        # Candidata: probabilidade entre o limiar de especulação e 0.5, busca ainda não disparada
+        self.candidata = candidata
+        self.especulativa = False
+
+    def especular(self, historico):
+        """Dispara a busca de uma candidata, se a conversa tem turnos para confirmá-la depois."""
+        if not self.candidata or not historico:
+            return
+        self.candidata = False
+        self.especulativa = True
+        self.politica._contar("especulativas")
+        self.futuro = self.politica._executor.submit(self.politica._buscar_sem_erro, self.pergunta)
+
+    def descartar(self):
+        """O turno não vai usar a busca (ex.: usuário sem persona)."""
+        if self.futuro is not None:
+            self.futuro.cancel()
+            self.futuro = None
+
+    def resultado(self, historico=None):
+        """Decisão final e contexto web (ou None).
+
+        A decisão final é sempre do classificador: uma busca especulativa só é
+        aproveitada se a pergunta, reavaliada junto com o último turno do
+        histórico, passar a pedir busca; caso contrário o resultado é descartado.
+        """
+        if self.candidata:
+            # Candidata que não chegou a especular: primeiro turno ou rota sem histórico
+            self.candidata = False
+            self.politica._contar("puladas")
+        if self.futuro is None:
+            return None
+
+        if self.especulativa:
+            decisao, _ = self.politica.reavaliar(self.pergunta, historico)
+            if not decisao:
+                self.futuro.cancel()
+                self.politica._contar("desperdicadas")
+                return None
+            self.politica._contar("confirmadas")
+
+        return self.futuro.result()
+
+class PoliticaBuscaEspeculativa:
+    """Dispara a busca na web em paralelo com o restante do turno (carga do banco etc).
+
+    - probabilidade > 0.5: a busca começa na hora e o resultado é usado;
+    - entre LIMIAR_ESPECULACAO e 0.5: a busca começa (BuscaPendente.especular)
+      assim que se sabe que a conversa tem turnos, e só é usada se o
+      classificador, com o último turno junto, confirmar a necessidade;
+    - abaixo de LIMIAR_ESPECULACAO: nenhuma busca.
+
+    reavaliar(pergunta, historico) -> (decisao, probabilidade) não deve gravar
+    no cache de decisões: o texto reavaliado não é uma pergunta de usuário.
+    """
+
+    def __init__(self, buscar, avaliar, reavaliar, limiar_especulacao=LIMIAR_ESPECULACAO,
+                 max_paralelas=MAX_BUSCAS_PARALELAS):
+        self.buscar = buscar
+        self.avaliar = avaliar
+        self.reavaliar = reavaliar
+        self.limiar_especulacao = limiar_especulacao
+        self._executor = ThreadPoolExecutor(max_workers=max_paralelas, thread_name_prefix="busca-web")
+        self._lock = threading.Lock()
+        self._contadores = {
+            "diretas": 0,
+            "especulativas": 0,
+            "confirmadas": 0,
+            "desperdicadas": 0,
+            "puladas": 0,
+        }
+
+    def _contar(self, nome):
+        with self._lock:
+            self._contadores[nome] += 1
+
+    def _buscar_sem_erro(self, pergunta):
+        try:
+            return self.buscar(pergunta)
+        except Exception as e:
+            print(f"⚠️ Erro na busca web: {e}")
+            return None
+
+    def iniciar(self, pergunta):
+        """Classifica a pergunta e, se ela pede busca, já dispara a busca em segundo plano.
+
+        Perguntas na faixa de especulação voltam como candidatas: quem tem o
+        histórico da conversa chama especular(); sem isso (rotas sem conta) não há busca.
+        """
+        decisao, probabilidade = self.avaliar(pergunta)
+
+        if decisao:
+            self._contar("diretas")
+            futuro = self._executor.submit(self._buscar_sem_erro, pergunta)
+            return BuscaPendente(self, pergunta, decisao, probabilidade, futuro)
+
+        if probabilidade >= self.limiar_especulacao:
+            return BuscaPendente(self, pergunta, decisao, probabilidade, None, candidata=True)
+
+        self._contar("puladas")
+        return BuscaPendente(self, pergunta, decisao, probabilidade, None)
+
+    def estatisticas(self):
+        with self._lock:
+            dados = dict(self._contadores)
+        dados["limiar_especulacao"] = self.limiar_especulacao
+        dados["taxa_desperdicio"] = dados["desperdicadas"] / dados["especulativas"] if dados["especulativas"] else 0.0
+        return dados
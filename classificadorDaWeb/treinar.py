@@ -0,0 +1,118 @@
+"""Treino offline do classificador de busca na web.
+
+Gera uma versão nova dos artefatos em ARTEFATOS_DIR/<versao>/ e só depois
+aponta o manifest.json para ela. O servidor apenas lê o manifest.
+
+Uso (na raiz do projeto): python -m classificadorDaWeb.treinar [--dados CSV] [--saida DIR]
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from datetime import datetime
+
+import joblib
+import sklearn
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import accuracy_score, classification_report
+from sklearn.model_selection import train_test_split
+
+from classificadorDaWeb.classificador_busca_web import (
+    ARTEFATOS_DIR, CAMINHO_CSV, NOME_MANIFEST, carregar_dados_csv
+)
+from classificadorDaWeb.compacto import exportar_compacto
+
+def sha256_arquivo(caminho):
+    h = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for bloco in iter(lambda: f.read(65536), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+def medir_latencia(modelo, vetor, perguntas):
+    tempos = []
+    for pergunta in perguntas:
+        inicio = time.perf_counter()
+        modelo.predict(vetor.transform([pergunta]))
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    tempos.sort()
+    return {
+        "p50_ms": round(tempos[len(tempos) // 2], 4),
+        "p95_ms": round(tempos[max(int(len(tempos) * 0.95) - 1, 0)], 4),
+    }
+
+def escrever_json_atomico(caminho, dados):
+    temporario = caminho + ".tmp"
+    with open(temporario, "w", encoding="utf-8") as f:
+        json.dump(dados, f, ensure_ascii=False, indent=2)
+    os.replace(temporario, caminho)
+
+def treinar(caminho_csv=CAMINHO_CSV, artefatos_dir=ARTEFATOS_DIR):
+    perguntas, rotulos = carregar_dados_csv(caminho_csv)
+
+    p_train, p_test, y_train, y_test = train_test_split(perguntas, rotulos, test_size=0.3, random_state=42)
+
+    vetor = TfidfVectorizer()
+    vetor.fit(perguntas)
+
+    modelo = LogisticRegression()
+    modelo.fit(vetor.transform(p_train), y_train)
+
+    y_pred = modelo.predict(vetor.transform(p_test))
+    print("Relatório de Classificação:")
+    print(classification_report(y_test, y_pred))
+
+    os.makedirs(artefatos_dir, exist_ok=True)
+    base_versao = datetime.now().strftime("%Y%m%d-%H%M%S")
+    versao, sufixo = base_versao, 1
+    while os.path.exists(os.path.join(artefatos_dir, versao)):
+        sufixo += 1
+        versao = f"{base_versao}-{sufixo}"
+    pasta_versao = os.path.join(artefatos_dir, versao)
+    os.makedirs(pasta_versao)
+
+    arquivos = {}
+    for nome, objeto in (("modelo", modelo), ("vetor", vetor)):
+        caminho = os.path.join(pasta_versao, f"{nome}.pkl")
+        joblib.dump(objeto, caminho)
+        arquivos[nome] = {
+            "caminho": os.path.join(versao, f"{nome}.pkl"),
+            "sha256": sha256_arquivo(caminho),
+        }
+
+    caminho_compacto = os.path.join(pasta_versao, "compacto.npz")
+    exportar_compacto(modelo, vetor, caminho_compacto)
+    arquivos["compacto"] = {
+        "caminho": os.path.join(versao, "compacto.npz"),
+        "sha256": sha256_arquivo(caminho_compacto),
+    }
+
+    manifest = {
+        "versao": versao,
+        "criado_em": datetime.now().isoformat(timespec="seconds"),
+        "sklearn": sklearn.__version__,
+        "arquivos": arquivos,
+        "metricas": {
+            "acuracia": round(accuracy_score(y_test, y_pred), 4),
+            "amostras_treino": len(p_train),
+            "amostras_teste": len(p_test),
+            "latencia_inferencia": medir_latencia(modelo, vetor, p_test),
+        },
+    }
+
+    escrever_json_atomico(os.path.join(pasta_versao, NOME_MANIFEST), manifest)
+    # Publica por último: o servidor só enxerga a versão nova quando tudo já está em disco
+    escrever_json_atomico(os.path.join(artefatos_dir, NOME_MANIFEST), manifest)
+
+    print(f"✅ Versão {versao} publicada em {artefatos_dir}")
+    print(json.dumps(manifest["metricas"], indent=2))
+    return manifest
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Treina o classificador de busca na web")
+    parser.add_argument("--dados", default=CAMINHO_CSV, help="CSV com colunas pergunta,rótulo")
+    parser.add_argument("--saida", default=ARTEFATOS_DIR, help="Pasta dos artefatos versionados")
+    args = parser.parse_args()
+    treinar(args.dados, args.saida)
@@ -0,0 +1,130 @@
+"""Cauda das conversas em memória: os últimos turnos de cada conversa ativa.
+
+O prompt só usa os TURNOS_NO_PROMPT turnos mais recentes. Em vez de ler a
+conversa inteira a cada turno, a primeira leitura busca só a cauda no banco
+(ORDER BY criado_em DESC LIMIT k) junto com o total de turnos. Depois disso,
+cada turno salvo é anexado aqui, e os turnos seguintes da mesma conversa não
+consultam o histórico no banco.
+
+O cache é do processo: vale enquanto os turnos de uma conversa passam pelo
+mesmo processo (um servidor waitress). Mesmo assim, cada entrada expira
+depois de TTL segundos sem uso, para limitar o quanto pode ficar
+desatualizada se houver outro processo escrevendo.
+
+Um turno gravado enquanto outra requisição lê a cauda do banco não pode se
+perder: quem lê pega uma marca() antes do SELECT, e guardar() recusa a cópia
+se a conversa recebeu turno depois da marca ou se já há uma entrada mais nova.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+# Turnos mais recentes que entram no prompt; cobre a janela do resumo (RESUMO_TURNOS_RECENTES + RESUMO_INTERVALO_TURNOS)
+TURNOS_NO_PROMPT = int(os.getenv("HISTORICO_TURNOS_NO_PROMPT", 10))
+MAX_CONVERSAS = int(os.getenv("HISTORICO_MAX_CONVERSAS", 1000))
+TTL = float(os.getenv("HISTORICO_TTL", 900))
+
+class _Cauda:
+    __slots__ = ("turnos", "total", "usada_em")
+
+    def __init__(self, turnos, total, tamanho):
+        self.turnos = deque(turnos, maxlen=tamanho)
+        self.total = total
+        self.usada_em = time.monotonic()
+
+class CaudaConversas:
+    """Buffer circular dos últimos turnos por conversa, com LRU entre conversas."""
+
+    def __init__(self, tamanho=TURNOS_NO_PROMPT, max_conversas=MAX_CONVERSAS, ttl=TTL):
+        self.tamanho = tamanho
+        self.max_conversas = max_conversas
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conversas = OrderedDict()
+        # Sequência de turnos anexados; para conversas fora da memória guarda a do último turno (LRU limitado)
+        self._sequencia = 0
+        self._escritas_sem_cauda = OrderedDict()
+        # Maior sequência já esquecida de _escritas_sem_cauda: leituras mais antigas que ela não são guardadas
+        self._piso_escritas = 0
+        self.acertos = 0
+        self.faltas = 0
+        self.anexados = 0
+        self.expiradas = 0
+        self.recusadas = 0
+
+    def obter(self, conversa_id):
+        """(turnos, total de turnos da conversa) ou None se a conversa não está em memória."""
+        agora = time.monotonic()
+        with self._lock:
+            cauda = self._conversas.get(conversa_id)
+            if cauda is not None and agora - cauda.usada_em > self.ttl:
+                del self._conversas[conversa_id]
+                self.expiradas += 1
+                cauda = None
+            if cauda is None:
+                self.faltas += 1
+                return None
+            cauda.usada_em = agora
+            self._conversas.move_to_end(conversa_id)
+            self.acertos += 1
+            return list(cauda.turnos), cauda.total
+
+    def marca(self):
+        """Tomada antes de ler a cauda do banco e passada para guardar()."""
+        with self._lock:
+            return self._sequencia
+
+    def guardar(self, conversa_id, turnos, total, marca):
+        """Guarda a cauda lida do banco (turnos em ordem cronológica), se ela ainda é a mais nova."""
+        with self._lock:
+            atual = self._conversas.get(conversa_id)
+            escrita = self._escritas_sem_cauda.get(conversa_id, 0)
+            if (atual is not None and atual.total >= total) or escrita > marca or self._piso_escritas > marca:
+                # Um turno entrou durante a leitura: a próxima leitura vai ao banco de novo
+                self.recusadas += 1
+                return False
+            self._escritas_sem_cauda.pop(conversa_id, None)
+            self._conversas[conversa_id] = _Cauda(turnos, total, self.tamanho)
+            self._conversas.move_to_end(conversa_id)
+            while len(self._conversas) > self.max_conversas:
+                self._conversas.popitem(last=False)
+            return True
+
+    def anexar(self, conversa_id, pergunta, resposta):
+        """Chamado depois de gravar um turno; conversa fora da memória fica para a próxima leitura do banco."""
+        with self._lock:
+            self._sequencia += 1
+            cauda = self._conversas.get(conversa_id)
+            if cauda is None:
+                self._escritas_sem_cauda[conversa_id] = self._sequencia
+                self._escritas_sem_cauda.move_to_end(conversa_id)
+                while len(self._escritas_sem_cauda) > self.max_conversas:
+                    _, esquecida = self._escritas_sem_cauda.popitem(last=False)
+                    self._piso_escritas = max(self._piso_escritas, esquecida)
+                return
+            cauda.turnos.append({"pergunta": pergunta, "resposta": resposta})
+            cauda.total += 1
+            self.anexados += 1
+
+    def descartar(self, conversa_id):
+        with self._lock:
+            self._conversas.pop(conversa_id, None)
+
+    def estatisticas(self):
+        with self._lock:
+            consultas = self.acertos + self.faltas
+            return {
+                "conversas": len(self._conversas),
+                "acertos": self.acertos,
+                "faltas": self.faltas,
+                "taxa_acerto": round(self.acertos / consultas, 3) if consultas else None,
+                "anexados": self.anexados,
+                "expiradas": self.expiradas,
+                "recusadas": self.recusadas,
+            }
+
+def turnos_nao_resumidos(turnos, total, turnos_resumidos):
+    """Da cauda (os últimos len(turnos) de `total`), só os turnos que o resumo ainda não cobre."""
+    primeiro = total - len(turnos)
+    return turnos[max(turnos_resumidos - primeiro, 0):]
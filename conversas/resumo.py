@@ -0,0 +1,159 @@
+"""Resumo incremental das conversas longas, fora do caminho da requisição.
+
+O prompt de um turno leva o resumo guardado em conversas.resumo mais os turnos
+que ele ainda não cobre. Quando há INTERVALO_TURNOS turnos novos além dos
+TURNOS_RECENTES mantidos na íntegra, um worker em segundo plano funde esses
+turnos ao resumo e grava no banco quantos turnos ele já cobre
+(conversas.turnos_resumidos). Cada turno entra no resumo uma única vez e o
+resumo nunca é recalculado do zero.
+
+Cada rodada funde no máximo MAX_TURNOS_POR_RODADA turnos, para o pedido caber no
+orçamento dos provedores. Uma conversa com muito atraso (conversa antiga sem
+resumo, rodadas que falharam) avança em passos: a rodada volta para o fim da
+fila enquanto houver turnos para resumir.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from prompt.montador import truncar_tokens
+
+# Turnos mais recentes que continuam no prompt na íntegra
+TURNOS_RECENTES = int(os.getenv("RESUMO_TURNOS_RECENTES", 6))
+# Quantos turnos fora da janela recente se acumulam antes de atualizar o resumo
+INTERVALO_TURNOS = int(os.getenv("RESUMO_INTERVALO_TURNOS", 4))
+MAX_PALAVRAS_RESUMO = int(os.getenv("RESUMO_MAX_PALAVRAS", 180))
+# Cada turno entra no pedido de resumo cortado neste limite
+MAX_TOKENS_TURNO = int(os.getenv("RESUMO_MAX_TOKENS_TURNO", 200))
+# Turnos por pedido de resumo: 4 turnos cortados em MAX_TOKENS_TURNO dão ~1600 tokens mais o resumo atual
+MAX_TURNOS_POR_RODADA = int(os.getenv("RESUMO_MAX_TURNOS_POR_RODADA", INTERVALO_TURNOS))
+
+def montar_pedido_resumo(resumo_atual, turnos):
+    partes = [
+        "Você mantém o resumo de uma conversa entre um usuário e a assistente Lyria.",
+        f"Atualize o resumo incorporando os novos turnos, em no máximo {MAX_PALAVRAS_RESUMO} palavras, "
+        "em texto corrido e sem formatação. Preserve fatos, preferências e decisões do usuário "
+        "e o que já foi explicado; descarte cumprimentos e repetições. Responda só com o resumo.",
+        "",
+        "RESUMO ATUAL:",
+        resumo_atual or "(vazio)",
+        "",
+        "NOVOS TURNOS:",
+    ]
+    for turno in turnos:
+        partes.append(f"Usuário: {truncar_tokens(turno.get('pergunta', ''), MAX_TOKENS_TURNO)}")
+        partes.append(f"Lyria: {truncar_tokens(turno.get('resposta', ''), MAX_TOKENS_TURNO)}")
+    partes += ["", "RESUMO ATUALIZADO:"]
+    return "\n".join(partes)
+
+class ResumidorConversas:
+    """Agenda e executa as atualizações de resumo num worker próprio.
+
+    gerar(pedido) devolve o texto do resumo (ou None para descartar);
+    carregar_resumo(conversa_id) devolve (resumo, turnos_resumidos);
+    carregar_turnos(conversa_id, a_partir_de) devolve os turnos a partir desse índice;
+    salvar_resumo(conversa_id, resumo, turnos_resumidos, turnos_resumidos_anterior)
+    só grava se ninguém atualizou antes (devolve False nesse caso).
+    """
+
+    def __init__(self, gerar, carregar_resumo, carregar_turnos, salvar_resumo,
+                 turnos_recentes=TURNOS_RECENTES, intervalo=INTERVALO_TURNOS,
+                 max_turnos_por_rodada=MAX_TURNOS_POR_RODADA):
+        self.gerar = gerar
+        self.carregar_resumo = carregar_resumo
+        self.carregar_turnos = carregar_turnos
+        self.salvar_resumo = salvar_resumo
+        self.turnos_recentes = turnos_recentes
+        self.intervalo = intervalo
+        self.max_turnos_por_rodada = max(max_turnos_por_rodada, 1)
+        # Um worker só: resumir é trabalho de fundo e não deve disputar provedor com as requisições
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="resumo-conversas")
+        self._lock = threading.Lock()
+        self._pendentes = set()
+        self.agendados = 0
+        self.rodadas = 0
+        self.continuacoes = 0
+        self.gravados = 0
+        self.turnos_incorporados = 0
+        self.descartados = 0
+        self.conflitos = 0
+        self.falhas = 0
+        self.tempo_total = 0.0
+
+    def precisa_resumir(self, turnos_salvos, turnos_resumidos):
+        return turnos_salvos - turnos_resumidos - self.turnos_recentes >= self.intervalo
+
+    def agendar(self, conversa_id, turnos_salvos, turnos_resumidos):
+        """Chamado depois de salvar um turno; não bloqueia a requisição."""
+        if not self.precisa_resumir(turnos_salvos, turnos_resumidos):
+            return False
+        with self._lock:
+            if conversa_id in self._pendentes:
+                return False
+            self._pendentes.add(conversa_id)
+            self.agendados += 1
+        self._executor.submit(self._resumir, conversa_id)
+        return True
+
+    def _resumir(self, conversa_id):
+        inicio = time.perf_counter()
+        continuar = False
+        try:
+            resumo, resumidos = self.carregar_resumo(conversa_id)
+            turnos = self.carregar_turnos(conversa_id, resumidos)
+            novos = len(turnos) - self.turnos_recentes
+            if novos < self.intervalo:
+                return
+            novos = min(novos, self.max_turnos_por_rodada)
+
+            novo_resumo = self.gerar(montar_pedido_resumo(resumo, turnos[:novos]))
+            if not novo_resumo:
+                with self._lock:
+                    self.descartados += 1
+                return
+
+            if self.salvar_resumo(conversa_id, novo_resumo.strip(), resumidos + novos, resumidos):
+                with self._lock:
+                    self.gravados += 1
+                    self.turnos_incorporados += novos
+                print(f"🗜️ Resumo da conversa {conversa_id} atualizado ({resumidos + novos} turnos resumidos)")
+                continuar = self.precisa_resumir(resumidos + len(turnos), resumidos + novos)
+            else:
+                with self._lock:
+                    self.conflitos += 1
+        except Exception as e:
+            print(f"⚠️ Erro ao resumir conversa {conversa_id}: {e}")
+            with self._lock:
+                self.falhas += 1
+        finally:
+            with self._lock:
+                self.rodadas += 1
+                self.tempo_total += time.perf_counter() - inicio
+                if continuar:
+                    # Continua pendente: o próximo passo vai para o fim da fila, atrás das outras conversas
+                    self.continuacoes += 1
+                else:
+                    self._pendentes.discard(conversa_id)
+            if continuar:
+                try:
+                    self._executor.submit(self._resumir, conversa_id)
+                except RuntimeError:
+                    # Executor encerrado (processo saindo): o próximo turno da conversa agenda de novo
+                    with self._lock:
+                        self._pendentes.discard(conversa_id)
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                "agendados": self.agendados,
+                "rodadas": self.rodadas,
+                "continuacoes": self.continuacoes,
+                "gravados": self.gravados,
+                "turnos_incorporados": self.turnos_incorporados,
+                "descartados": self.descartados,
+                "conflitos": self.conflitos,
+                "falhas": self.falhas,
+                "pendentes": len(self._pendentes),
+                "tempo_medio_ms": round(self.tempo_total / max(self.rodadas, 1) * 1000, 1),
+            }
@@ -0,0 +1,25 @@
+"""Registro central de métricas do processo.
+
+Cada componente registra uma função que devolve um dict com seus contadores;
+`coletar()` junta tudo num snapshot, exposto em GET /Lyria/metricas.
+"""
+import threading
+
+_fontes = {}
+_lock = threading.Lock()
+
+def registrar_fonte(nome, coletor):
+    with _lock:
+        _fontes[nome] = coletor
+
+def coletar():
+    with _lock:
+        fontes = dict(_fontes)
+
+    snapshot = {}
+    for nome, coletor in fontes.items():
+        try:
+            snapshot[nome] = coletor()
+        except Exception as e:
+            snapshot[nome] = {"erro": str(e)}
+    return snapshot
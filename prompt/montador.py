@@ -0,0 +1,216 @@
+"""Montagem do prompt dentro de um orçamento de tokens.
+
+O prompt é descrito em seções (persona, histórico, memórias, web, pergunta).
+As obrigatórias entram sempre; as opcionais são encaixadas por prioridade até
+o orçamento acabar, item a item, e depois renderizadas na ordem em que foram
+declaradas. Cada montagem devolve quantos tokens cada seção ocupou.
+
+Os tokens são estimados localmente (sem tokenizer do provedor): cada palavra
+conta ceil(len/4) tokens e cada sinal de pontuação conta 1. Para português
+isso fica próximo, e um pouco acima, do que os tokenizers BPE do Llama e do
+Falcon produzem, então o orçamento erra para o lado seguro.
+"""
+import functools
+import json
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+
+# Tokens de prompt por modelo; o que sobra do contexto fica para a resposta (max_tokens)
+ORCAMENTOS_POR_MODELO = {
+    "llama-3.1-8b-instant": 3000,
+    # Contexto de 2048 tokens: 600 de resposta e margem para o erro da estimativa
+    "tiiuae/falcon-7b-instruct": 1300,
+}
+# Sobrescreve/estende a tabela acima, ex.: PROMPT_ORCAMENTOS='{"llama-3.1-8b-instant": 4000}'
+ORCAMENTOS_POR_MODELO.update(json.loads(os.getenv("PROMPT_ORCAMENTOS", "{}")))
+ORCAMENTO_PADRAO = int(os.getenv("PROMPT_ORCAMENTO_PADRAO", 1500))
+
+_PEDACO = re.compile(r"\w+|[^\w\s]")
+
+def orcamento_modelo(modelo):
+    return int(ORCAMENTOS_POR_MODELO.get(modelo, ORCAMENTO_PADRAO))
+
+def contar_tokens(texto):
+    total = 0
+    for m in _PEDACO.finditer(texto):
+        total += (m.end() - m.start() + 3) // 4
+    return total
+
+# Textos estáticos (prefixos das personas) se repetem em toda chamada: a contagem é feita uma vez só
+contar_tokens_estatico = functools.lru_cache(maxsize=64)(contar_tokens)
+
+def truncar_tokens(texto, max_tokens):
+    """Corta `texto` no último pedaço que ainda cabe em `max_tokens`."""
+    total = 0
+    for m in _PEDACO.finditer(texto):
+        total += (m.end() - m.start() + 3) // 4
+        if total > max_tokens:
+            return texto[:m.start()].rstrip()
+    return texto
+
+@dataclass
+class Secao:
+    nome: str
+    itens: list
+    obrigatoria: bool = False
+    prioridade: int = 0
+    cabecalho: str = ""
+    rodape: str = ""
+    max_tokens_item: int = None
+    # Histórico: quando falta espaço, os itens mais recentes (do fim) têm preferência
+    preferir_finais: bool = False
+    # Web: o último item que não cabe inteiro entra cortado em vez de ficar de fora
+    truncavel: bool = False
+    # Persona: texto fixo, a contagem de tokens vem do cache
+    estatica: bool = False
+
+@dataclass
+class PromptMontado:
+    texto: str
+    orcamento: int
+    tokens_por_secao: dict = field(default_factory=dict)
+    itens_descartados: dict = field(default_factory=dict)
+    # Texto renderizado de cada seção e índices (na lista original) dos itens que entraram
+    blocos: dict = field(default_factory=dict)
+    indices: dict = field(default_factory=dict)
+    # Mesmo conteúdo no formato de chat (system/user/assistant), quando quem montou preencher
+    mensagens: list = None
+
+    @property
+    def total_tokens(self):
+        return sum(self.tokens_por_secao.values())
+
+    def resumo(self):
+        partes = ", ".join(f"{nome}={tokens}" for nome, tokens in self.tokens_por_secao.items())
+        texto = f"{self.total_tokens}/{self.orcamento} tokens ({partes})"
+        descartados = {nome: n for nome, n in self.itens_descartados.items() if n}
+        if descartados:
+            texto += f", descartados: {descartados}"
+        return texto
+
+class MontadorPrompt:
+    def __init__(self, orcamento):
+        self.orcamento = orcamento
+        self.secoes = []
+
+    def adicionar(self, nome, itens, **opcoes):
+        if itens is None:
+            itens = []
+        elif isinstance(itens, str):
+            itens = [itens]
+        self.secoes.append(Secao(nome, [item for item in itens if item], **opcoes))
+        return self
+
+    def montar(self):
+        escolhidos = {}
+        tokens = {}
+        restante = self.orcamento
+
+        # Obrigatórias primeiro, sem corte; depois as opcionais em ordem de prioridade (menor = antes)
+        obrigatorias = [s for s in self.secoes if s.obrigatoria]
+        opcionais = sorted((s for s in self.secoes if not s.obrigatoria), key=lambda s: s.prioridade)
+
+        for secao in obrigatorias:
+            itens = {i: self._limitar_item(secao, item) for i, item in enumerate(secao.itens)}
+            escolhidos[secao.nome] = itens
+            contar = contar_tokens_estatico if secao.estatica else contar_tokens
+            tokens[secao.nome] = self._custo_moldura(secao) + sum(contar(i) for i in itens.values())
+            restante -= tokens[secao.nome]
+
+        descartados = {}
+        for secao in opcionais:
+            escolhidos[secao.nome], tokens[secao.nome] = self._encaixar(secao, restante)
+            descartados[secao.nome] = len(secao.itens) - len(escolhidos[secao.nome])
+            restante -= tokens[secao.nome]
+
+        blocos = {}
+        for secao in self.secoes:
+            itens = escolhidos[secao.nome]
+            blocos[secao.nome] = secao.cabecalho + "".join(itens.values()) + secao.rodape if itens else ""
+
+        return PromptMontado(
+            texto="".join(blocos.values()),
+            orcamento=self.orcamento,
+            tokens_por_secao={s.nome: tokens[s.nome] for s in self.secoes},
+            itens_descartados=descartados,
+            blocos=blocos,
+            indices={nome: list(itens) for nome, itens in escolhidos.items()},
+        )
+
+    def _limitar_item(self, secao, item):
+        if secao.max_tokens_item is not None:
+            return truncar_tokens(item, secao.max_tokens_item)
+        return item
+
+    def _custo_moldura(self, secao):
+        if not secao.itens:
+            return 0
+        return contar_tokens(secao.cabecalho) + contar_tokens(secao.rodape)
+
+    def _encaixar(self, secao, restante):
+        moldura = self._custo_moldura(secao)
+        if not secao.itens or moldura >= restante:
+            return {}, 0
+
+        disponivel = restante - moldura
+        ordem = range(len(secao.itens))
+        if secao.preferir_finais:
+            ordem = reversed(ordem)
+
+        aceitos = {}
+        usados = 0
+        for indice in ordem:
+            item = self._limitar_item(secao, secao.itens[indice])
+            custo = contar_tokens(item)
+            if usados + custo > disponivel:
+                if secao.truncavel:
+                    item = truncar_tokens(item, disponivel - usados)
+                    if item:
+                        aceitos[indice] = item
+                        usados += contar_tokens(item)
+                # Itens inteiros (turnos, memórias) não são picotados: para no primeiro que não cabe
+                break
+            aceitos[indice] = item
+            usados += custo
+
+        if not aceitos:
+            return {}, 0
+        return {i: aceitos[i] for i in sorted(aceitos)}, moldura + usados
+
+# Tokens que o template de chat do provedor acrescenta por mensagem (papel e delimitadores)
+TOKENS_POR_MENSAGEM = 4
+
+def contar_tokens_mensagens(mensagens):
+    return sum(contar_tokens(m["content"]) + TOKENS_POR_MENSAGEM for m in mensagens)
+
+class EstatisticasPrompt:
+    """Acumula as montagens para GET /Lyria/metricas: média de tokens por seção e cortes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.montagens = 0
+        self.com_descarte = 0
+        self.tokens_por_secao = {}
+        self.maior_total = 0
+
+    def registrar(self, montado):
+        with self._lock:
+            self.montagens += 1
+            if any(montado.itens_descartados.values()):
+                self.com_descarte += 1
+            for nome, tokens in montado.tokens_por_secao.items():
+                self.tokens_por_secao[nome] = self.tokens_por_secao.get(nome, 0) + tokens
+            self.maior_total = max(self.maior_total, montado.total_tokens)
+
+    def estatisticas(self):
+        with self._lock:
+            n = self.montagens or 1
+            return {
+                "montagens": self.montagens,
+                "com_descarte": self.com_descarte,
+                "media_tokens_por_secao": {nome: round(t / n, 1) for nome, t in self.tokens_por_secao.items()},
+                "media_tokens_total": round(sum(self.tokens_por_secao.values()) / n, 1),
+                "maior_total": self.maior_total,
+            }
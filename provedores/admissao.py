@@ -0,0 +1,207 @@
+"""Controle de admissão por provedor: concorrência, cota RPM/TPM e fila com prazo.
+
+Antes de cada chamada ao provedor, `admitir()` espera (no máximo até o prazo)
+por uma vaga de concorrência e por saldo nos baldes de requisições e de tokens.
+Se a espera necessária não cabe no prazo, ou se a fila já está cheia, a
+chamada é recusada na hora com AdmissaoNegada, sem gastar cota com uma
+requisição que voltaria 429. Um 429 do provedor bloqueia novas chamadas pelo
+Retry-After e corta o limite de concorrência pela metade; sucessos o devolvem
+aos poucos (aumento aditivo, redução multiplicativa).
+"""
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+from provedores.roteador import ErroProvedor
+
+MAX_FILA = int(os.getenv("ADMISSAO_MAX_FILA", 32))
+ESPERA_MAXIMA = float(os.getenv("ADMISSAO_ESPERA_MAXIMA", 3.0))
+# Bloqueio após um 429 sem Retry-After: dobra a cada 429 seguido, até o máximo
+BACKOFF_INICIAL = float(os.getenv("ADMISSAO_BACKOFF_INICIAL", 1.0))
+BACKOFF_MAXIMO = float(os.getenv("ADMISSAO_BACKOFF_MAXIMO", 30.0))
+
+class AdmissaoNegada(ErroProvedor):
+    """Recusa local: o provedor nem foi chamado, então o roteador não conta como falha dele."""
+
+    def __init__(self, mensagem):
+        super().__init__(mensagem, status=429, penalizar=False)
+
+def ler_retry_after(valor):
+    """Segundos pedidos pelo header Retry-After (número ou data HTTP); None se ausente ou inválido."""
+    if not valor:
+        return None
+    try:
+        return max(float(valor), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(valor).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+class BaldeTokens:
+    def __init__(self, capacidade, por_minuto):
+        self.capacidade = float(capacidade)
+        self.taxa = por_minuto / 60.0
+        self.nivel = self.capacidade
+        self.atualizado_em = time.monotonic()
+
+    def _repor(self, agora):
+        self.nivel = min(self.capacidade, self.nivel + (agora - self.atualizado_em) * self.taxa)
+        self.atualizado_em = agora
+
+    def tempo_ate(self, quantidade, agora):
+        self._repor(agora)
+        # Pedido maior que o balde inteiro espera o balde encher, senão nunca passaria
+        falta = min(quantidade, self.capacidade) - self.nivel
+        return max(falta / self.taxa, 0.0)
+
+    def consumir(self, quantidade, agora):
+        self._repor(agora)
+        self.nivel -= quantidade
+
+    def saldo(self, agora):
+        self._repor(agora)
+        return self.nivel
+
+    def limitar(self, restante, agora):
+        self._repor(agora)
+        self.nivel = min(self.nivel, float(restante))
+
+class ControleAdmissao:
+    def __init__(self, nome, max_concorrentes, rpm=None, tpm=None, max_fila=MAX_FILA, espera_maxima=ESPERA_MAXIMA):
+        self.nome = nome
+        self.max_concorrentes = max_concorrentes
+        self.limite_concorrencia = max_concorrentes
+        self.max_fila = max_fila
+        self.espera_maxima = espera_maxima
+        self.requisicoes = BaldeTokens(rpm, rpm) if rpm else None
+        self.tokens = BaldeTokens(tpm, tpm) if tpm else None
+        self._cond = threading.Condition()
+        self.em_uso = 0
+        self.na_fila = 0
+        self.bloqueado_ate = 0.0
+        self.backoff = BACKOFF_INICIAL
+        self.sucessos_seguidos = 0
+        self.admitidas = 0
+        self.esperaram = 0
+        self.tempo_espera = 0.0
+        self.recusadas_fila = 0
+        self.recusadas_prazo = 0
+        self.respostas_429 = 0
+
+    def _espera_necessaria(self, tokens, agora):
+        if self.em_uso >= self.limite_concorrencia:
+            return math.inf
+        espera = max(self.bloqueado_ate - agora, 0.0)
+        if self.requisicoes is not None:
+            espera = max(espera, self.requisicoes.tempo_ate(1, agora))
+        if self.tokens is not None and tokens:
+            espera = max(espera, self.tokens.tempo_ate(tokens, agora))
+        return espera
+
+    @contextmanager
+    def admitir(self, tokens=0, espera_maxima=None):
+        """Ocupa uma vaga do provedor durante o bloco `with`; levanta AdmissaoNegada se não der a tempo."""
+        inicio = time.monotonic()
+        prazo = inicio + (self.espera_maxima if espera_maxima is None else espera_maxima)
+
+        with self._cond:
+            if self.na_fila >= self.max_fila:
+                self.recusadas_fila += 1
+                raise AdmissaoNegada(f"{self.nome}: fila de admissão cheia ({self.na_fila})")
+
+            self.na_fila += 1
+            try:
+                while True:
+                    agora = time.monotonic()
+                    espera = self._espera_necessaria(tokens, agora)
+                    if espera == 0:
+                        break
+                    # Espera por cota com fim conhecido: se não cabe no prazo, recusa já em vez de esperar à toa
+                    restante = prazo - agora
+                    if espera > restante:
+                        if espera != math.inf or restante <= 0:
+                            self.recusadas_prazo += 1
+                            raise AdmissaoNegada(
+                                f"{self.nome}: sem capacidade dentro do prazo (espera de {espera:.1f}s)"
+                            )
+                        espera = restante
+                    self._cond.wait(espera)
+            finally:
+                self.na_fila -= 1
+
+            agora = time.monotonic()
+            if self.requisicoes is not None:
+                self.requisicoes.consumir(1, agora)
+            if self.tokens is not None and tokens:
+                self.tokens.consumir(tokens, agora)
+            self.em_uso += 1
+            self.admitidas += 1
+            self.tempo_espera += agora - inicio
+            if agora - inicio > 0.001:
+                self.esperaram += 1
+
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.em_uso -= 1
+                self._cond.notify_all()
+
+    def registrar_sucesso(self, tokens_reservados=0, tokens_usados=None):
+        """Devolve ao balde a diferença entre os tokens reservados e o `usage` real, e recupera a concorrência."""
+        with self._cond:
+            if self.tokens is not None and tokens_usados is not None:
+                self.tokens.consumir(tokens_usados - tokens_reservados, time.monotonic())
+            self.backoff = BACKOFF_INICIAL
+            self.sucessos_seguidos += 1
+            if self.limite_concorrencia < self.max_concorrentes and self.sucessos_seguidos >= self.limite_concorrencia:
+                self.limite_concorrencia += 1
+                self.sucessos_seguidos = 0
+            self._cond.notify_all()
+
+    def registrar_429(self, retry_after=None):
+        with self._cond:
+            agora = time.monotonic()
+            self.respostas_429 += 1
+            espera = retry_after if retry_after is not None else self.backoff
+            self.backoff = min(self.backoff * 2, BACKOFF_MAXIMO)
+            self.bloqueado_ate = max(self.bloqueado_ate, agora + espera)
+            self.limite_concorrencia = max(1, self.limite_concorrencia // 2)
+            self.sucessos_seguidos = 0
+            # O provedor diz que a cota acabou: os baldes locais também
+            if self.requisicoes is not None:
+                self.requisicoes.limitar(0, agora)
+            print(f"🚦 Admissão {self.nome}: 429, pausando {espera:.1f}s e limitando a {self.limite_concorrencia} em paralelo")
+
+    def sincronizar(self, requisicoes_restantes=None, tokens_restantes=None):
+        """Alinha os baldes com os headers de cota restante do provedor (x-ratelimit-remaining-*)."""
+        with self._cond:
+            agora = time.monotonic()
+            if self.requisicoes is not None and requisicoes_restantes is not None:
+                self.requisicoes.limitar(requisicoes_restantes, agora)
+            if self.tokens is not None and tokens_restantes is not None:
+                self.tokens.limitar(tokens_restantes, agora)
+
+    def estatisticas(self):
+        with self._cond:
+            agora = time.monotonic()
+            return {
+                "limite_concorrencia": self.limite_concorrencia,
+                "max_concorrentes": self.max_concorrentes,
+                "em_uso": self.em_uso,
+                "na_fila": self.na_fila,
+                "admitidas": self.admitidas,
+                "esperaram": self.esperaram,
+                "espera_media_ms": round(self.tempo_espera / max(self.admitidas, 1) * 1000, 1),
+                "recusadas_fila": self.recusadas_fila,
+                "recusadas_prazo": self.recusadas_prazo,
+                "respostas_429": self.respostas_429,
+                "bloqueado_por_s": round(max(self.bloqueado_ate - agora, 0.0), 1),
+                "saldo_requisicoes": round(self.requisicoes.saldo(agora), 1) if self.requisicoes else None,
+                "saldo_tokens": round(self.tokens.saldo(agora)) if self.tokens else None,
+            }
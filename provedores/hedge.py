@@ -0,0 +1,99 @@
+"""Requisições "hedged" entre dois provedores de LLM.
+
+A chamada vai primeiro para o provedor primário; se ele não responder em
+`atraso` segundos, uma chamada reserva é disparada para o secundário e vale a
+primeira resposta válida. A chamada perdedora não pode ser interrompida no
+meio (requests é bloqueante), então ela termina em segundo plano e o
+resultado é ignorado.
+
+As funções de provedor devolvem um ResultadoLLM (provedores/resultado.py) ou
+None em caso de falha; exceções contam como falha.
+"""
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+ATRASO_HEDGE = float(os.getenv("LLM_ATRASO_HEDGE", 3.0))
+MAX_CHAMADAS_PARALELAS = int(os.getenv("LLM_MAX_CHAMADAS_PARALELAS", 32))
+
+class Hedge:
+    def __init__(self, atraso=ATRASO_HEDGE, max_paralelas=MAX_CHAMADAS_PARALELAS):
+        self.atraso = atraso
+        self._executor = ThreadPoolExecutor(max_workers=max_paralelas, thread_name_prefix="llm")
+        self._lock = threading.Lock()
+        self._contadores = {
+            "chamadas": 0,
+            "sem_hedge": 0,
+            "hedges_disparados": 0,
+            "fallbacks": 0,
+            "vitorias_primario": 0,
+            "vitorias_secundario": 0,
+            "vitorias_hedge": 0,
+            "falhas_totais": 0,
+        }
+
+    def _contar(self, *nomes):
+        with self._lock:
+            for nome in nomes:
+                self._contadores[nome] += 1
+
+    @staticmethod
+    def _resultado(futuro):
+        try:
+            return futuro.result()
+        except Exception as e:
+            print(f"⚠️ Provedor falhou: {e}")
+            return None
+
+    def executar(self, primario, secundario, atraso=None):
+        """Retorna (resposta, vencedor) com vencedor em {"primario", "secundario", None}.
+
+        atraso=0 dispara os dois provedores ao mesmo tempo (personas sensíveis a latência).
+        """
+        atraso = self.atraso if atraso is None else atraso
+        self._contar("chamadas")
+
+        futuro_primario = self._executor.submit(primario)
+        concluidos, _ = wait([futuro_primario], timeout=atraso)
+        if concluidos:
+            resposta = self._resultado(futuro_primario)
+            if resposta is not None:
+                self._contar("sem_hedge", "vitorias_primario")
+                return resposta, "primario"
+            # Primário falhou antes do prazo: vira um fallback comum
+            self._contar("fallbacks")
+            resposta = self._resultado(self._executor.submit(secundario))
+            if resposta is not None:
+                self._contar("vitorias_secundario")
+                return resposta, "secundario"
+            self._contar("falhas_totais")
+            return None, None
+
+        self._contar("hedges_disparados")
+        futuro_secundario = self._executor.submit(secundario)
+        nomes = {futuro_primario: "primario", futuro_secundario: "secundario"}
+        pendentes = set(nomes)
+        while pendentes:
+            concluidos, pendentes = wait(pendentes, return_when=FIRST_COMPLETED)
+            for futuro in concluidos:
+                resposta = self._resultado(futuro)
+                if resposta is not None:
+                    for perdedor in pendentes:
+                        perdedor.cancel()
+                    vencedor = nomes[futuro]
+                    if vencedor == "secundario":
+                        self._contar("vitorias_secundario", "vitorias_hedge")
+                    else:
+                        self._contar("vitorias_primario")
+                    return resposta, vencedor
+
+        self._contar("falhas_totais")
+        return None, None
+
+    def estatisticas(self):
+        with self._lock:
+            dados = dict(self._contadores)
+        dados["atraso_s"] = self.atraso
+        disparados = dados["hedges_disparados"]
+        dados["taxa_vitoria_hedge"] = dados["vitorias_hedge"] / disparados if disparados else 0.0
+        return dados
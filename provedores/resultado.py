@@ -0,0 +1,35 @@
+"""Resultado de uma geração: texto mais quem respondeu, quanto custou e quanto demorou.
+
+Os adaptadores de provedor devolvem um ResultadoLLM em vez do texto puro; o
+roteador e o hedge só repassam o objeto. As rotas gravam os campos em
+ai_responses (salvarMensagem) para as agregações de uso por usuário, persona e dia.
+"""
+from dataclasses import dataclass
+
+@dataclass
+class ResultadoLLM:
+    texto: str
+    # "groq", "hf", "offline"; "cache"/"reuso" quando nenhum provedor foi chamado;
+    # "coalescido" quando a resposta veio da chamada idêntica de outra requisição (só ela conta os tokens)
+    provedor: str = None
+    modelo: str = None
+    tokens_prompt: int = None
+    tokens_resposta: int = None
+    # True quando o provedor não informou `usage` e os tokens vêm da estimativa local
+    tokens_estimados: bool = False
+    latencia_ms: float = None
+    # Só no streaming: até o primeiro pedaço de texto chegar
+    tempo_primeiro_token_ms: float = None
+
+    @property
+    def tokens_total(self):
+        if self.tokens_prompt is None and self.tokens_resposta is None:
+            return None
+        return (self.tokens_prompt or 0) + (self.tokens_resposta or 0)
+
+    def resumo(self):
+        tokens = f"{self.tokens_prompt}+{self.tokens_resposta} tokens" if self.tokens_total is not None else "sem tokens"
+        if self.tokens_estimados:
+            tokens += " (estimados)"
+        latencia = f"{self.latencia_ms:.0f}ms" if self.latencia_ms is not None else "-"
+        return f"{self.provedor}/{self.modelo or '-'}: {tokens}, {latencia}"
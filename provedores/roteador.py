@@ -0,0 +1,223 @@
+"""Roteador de provedores de LLM com preferência por latência e circuit breaker.
+
+Cada provedor é um adaptador registrado com `registrar(nome, funcao)`, onde
+`funcao(prompt, max_tokens)` devolve um ResultadoLLM (provedores/resultado.py)
+ou levanta ErroProvedor. A cada requisição os provedores saudáveis são ordenados pela
+latência média móvel (EWMA), penalizada pela taxa de erro; os dois melhores
+disputam via hedge e os demais ficam como fallback, nessa ordem. Provedores de
+último recurso (ex.: resposta offline) só são usados quando todos os outros falham.
+"""
+import os
+import threading
+import time
+
+ALFA_EWMA = float(os.getenv("LLM_ROTEADOR_ALFA_EWMA", 0.2))
+LIMITE_FALHAS = int(os.getenv("LLM_ROTEADOR_LIMITE_FALHAS", 5))
+TEMPO_ABERTO = float(os.getenv("LLM_ROTEADOR_TEMPO_ABERTO", 30))
+TEMPO_ABERTO_MAXIMO = float(os.getenv("LLM_ROTEADOR_TEMPO_ABERTO_MAXIMO", 600))
+# Quanto a taxa de erro pesa na escolha: latência * (1 + PESO_ERRO * taxa_erro)
+PESO_ERRO = float(os.getenv("LLM_ROTEADOR_PESO_ERRO", 4.0))
+# Meia-vida (s) da taxa de erro sem tráfego novo, para um provedor preterido não ficar marcado para sempre
+MEIA_VIDA_ERRO = float(os.getenv("LLM_ROTEADOR_MEIA_VIDA_ERRO", 60))
+
+FECHADO = "fechado"
+ABERTO = "aberto"
+MEIO_ABERTO = "meio_aberto"
+
+class ErroProvedor(Exception):
+    def __init__(self, mensagem, status=None, penalizar=True):
+        super().__init__(mensagem)
+        self.status = status
+        # False quando a chamada foi recusada localmente (ex.: controle de admissão) e o provedor nem foi chamado
+        self.penalizar = penalizar
+
+class EstadoProvedor:
+    def __init__(self, nome, funcao, ordem, ultimo_recurso):
+        self.nome = nome
+        self.funcao = funcao
+        self.ordem = ordem
+        self.ultimo_recurso = ultimo_recurso
+        self.latencia_ewma = None
+        self.taxa_erro_ewma = 0.0
+        self.atualizado_em = time.monotonic()
+        self.requisicoes = 0
+        self.erros = 0
+        self.respostas_429 = 0
+        self.recusas = 0
+        self.falhas_seguidas = 0
+        self.circuito = FECHADO
+        self.tempo_aberto = TEMPO_ABERTO
+        self.aberto_ate = 0.0
+        self.sondando = False
+
+    def taxa_erro(self):
+        ocioso = time.monotonic() - self.atualizado_em
+        return self.taxa_erro_ewma * 0.5 ** (ocioso / MEIA_VIDA_ERRO)
+
+    def pontuacao(self):
+        # Provedor ainda sem medições fica na frente, desempatado pela ordem de registro
+        latencia = self.latencia_ewma if self.latencia_ewma is not None else 0.0
+        return (latencia * (1 + PESO_ERRO * self.taxa_erro()), self.ordem)
+
+    def snapshot(self):
+        return {
+            "circuito": self.circuito,
+            "latencia_ewma_ms": self.latencia_ewma * 1000 if self.latencia_ewma is not None else None,
+            "taxa_erro_ewma": self.taxa_erro(),
+            "requisicoes": self.requisicoes,
+            "erros": self.erros,
+            "respostas_429": self.respostas_429,
+            "recusas": self.recusas,
+            "falhas_seguidas": self.falhas_seguidas,
+            "aberto_por_s": max(self.aberto_ate - time.monotonic(), 0.0) if self.circuito == ABERTO else 0.0,
+            "ultimo_recurso": self.ultimo_recurso,
+        }
+
+class Roteador:
+    def __init__(self, hedge=None, alfa=ALFA_EWMA, limite_falhas=LIMITE_FALHAS):
+        self.hedge = hedge
+        self.alfa = alfa
+        self.limite_falhas = limite_falhas
+        self._lock = threading.Lock()
+        self._provedores = {}
+
+    def registrar(self, nome, funcao, ultimo_recurso=False):
+        with self._lock:
+            self._provedores[nome] = EstadoProvedor(nome, funcao, len(self._provedores), ultimo_recurso)
+
+    def ordenar(self):
+        """Nomes dos provedores a tentar nesta requisição, do preferido ao último recurso."""
+        agora = time.monotonic()
+        sondas, saudaveis, reservas = [], [], []
+        with self._lock:
+            for estado in self._provedores.values():
+                if estado.ultimo_recurso:
+                    reservas.append(estado)
+                    continue
+                if estado.circuito == ABERTO and agora >= estado.aberto_ate:
+                    estado.circuito = MEIO_ABERTO
+                if estado.circuito == MEIO_ABERTO:
+                    # Só uma requisição por vez sonda um provedor em recuperação
+                    if not estado.sondando:
+                        estado.sondando = True
+                        sondas.append(estado)
+                elif estado.circuito == FECHADO:
+                    saudaveis.append(estado)
+
+        saudaveis.sort(key=EstadoProvedor.pontuacao)
+        reservas.sort(key=lambda e: e.ordem)
+        # A sonda vai na frente: se ela demorar ou falhar, o hedge/fallback cobre com o melhor provedor saudável
+        ordem = sondas + saudaveis + reservas
+        return [estado.nome for estado in ordem]
+
+    def _registrar_resultado(self, nome, sucesso, duracao, status=None):
+        with self._lock:
+            estado = self._provedores[nome]
+            estado.requisicoes += 1
+            estado.taxa_erro_ewma = estado.taxa_erro() + self.alfa * ((0.0 if sucesso else 1.0) - estado.taxa_erro())
+            estado.atualizado_em = time.monotonic()
+            if status == 429:
+                estado.respostas_429 += 1
+
+            if sucesso:
+                if estado.latencia_ewma is None:
+                    estado.latencia_ewma = duracao
+                else:
+                    estado.latencia_ewma += self.alfa * (duracao - estado.latencia_ewma)
+                estado.falhas_seguidas = 0
+                if estado.circuito != FECHADO:
+                    # Sonda bem-sucedida: o histórico de erros de antes da queda não conta mais
+                    estado.taxa_erro_ewma = 0.0
+                    print(f"✅ Roteador: circuito de {nome} fechado novamente")
+                estado.circuito = FECHADO
+                estado.tempo_aberto = TEMPO_ABERTO
+                estado.sondando = False
+                return
+
+            estado.erros += 1
+            estado.falhas_seguidas += 1
+            if estado.circuito == MEIO_ABERTO:
+                # Sonda falhou: volta a abrir, esperando o dobro (até o máximo)
+                estado.tempo_aberto = min(estado.tempo_aberto * 2, TEMPO_ABERTO_MAXIMO)
+                self._abrir(estado)
+            elif estado.circuito == FECHADO and estado.falhas_seguidas >= self.limite_falhas:
+                self._abrir(estado)
+
+    def _abrir(self, estado):
+        estado.circuito = ABERTO
+        estado.sondando = False
+        estado.aberto_ate = time.monotonic() + estado.tempo_aberto
+        print(f"🔌 Roteador: circuito de {estado.nome} aberto por {estado.tempo_aberto:.0f}s")
+
+    def _liberar_sonda(self, nome):
+        with self._lock:
+            estado = self._provedores[nome]
+            if estado.circuito == MEIO_ABERTO:
+                estado.sondando = False
+
+    def _chamar(self, nome, prompt, max_tokens):
+        funcao = self._provedores[nome].funcao
+        inicio = time.perf_counter()
+        try:
+            resposta = funcao(prompt, max_tokens)
+        except ErroProvedor as e:
+            if not e.penalizar:
+                # Não conta no EWMA nem no circuito; só passa a vez para o próximo provedor
+                with self._lock:
+                    self._provedores[nome].recusas += 1
+                self._liberar_sonda(nome)
+                print(f"⏭️ Roteador: {nome} recusado: {e}")
+                return None
+            self._registrar_resultado(nome, False, time.perf_counter() - inicio, e.status)
+            print(f"⚠️ Roteador: {nome} falhou: {e}")
+            return None
+        except Exception as e:
+            self._registrar_resultado(nome, False, time.perf_counter() - inicio)
+            print(f"⚠️ Roteador: {nome} falhou: {e}")
+            return None
+        if resposta is None:
+            self._registrar_resultado(nome, False, time.perf_counter() - inicio)
+            return None
+        self._registrar_resultado(nome, True, time.perf_counter() - inicio)
+        return resposta
+
+    def executar(self, prompt, max_tokens, critico_latencia=False):
+        """Retorna (resposta, nome_do_provedor) ou (None, None) se todos falharem."""
+        ordem = self.ordenar()
+        normais = [nome for nome in ordem if not self._provedores[nome].ultimo_recurso]
+        tentados = []
+        chamados = set()
+
+        def chamar(nome):
+            chamados.add(nome)
+            return self._chamar(nome, prompt, max_tokens)
+
+        try:
+            if self.hedge is not None and len(normais) >= 2:
+                primario, secundario = normais[0], normais[1]
+                tentados += [primario, secundario]
+                resposta, vencedor = self.hedge.executar(
+                    lambda: chamar(primario),
+                    lambda: chamar(secundario),
+                    atraso=0 if critico_latencia else None
+                )
+                if resposta is not None:
+                    return resposta, primario if vencedor == "primario" else secundario
+
+            for nome in ordem:
+                if nome in tentados:
+                    continue
+                tentados.append(nome)
+                resposta = chamar(nome)
+                if resposta is not None:
+                    return resposta, nome
+            return None, None
+        finally:
+            # Uma sonda que nem chegou a ser chamada (ex.: o hedge não disparou) não pode ficar presa
+            for nome in ordem:
+                if nome not in chamados:
+                    self._liberar_sonda(nome)
+
+    def estatisticas(self):
+        with self._lock:
+            return {nome: estado.snapshot() for nome, estado in self._provedores.items()}
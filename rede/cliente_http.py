@@ -0,0 +1,106 @@
+"""Cliente HTTP compartilhado para todas as chamadas externas (Groq, HF, SerpAPI).
+
+Uma única requests.Session com pools de conexões keep-alive por host: depois
+da primeira chamada, as próximas para o mesmo host reaproveitam a conexão
+TCP+TLS em vez de refazer o handshake a cada turno de conversa.
+"""
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Quantos hosts distintos mantêm pool e quantas conexões cada pool guarda
+POOL_HOSTS = int(os.getenv("HTTP_POOL_HOSTS", 10))
+POOL_CONEXOES_POR_HOST = int(os.getenv("HTTP_POOL_CONEXOES_POR_HOST", 20))
+TIMEOUT_CONEXAO = float(os.getenv("HTTP_TIMEOUT_CONEXAO", 5))
+TIMEOUT_LEITURA = float(os.getenv("HTTP_TIMEOUT_LEITURA", 30))
+TENTATIVAS = int(os.getenv("HTTP_TENTATIVAS", 2))
+BACKOFF = float(os.getenv("HTTP_BACKOFF", 0.3))
+
+def criar_politica_retry(tentativas=TENTATIVAS, backoff=BACKOFF):
+    # Falhas de conexão são repetidas para qualquer método (a requisição nem chegou ao servidor).
+    # Erros 502/503/504 só são repetidos em GET: num POST para um LLM o 503 aciona o fallback do chamador.
+    return Retry(
+        total=tentativas,
+        connect=tentativas,
+        read=tentativas,
+        status=tentativas,
+        backoff_factor=backoff,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+
+class ClienteHttp:
+    def __init__(self, pool_hosts=POOL_HOSTS, conexoes_por_host=POOL_CONEXOES_POR_HOST,
+                 timeout_conexao=TIMEOUT_CONEXAO, timeout_leitura=TIMEOUT_LEITURA, retry=None):
+        self.timeout_conexao = timeout_conexao
+        self.timeout_leitura = timeout_leitura
+        self.adaptador = HTTPAdapter(
+            pool_connections=pool_hosts,
+            pool_maxsize=conexoes_por_host,
+            max_retries=retry if retry is not None else criar_politica_retry(),
+        )
+        self.sessao = requests.Session()
+        self.sessao.mount("https://", self.adaptador)
+        self.sessao.mount("http://", self.adaptador)
+        self._lock = threading.Lock()
+        self._por_host = {}
+
+    def _registrar(self, host, duracao, erro):
+        with self._lock:
+            dados = self._por_host.setdefault(host, {"requisicoes": 0, "erros": 0, "tempo_total_ms": 0.0})
+            dados["requisicoes"] += 1
+            dados["tempo_total_ms"] += duracao * 1000
+            if erro:
+                dados["erros"] += 1
+
+    def request(self, metodo, url, timeout=None, **kwargs):
+        """Como requests.request; `timeout` numérico vale para a leitura, a conexão usa TIMEOUT_CONEXAO."""
+        if timeout is None:
+            timeout = (self.timeout_conexao, self.timeout_leitura)
+        elif isinstance(timeout, (int, float)):
+            timeout = (min(self.timeout_conexao, timeout), timeout)
+
+        host = urlsplit(url).netloc
+        inicio = time.perf_counter()
+        erro = True
+        try:
+            resposta = self.sessao.request(metodo, url, timeout=timeout, **kwargs)
+            erro = resposta.status_code >= 500
+            return resposta
+        finally:
+            self._registrar(host, time.perf_counter() - inicio, erro)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def estatisticas(self):
+        with self._lock:
+            por_host = {host: dict(dados) for host, dados in self._por_host.items()}
+
+        # Conexões novas abertas por pool: se fica bem abaixo de "requisicoes", o keep-alive está funcionando
+        for chave, pool in list(self.adaptador.poolmanager.pools._container.items()):
+            host = chave.key_host if chave.key_port in (None, 80, 443) else f"{chave.key_host}:{chave.key_port}"
+            dados = por_host.setdefault(host, {"requisicoes": 0, "erros": 0, "tempo_total_ms": 0.0})
+            dados["conexoes_abertas"] = dados.get("conexoes_abertas", 0) + pool.num_connections
+
+        for dados in por_host.values():
+            dados["tempo_medio_ms"] = dados["tempo_total_ms"] / dados["requisicoes"] if dados["requisicoes"] else 0.0
+        return por_host
+
+cliente = ClienteHttp()
+
+def get(url, **kwargs):
+    return cliente.get(url, **kwargs)
+
+def post(url, **kwargs):
+    return cliente.post(url, **kwargs)
@@ -0,0 +1,65 @@
+"""Coalescência de chamadas idênticas concorrentes (single-flight).
+
+Enquanto uma chamada para uma chave está em andamento, outras threads que
+pedem a mesma chave esperam por ela e recebem o mesmo resultado (ou a mesma
+exceção), em vez de disparar outra requisição externa. Chaves diferentes
+nunca compartilham resultado nem erro. `para_seguidores` transforma o
+resultado entregue a quem esperou (ex.: zerar o uso de tokens, que só o líder gastou).
+"""
+import threading
+
+class _Chamada:
+    def __init__(self):
+        self.evento = threading.Event()
+        self.resultado = None
+        self.erro = None
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._em_voo = {}
+        self.chamadas = 0
+        self.executadas = 0
+        self.coalescidas = 0
+
+    def executar(self, chave, funcao, *args, para_seguidores=None, **kwargs):
+        with self._lock:
+            self.chamadas += 1
+            chamada = self._em_voo.get(chave)
+            if chamada is not None:
+                self.coalescidas += 1
+                lider = False
+            else:
+                chamada = _Chamada()
+                self._em_voo[chave] = chamada
+                self.executadas += 1
+                lider = True
+
+        if not lider:
+            chamada.evento.wait()
+            if chamada.erro is not None:
+                raise chamada.erro
+            if para_seguidores is not None:
+                return para_seguidores(chamada.resultado)
+            return chamada.resultado
+
+        try:
+            chamada.resultado = funcao(*args, **kwargs)
+            return chamada.resultado
+        except BaseException as e:
+            chamada.erro = e
+            raise
+        finally:
+            # Remove antes de acordar os seguidores: quem chegar depois dispara uma chamada nova
+            with self._lock:
+                del self._em_voo[chave]
+            chamada.evento.set()
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                "chamadas": self.chamadas,
+                "executadas": self.executadas,
+                "coalescidas": self.coalescidas,
+                "em_voo": len(self._em_voo),
+            }
@@ -1,13 +1,33 @@
 import requests
 import sqlite3
 import os
-from classificadorDaWeb.classificador_busca_web import deve_buscar_na_web
+from classificadorDaWeb.classificador_busca_web import deve_buscar_na_web, deve_buscar_na_web_lote
+from cache.cache_busca_web import CacheBuscaWeb
+from cache.cache_respostas import TTL_WEB as TTL_RESPOSTA_WEB, CacheRespostas
+from cache.reuso_respostas import IndiceRespostas
+from classificadorDaWeb.normalizacao import normalizar_pergunta
+from rede.coalescencia import SingleFlight
+from rede import cliente_http
+from provedores.admissao import ControleAdmissao, ler_retry_after
+from provedores.hedge import Hedge
+from provedores.resultado import ResultadoLLM
+from provedores.roteador import ErroProvedor, Roteador
+from prompt.personas import identificar_persona, obter_persona
+from conversas.historico import TURNOS_NO_PROMPT
+from prompt.montador import (
+    ORCAMENTO_PADRAO, EstatisticasPrompt, MontadorPrompt, PromptMontado, contar_tokens, contar_tokens_mensagens,
+    orcamento_modelo
+)
+import metricas
+import hashlib
+import dataclasses
 from banco.banco import (
     carregar_conversas,
     salvarMensagem,
     escolherApersona,
     criarUsuario,
-    criar_banco
+    criar_banco,
+    carregar_primeiras_perguntas
 )
 import json
 import time
@@ -54,7 +74,7 @@ def testar_groq_api():
     
     try:
         print("🧪 GROQ: Testando conexão...")
-        resp = requests.post("https://api.groq.com/openai/v1/chat/completions", headers=headers, json=payload, timeout=10)
+        resp = cliente_http.post("https://api.groq.com/openai/v1/chat/completions", headers=headers, json=payload, timeout=10)
         
         print(f"🧪 GROQ: Status HTTP {resp.status_code}")
         
@@ -102,7 +122,7 @@ def testar_hf_api():
     
     try:
         print("🧪 HF: Testando conexão...")
-        resp = requests.post("https://router.huggingface.co/hf-inference/models/distilgpt2", headers=headers, json=payload, timeout=15)
+        resp = cliente_http.post("https://router.huggingface.co/hf-inference/models/distilgpt2", headers=headers, json=payload, timeout=15)
         
         print(f"🧪 HF: Status HTTP {resp.status_code}")
         
@@ -136,11 +156,50 @@ def testar_hf_api():
 import requests
 import os
 
-def chamar_groq_api(prompt, max_tokens=400):
+GROQ_API_URL = os.getenv("GROQ_API_URL", "https://api.groq.com/openai/v1/chat/completions")
+GROQ_MODELO = "llama-3.1-8b-instant"
+
+coalescencia_groq = SingleFlight()
+
+# Limites do plano do Groq; 0 desliga o balde correspondente
+admissao_groq = ControleAdmissao(
+    "groq",
+    int(os.getenv("LIMITE_GROQ_CONCORRENCIA", 8)),
+    rpm=int(os.getenv("LIMITE_GROQ_RPM", 30)),
+    tpm=int(os.getenv("LIMITE_GROQ_TPM", 6000)),
+)
+
+def _inteiro(valor):
+    try:
+        return int(float(valor))
+    except (TypeError, ValueError):
+        return None
+
+def atualizar_admissao(admissao, resp):
+    """Repassa ao controle de admissão o 429 (com Retry-After) e a cota restante informada pelo provedor."""
+    admissao.sincronizar(
+        _inteiro(resp.headers.get("x-ratelimit-remaining-requests")),
+        _inteiro(resp.headers.get("x-ratelimit-remaining-tokens")),
+    )
+    if resp.status_code == 429:
+        admissao.registrar_429(ler_retry_after(resp.headers.get("Retry-After")))
+
+def chamar_groq_api(mensagens, max_tokens=400):
+    # Prompts idênticos em voo ao mesmo tempo (ex.: a mesma pergunta anônima) viram uma única chamada
+    serializadas = json.dumps(mensagens, ensure_ascii=False, sort_keys=True)
+    chave = (hashlib.sha256(serializadas.encode("utf-8")).hexdigest(), max_tokens)
+    return coalescencia_groq.executar(
+        chave, _chamar_groq_api, mensagens, max_tokens, para_seguidores=resultado_coalescido
+    )
+
+def resultado_coalescido(resultado):
+    """Cópia do ResultadoLLM do líder para quem esperou por ele: os tokens já foram contados uma vez."""
+    return dataclasses.replace(resultado, provedor="coalescido", tokens_prompt=0, tokens_resposta=0, tokens_estimados=False)
+
+def _chamar_groq_api(mensagens, max_tokens=400):
     groq_key = os.getenv("GROQ_API_KEY")
     if not groq_key:
-        print("❌ GROQ: Chave não encontrada")
-        return None
+        raise ErroProvedor("GROQ: Chave não encontrada")
 
     headers = {
         "Authorization": f"Bearer {groq_key}",
@@ -148,42 +207,147 @@ def chamar_groq_api(prompt, max_tokens=400):
     }
 
     payload = {
-        "messages": [{"role": "user", "content": prompt}],
-        "model": "llama-3.1-8b-instant",
+        "messages": mensagens,
+        "model": GROQ_MODELO,
         "max_tokens": max_tokens,
         "temperature": 0.3
     }
 
-    try:
-        print(f"🚀 GROQ: Enviando prompt ({len(prompt)} chars)...")
-        resp = requests.post(
-            "https://api.groq.com/openai/v1/chat/completions",
-            headers=headers,
-            json=payload,
-            timeout=30
-        )
-
-        print(f"📥 GROQ: Status HTTP {resp.status_code}")
-        if resp.status_code != 200:
-            print(f"❌ GROQ: Erro {resp.status_code}: {resp.text[:200]}")
-            return None
+    # A cota de tokens do Groq conta prompt + max_tokens na admissão; o excesso volta com o `usage`
+    reservados = contar_tokens_mensagens(mensagens) + max_tokens
+    with admissao_groq.admitir(reservados):
+        inicio = time.perf_counter()
+        try:
+            print(f"🚀 GROQ: Enviando {len(mensagens)} mensagens ({sum(len(m['content']) for m in mensagens)} chars)...")
+            resp = cliente_http.post(
+                GROQ_API_URL,
+                headers=headers,
+                json=payload,
+                timeout=30
+            )
+        except requests.exceptions.RequestException as e:
+            raise ErroProvedor(f"GROQ: Exceção: {e}") from e
+        atualizar_admissao(admissao_groq, resp)
+
+    print(f"📥 GROQ: Status HTTP {resp.status_code}")
+    if resp.status_code != 200:
+        raise ErroProvedor(f"GROQ: Erro {resp.status_code}: {resp.text[:200]}", status=resp.status_code)
 
+    try:
         data = resp.json()
         resposta = data['choices'][0]['message']['content']
-        print(f"✅ GROQ: Sucesso! ({len(resposta)} chars)")
-        return resposta
+    except (ValueError, KeyError, IndexError) as e:
+        raise ErroProvedor(f"GROQ: Formato inesperado: {e}") from e
+
+    uso = data.get('usage') or {}
+    resultado = ResultadoLLM(
+        texto=resposta,
+        provedor="groq",
+        modelo=data.get('model', GROQ_MODELO),
+        tokens_prompt=uso.get('prompt_tokens'),
+        tokens_resposta=uso.get('completion_tokens'),
+        latencia_ms=(time.perf_counter() - inicio) * 1000,
+    )
+    admissao_groq.registrar_sucesso(reservados, resultado.tokens_total)
+    print(f"✅ GROQ: Sucesso! ({len(resposta)} chars, {resultado.resumo()})")
+    return resultado
 
-    except Exception as e:
-        print(f"❌ GROQ: Exceção: {e}")
-        return None
+def chamar_groq_api_stream(mensagens, max_tokens=400):
+    """Gera os pedaços de texto da resposta do Groq à medida que chegam (stream=true).
 
+    Levanta exceção se a chamada falhar antes do primeiro pedaço, para o chamador
+    poder cair no fluxo sem streaming. O valor de retorno do gerador (use
+    `yield from`) é o ResultadoLLM com o texto completo, o uso e os tempos.
+    """
+    groq_key = os.getenv("GROQ_API_KEY")
+    if not groq_key:
+        raise RuntimeError("GROQ_API_KEY não configurada")
+
+    headers = {
+        "Authorization": f"Bearer {groq_key}",
+        "Content-Type": "application/json"
+    }
+
+    payload = {
+        "messages": mensagens,
+        "model": GROQ_MODELO,
+        "max_tokens": max_tokens,
+        "temperature": 0.3,
+        "stream": True,
+        # Pede o `usage` no último evento do stream
+        "stream_options": {"include_usage": True}
+    }
+
+    primeiro_token_ms = None
+    pedacos = []
+    uso = {}
+    modelo = GROQ_MODELO
+
+    reservados = contar_tokens_mensagens(mensagens) + max_tokens
+    # A vaga fica ocupada até o stream terminar: a conexão segue aberta no provedor
+    with admissao_groq.admitir(reservados):
+        inicio = time.perf_counter()
+        print(f"🚀 GROQ (stream): Enviando {len(mensagens)} mensagens ({sum(len(m['content']) for m in mensagens)} chars)...")
+        resp = cliente_http.post(GROQ_API_URL, headers=headers, json=payload, timeout=30, stream=True)
+        try:
+            atualizar_admissao(admissao_groq, resp)
+            if resp.status_code != 200:
+                raise ErroProvedor(f"GROQ (stream): Erro {resp.status_code}: {resp.text[:200]}", status=resp.status_code)
+
+            # chunk_size=None entrega os bytes assim que chegam, sem esperar encher um bloco
+            for linha in resp.iter_lines(chunk_size=None, decode_unicode=True):
+                if not linha or not linha.startswith("data:"):
+                    continue
+                dados = linha[len("data:"):].strip()
+                if dados == "[DONE]":
+                    break
+                evento = json.loads(dados)
+                modelo = evento.get("model", modelo)
+                # OpenAI manda `usage` num evento final sem choices; o Groq também em x_groq.usage
+                uso = evento.get("usage") or evento.get("x_groq", {}).get("usage") or uso
+                if not evento.get("choices"):
+                    continue
+                pedaco = evento["choices"][0].get("delta", {}).get("content")
+                if pedaco:
+                    if primeiro_token_ms is None:
+                        primeiro_token_ms = (time.perf_counter() - inicio) * 1000
+                    pedacos.append(pedaco)
+                    yield pedaco
+        finally:
+            resp.close()
+
+    resultado = ResultadoLLM(
+        texto="".join(pedacos),
+        provedor="groq",
+        modelo=modelo,
+        tokens_prompt=uso.get("prompt_tokens"),
+        tokens_resposta=uso.get("completion_tokens"),
+        latencia_ms=(time.perf_counter() - inicio) * 1000,
+        tempo_primeiro_token_ms=primeiro_token_ms,
+    )
+    admissao_groq.registrar_sucesso(reservados, resultado.tokens_total)
+    return resultado
 
 # --- CHAMAR HUGGING FACE INFERENCE API ---
+HF_MODELO = "tiiuae/falcon-7b-instruct"
+
+# A Inference API gratuita não publica cota em headers: só concorrência, e RPM se configurado
+admissao_hf = ControleAdmissao(
+    "hf",
+    int(os.getenv("LIMITE_HF_CONCORRENCIA", 4)),
+    rpm=int(os.getenv("LIMITE_HF_RPM", 0)),
+)
+
 def chamar_hf_inference(prompt, max_new_tokens=400, temperature=0.3):
     hf_key = os.getenv("HUGGING_FACE_API_KEY")
     if not hf_key:
-        print("❌ HF: Chave não encontrada, usando Groq...")
-        return chamar_groq_api(prompt) or gerar_resposta_offline(prompt)
+        raise ErroProvedor("HF: Chave não encontrada")
+
+    # Melhor deixar o roteador cair em outro provedor do que cortar o prompt (e a pergunta, que vem no fim)
+    tokens_prompt = contar_tokens(prompt)
+    if tokens_prompt > orcamento_modelo(HF_MODELO):
+        # Recusa local pelo tamanho do pedido: o HF nem foi chamado, não conta como falha dele no roteador
+        raise ErroProvedor(f"HF: Prompt com ~{tokens_prompt} tokens excede o orçamento de {HF_MODELO}", penalizar=False)
 
     headers = {
         "Authorization": f"Bearer {hf_key}",
@@ -191,7 +355,7 @@ def chamar_hf_inference(prompt, max_new_tokens=400, temperature=0.3):
     }
 
     payload = {
-        "inputs": prompt[:2000], 
+        "inputs": prompt,
         "parameters": {
             "max_new_tokens": max_new_tokens,
             "temperature": temperature,
@@ -200,38 +364,79 @@ def chamar_hf_inference(prompt, max_new_tokens=400, temperature=0.3):
         "options": {"wait_for_model": True}
     }
 
+    with admissao_hf.admitir():
+        inicio = time.perf_counter()
+        try:
+            print(f"🚀 HF: Enviando prompt ({len(prompt)} chars)...")
+            resp = cliente_http.post(
+                f"https://api-inference.huggingface.co/models/{HF_MODELO}",
+                headers=headers,
+                json=payload,
+                timeout=60
+            )
+        except requests.exceptions.RequestException as e:
+            raise ErroProvedor(f"HF: Exceção: {e}") from e
+        atualizar_admissao(admissao_hf, resp)
+
+    print(f"📥 HF: Status HTTP {resp.status_code}")
+
+    if resp.status_code == 503:
+        raise ErroProvedor("HF: Modelo carregando", status=503)
+
+    if resp.status_code != 200:
+        raise ErroProvedor(f"HF: Erro {resp.status_code}", status=resp.status_code)
+
     try:
-        print(f"🚀 HF: Enviando prompt ({len(prompt)} chars)...")
-        resp = requests.post(
-            "https://api-inference.huggingface.co/models/tiiuae/falcon-7b-instruct",
-            headers=headers,
-            json=payload,
-            timeout=60
+        data = resp.json()
+    except ValueError as e:
+        raise ErroProvedor(f"HF: Resposta não é JSON: {e}") from e
+    print("DEBUG HF JSON:", data)
+
+    if isinstance(data, list) and len(data) > 0 and 'generated_text' in data[0]:
+        resposta = data[0]['generated_text'].strip()
+        # A Inference API não devolve `usage`: os tokens vêm da estimativa local
+        resultado = ResultadoLLM(
+            texto=resposta,
+            provedor="hf",
+            modelo=HF_MODELO,
+            tokens_prompt=tokens_prompt,
+            tokens_resposta=contar_tokens(resposta),
+            tokens_estimados=True,
+            latencia_ms=(time.perf_counter() - inicio) * 1000,
         )
+        admissao_hf.registrar_sucesso()
+        print(f"✅ HF: Sucesso! ({len(resposta)} chars, {resultado.resumo()})")
+        return resultado
 
-        print(f"📥 HF: Status HTTP {resp.status_code}")
-        data = resp.json()
-        print("DEBUG HF JSON:", data)
+    raise ErroProvedor("HF: Formato inesperado")
 
-        if resp.status_code == 503:
-            print("⚠️ HF: Modelo carregando, usando fallback...")
-            return chamar_groq_api(prompt) or gerar_resposta_offline(prompt)
+hedge_llm = Hedge()
+roteador_llm = Roteador(hedge=hedge_llm)
 
-        if resp.status_code != 200:
-            print(f"❌ HF: Erro {resp.status_code}, usando fallback...")
-            return chamar_groq_api(prompt) or gerar_resposta_offline(prompt)
+def gerar_resposta_llm(prompt, max_tokens=600, critico_latencia=False):
+    """Gera a resposta pelo provedor mais rápido e saudável, com hedge e fallback pelo roteador.
 
-        if isinstance(data, list) and len(data) > 0 and 'generated_text' in data[0]:
-            resposta = data[0]['generated_text'].strip()
-            print(f"✅ HF: Sucesso! ({len(resposta)} chars)")
-            return resposta
+    `prompt` é o PromptMontado de montar_prompt. Retorna um ResultadoLLM; se até
+    o último recurso falhar, a resposta offline é gerada aqui mesmo.
 
-        print("❌ HF: Formato inesperado, usando fallback...")
-        return chamar_groq_api(prompt) or gerar_resposta_offline(prompt)
+    critico_latencia dispara os dois melhores provedores juntos, sem esperar LLM_ATRASO_HEDGE.
+    """
+    resultado, provedor = roteador_llm.executar(prompt, max_tokens, critico_latencia)
+    if resultado is None:
+        resultado = resultado_offline(prompt)
+    print(f"🏁 Resposta do provedor {provedor}: {resultado.resumo()}")
+    return resultado
+
+def gerar_texto_llm(texto, max_tokens=400):
+    """Pedido interno (sem persona nem histórico) pelo roteador; None se só a resposta offline saiu."""
+    prompt = PromptMontado(texto=texto, orcamento=0, mensagens=[{"role": "user", "content": texto}])
+    resultado = gerar_resposta_llm(prompt, max_tokens=max_tokens)
+    if resultado.provedor == "offline":
+        return None
+    return resultado.texto
 
-    except Exception as e:
-        print(f"❌ HF: Exceção: {e}, usando fallback...")
-        return chamar_groq_api(prompt) or gerar_resposta_offline(prompt)
+def resultado_offline(prompt):
+    return ResultadoLLM(texto=gerar_resposta_offline(prompt.texto), provedor="offline", modelo="offline")
 
 def gerar_resposta_offline(prompt):
     """Resposta de emergência melhorada"""
@@ -262,138 +467,275 @@ def gerar_resposta_offline(prompt):
     return f"Entendi sua pergunta sobre '{pergunta[:50]}...' mas estou com problemas técnicos. Pode tentar reformular ou aguardar alguns minutos?"
 
 SERPAPI_KEY = os.getenv("KEY_SERP_API")
+
+cache_busca_web = CacheBuscaWeb()
+cache_respostas = CacheRespostas()
+indice_respostas = IndiceRespostas()
+coalescencia_busca_web = SingleFlight()
+metricas.registrar_fonte("cache_busca_web", cache_busca_web.estatisticas)
+metricas.registrar_fonte("cache_respostas", cache_respostas.estatisticas)
+metricas.registrar_fonte("reuso_respostas", indice_respostas.estatisticas)
+metricas.registrar_fonte("http", cliente_http.cliente.estatisticas)
+metricas.registrar_fonte("hedge_llm", hedge_llm.estatisticas)
+metricas.registrar_fonte("roteador_llm", roteador_llm.estatisticas)
+metricas.registrar_fonte("admissao", lambda: {
+    "groq": admissao_groq.estatisticas(),
+    "hf": admissao_hf.estatisticas(),
+})
+metricas.registrar_fonte("coalescencia", lambda: {
+    "busca_web": coalescencia_busca_web.estatisticas(),
+    "groq": coalescencia_groq.estatisticas(),
+})
 HUGGING_FACE_API_KEY = os.getenv("HUGGING_FACE_API_KEY")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 
+# Ordem de registro = preferência enquanto ainda não há medições de latência
+# Os adaptadores recebem o PromptMontado: o HF só aceita texto, o Groq recebe mensagens de chat
+# Provedor sem chave não entra: falharia sempre e ainda ocuparia um lado do hedge
+if HUGGING_FACE_API_KEY:
+    roteador_llm.registrar("hf", lambda prompt, max_tokens: chamar_hf_inference(prompt.texto, max_tokens))
+if GROQ_API_KEY:
+    roteador_llm.registrar("groq", lambda prompt, max_tokens: chamar_groq_api(mensagens_groq(prompt), max_tokens))
+roteador_llm.registrar("offline", lambda prompt, max_tokens: resultado_offline(prompt), ultimo_recurso=True)
+
 def carregar_memorias(usuario):
     from banco.banco import carregar_memorias as carregar_memorias_db
     return carregar_memorias_db(usuario)
 
-def perguntar_ollama(pergunta, historico_conversa, memorias, persona, contexto_web=None):
+# Personas (separadas por vírgula) em que o Groq é chamado junto com o HF, sem esperar o atraso do hedge
+PERSONAS_LATENCIA_CRITICA = {
+    p.strip() for p in os.getenv("LLM_PERSONAS_LATENCIA_CRITICA", "").split(",") if p.strip()
+}
+
+# Limite de tokens por item, além do orçamento total do prompt
+MAX_TOKENS_MEMORIA = int(os.getenv("PROMPT_MAX_TOKENS_MEMORIA", 60))
+MAX_TOKENS_WEB = int(os.getenv("PROMPT_MAX_TOKENS_WEB", 250))
+
+estatisticas_prompt = EstatisticasPrompt()
+metricas.registrar_fonte("prompt_tokens", estatisticas_prompt.estatisticas)
+
+# "plano": prompt inteiro numa única mensagem user; "chat": system + histórico em user/assistant
+FORMATO_PROMPT = os.getenv("LLM_FORMATO_PROMPT", "plano")
+
+def orcamento_prompt():
+    """O mesmo prompt pode ir para qualquer provedor configurado (hedge/fallback): vale o menor orçamento."""
+    modelos = []
+    if os.getenv("GROQ_API_KEY"):
+        modelos.append(GROQ_MODELO)
+    if os.getenv("HUGGING_FACE_API_KEY"):
+        modelos.append(HF_MODELO)
+    if not modelos:
+        return ORCAMENTO_PADRAO
+    return min(orcamento_modelo(modelo) for modelo in modelos)
+
+def montar_prompt(pergunta, historico_conversa, memorias, persona, contexto_web=None, resumo=None):
+    """historico_conversa são só os turnos que o resumo da conversa (se houver) ainda não cobre."""
     print(f"\n🤖 Processando pergunta: {pergunta[:50]}...")
     
-    is_first_message = not historico_conversa
+    # Prefixo estático pré-renderizado: idêntico entre chamadas da mesma persona e estado da conversa
+    intro = obter_persona(persona).prefixo(primeira_mensagem=not historico_conversa and not resumo)
+
+    historico_recente = (historico_conversa or [])[-TURNOS_NO_PROMPT:]
+    turnos = [
+        f"\n[Turno {i}]\nUsuário: {msg.get('pergunta', '')}\nLyria: {msg.get('resposta', '')}"
+        for i, msg in enumerate(historico_recente, 1)
+    ]
+    memorias_recentes = [f"\n{memoria}" for memoria in (memorias or [])[-10:] if len(memoria) > 10]
+
+    montador = MontadorPrompt(orcamento_prompt())
+    montador.adicionar("persona", intro, obrigatoria=True, estatica=True)
+    montador.adicionar(
+        "resumo", f"\n{resumo}" if resumo else None, prioridade=2, truncavel=True,
+        cabecalho="\n\n=== RESUMO DA CONVERSA ATÉ AQUI ===", rodape="\n=== FIM DO RESUMO ===\n"
+    )
+    montador.adicionar(
+        "historico", turnos, prioridade=2, preferir_finais=True,
+        cabecalho="\n\n=== HISTÓRICO DA CONVERSA ATUAL ===", rodape="\n=== FIM DO HISTÓRICO ===\n"
+    )
+    montador.adicionar(
+        "memorias", memorias_recentes, prioridade=3, preferir_finais=True, max_tokens_item=MAX_TOKENS_MEMORIA,
+        cabecalho="\n=== MEMÓRIAS RELEVANTES ===", rodape="\n=== FIM DAS MEMÓRIAS ===\n"
+    )
+    montador.adicionar(
+        "web", f"\n{contexto_web}" if contexto_web else None, prioridade=1, truncavel=True,
+        max_tokens_item=MAX_TOKENS_WEB,
+        cabecalho="\n=== INFORMAÇÃO ATUALIZADA DA WEB ===", rodape="\n=== FIM DA INFORMAÇÃO DA WEB ===\n"
+    )
+    montador.adicionar("pergunta", f"\n\n=== PERGUNTA ATUAL ===\nUsuário: {pergunta}\n\nLyria:", obrigatoria=True)
+
+    montado = montador.montar()
+    montado.mensagens = montar_mensagens(montado, intro, historico_recente, pergunta)
+    estatisticas_prompt.registrar(montado)
 
-    # Define a base do prompt com placeholders para personalização
-    prompt_base = """
-    MODO: {modo}
+    print(f"📝 Prompt final: {len(montado.texto)} caracteres, {montado.resumo()}")
 
-    O QUE VOCÊ DEVE SER:
-    {instrucao_comportamento}
+    return montado
 
-    OBJETIVOS:
-    {objetivos}
+def montar_mensagens(montado, intro, historico_recente, pergunta):
+    """Formato de chat com o mesmo conteúdo que coube no orçamento.
 
-    ABORDAGEM:
-    {abordagem}
+    A persona (e o resumo) vão como system e o histórico como pares user/assistant, que se
+    repetem iguais de um turno para o outro; memórias e web, que mudam a cada
+    turno, ficam na última mensagem junto com a pergunta.
+    """
+    mensagens = [{"role": "system", "content": intro.strip()}]
+    if montado.blocos["resumo"]:
+        # Mensagem separada: o resumo muda a cada poucos turnos, a persona nunca
+        mensagens.append({"role": "system", "content": montado.blocos["resumo"].strip()})
+    for indice in montado.indices["historico"]:
+        msg = historico_recente[indice]
+        mensagens.append({"role": "user", "content": msg.get('pergunta', '')})
+        mensagens.append({"role": "assistant", "content": msg.get('resposta', '')})
+
+    contexto = (montado.blocos["memorias"] + montado.blocos["web"]).strip()
+    mensagens.append({"role": "user", "content": f"{contexto}\n\n{pergunta}" if contexto else pergunta})
+    return mensagens
+
+def mensagens_groq(prompt):
+    """Mensagens para a API compatível com OpenAI, no formato escolhido em LLM_FORMATO_PROMPT."""
+    if FORMATO_PROMPT == "chat":
+        return prompt.mensagens
+    return [{"role": "user", "content": prompt.texto}]
+
+def chave_cache_resposta(prompt):
+    # O formato entra na chave: o mesmo conteúdo em chat ou plano gera respostas diferentes
+    return hashlib.sha256(f"{FORMATO_PROMPT}\n{prompt.texto}".encode("utf-8")).hexdigest()
+
+def guardar_resposta_em_cache(chave, resposta, provedor, contexto_web, custo):
+    # A resposta offline de emergência nunca vai para o cache
+    if not resposta or provedor in (None, "offline"):
+        return
+    cache_respostas.guardar(chave, resposta, ttl=TTL_RESPOSTA_WEB if contexto_web else None, custo=custo)
+
+def carregar_indice_respostas(limite=5000):
+    """Preenche o índice de reaproveitamento com as primeiras perguntas dos usuários que não pediram busca na web.
+
+    carregar_primeiras_perguntas já aplica as regras de indexar_resposta que
+    dependem do banco: sem memórias (primeiro turno do usuário), provedor real
+    e a persona com que a resposta foi gerada.
+    """
+    try:
+        linhas = carregar_primeiras_perguntas(limite)
+        if not linhas:
+            return
+        precisa_web, _ = deve_buscar_na_web_lote([linha['pergunta'] for linha in linhas])
+        # Da mais antiga para a mais recente, para as recentes sobreviverem no buffer circular
+        for linha, web in reversed(list(zip(linhas, precisa_web))):
+            if not web and linha['persona']:
+                indice_respostas.adicionar(identificar_persona(linha['persona']), linha['pergunta'], linha['resposta'])
+        print(f"✅ Índice de respostas carregado: {indice_respostas.estatisticas()['entradas_por_persona']}")
+    except Exception as e:
+        print(f"⚠️ Erro ao carregar índice de respostas: {e}")
 
-    ESTILO DE COMUNICAÇÃO:
-    {estilo}
+def reaproveitavel(historico_conversa, memorias, contexto_web, resumo=None):
+    # Respostas de follow-ups dependem do histórico, as com memórias são pessoais e as da web envelhecem:
+    # nenhuma delas é reaproveitada, nem servida a partir do índice
+    return not historico_conversa and not memorias and not contexto_web and not resumo
 
-    RESTRIÇÕES DE CONTEÚDO E ESTILO - INSTRUÇÃO CRÍTICA:
-    - NUNCA use qualquer tipo de formatação especial (asteriscos, negrito, itálico, listas numeradas ou marcadores).
-    - NUNCA invente informações. Se não houver certeza, declare a limitação e sugira buscar dados na web.
-    - NUNCA use palavrões ou linguagem ofensiva.
-    - NUNCA mencione ou apoie atividades ilegais.
+def buscar_resposta_similar(pergunta, historico_conversa, memorias, persona, contexto_web, resumo=None):
+    if not reaproveitavel(historico_conversa, memorias, contexto_web, resumo):
+        return None
+    resposta = indice_respostas.buscar(identificar_persona(persona), pergunta)
+    if resposta is not None:
+        print(f"♻️ Resposta reaproveitada de pergunta parecida ({len(resposta)} caracteres)")
+    return resposta
 
-    PRIORIDADE CRÍTICA: Informações da web têm precedência por serem mais atuais.
-    """
+def indexar_resposta(pergunta, resposta, provedor, historico_conversa, memorias, persona, contexto_web, resumo=None):
+    # Só entram respostas geradas sem nenhum contexto (nem memórias do usuário) por um provedor real
+    if reaproveitavel(historico_conversa, memorias, contexto_web, resumo) and resposta and provedor not in (None, "offline"):
+        indice_respostas.adicionar(identificar_persona(persona), pergunta, resposta)
 
-    # Conteúdo específico de cada persona
-    personas_config = {
-        'professor': {
-            'modo': 'EDUCACIONAL',
-            'instrucao_inicio': '- Você é a Professora Lyria. Apresente-se calorosamente como uma professora de IA pronta para ajudar a aprender qualquer assunto de forma clara e objetiva, e então pergunte qual é a dúvida do usuário.',
-            'instrucao_continua': '- Você é a Professora Lyria. Responda diretamente à pergunta do usuário, sem se apresentar novamente.',
-            'objetivos': '- Explicar conceitos de forma clara e objetiva\n- Adaptar linguagem ao nível do usuário\n- Fornecer exemplos práticos e relevantes\n- Incentivar aprendizado progressivo\n- Conectar novos conhecimentos com conhecimentos prévios',
-            'abordagem': '- Priorizar informações atualizadas da web quando disponíveis\n- Estruturar respostas de forma lógica e sem rodeios\n- Explicar apenas o necessário, evitando repetições\n- Usar linguagem simples e direta\n- Confirmar compreensão antes de avançar para conceitos mais complexos',
-            'estilo': '- Tom didático, acessível e objetivo\n- Respostas curtas e bem estruturadas\n- Exemplos concretos\n- Clareza acima de detalhes supérfluos'
-        },
-        'empresarial': {
-            'modo': 'CORPORATIVO',
-            'instrucao_inicio': '- Você é a assistente Lyria. Apresente-se como uma assistente de IA para negócios, focada em fornecer análises práticas e otimizar resultados, e pergunte como pode ajudar a empresa.',
-            'instrucao_continua': '- Você é a assistente Lyria. Responda diretamente à necessidade do usuário, sem se apresentar novamente.',
-            'objetivos': '- Fornecer análises práticas e diretas\n- Focar em resultados mensuráveis e ROI\n- Otimizar processos e recursos\n- Apresentar soluções implementáveis\n- Considerar impactos financeiros e operacionais',
-            'abordagem': '- Priorizar dados atualizados da web sobre mercado e tendências\n- Apresentar informações de forma hierárquica e clara\n- Ser objetiva e evitar rodeios\n- Foco em eficiência, produtividade e ação imediata',
-            'estilo': '- Linguagem profissional, direta e objetiva\n- Respostas concisas e estruturadas\n- Terminologia empresarial apropriada\n- Ênfase em ação e resultados práticos'
-        },
-        'social': {
-            'modo': 'SOCIAL E COMPORTAMENTAL',
-            'instrucao_inicio': '- Você é a Lyria, uma assistente social e comportamental. Apresente-se de forma acolhedora, explique seu propósito de promover o autoconhecimento e o bem-estar, e convide o usuário a compartilhar o que gostaria de discutir.',
-            'instrucao_continua': '- Você é a Lyria. Continue a conversa de forma empática e direta, respondendo à pergunta do usuário sem se apresentar novamente.',
-            'objetivos': '- Oferecer suporte em questões sociais e relacionais\n- Compreender diferentes perspectivas culturais e geracionais\n- Fornecer conselhos equilibrados, claros e objetivos\n- Promover autoconhecimento e bem-estar\n- Sugerir recursos de apoio quando necessário',
-            'abordagem': '- Considerar informações atuais da web sobre comportamento social\n- Adaptar conselhos ao contexto cultural específico\n- Ser direta e empática, evitando excesso de explicações\n- Promover reflexão prática e crescimento pessoal',
-            'estilo': '- Linguagem natural, acolhededora e objetiva\n- Respostas claras e sem enrolação\n- Tom compreensivo, mas honesto\n- Perguntas que incentivem insights rápidos'
-        }
-    }
-    
-    # Seleciona a persona correta
-    persona_selecionada = 'social'
-    if 'empresarial' in persona.lower():
-        persona_selecionada = 'empresarial'
-    elif 'professor' in persona.lower():
-        persona_selecionada = 'professor'
-
-    config = personas_config[persona_selecionada]
-
-    # Define a instrução de comportamento com base no estado da conversa
-    instrucao_comportamento = config['instrucao_inicio'] if is_first_message else config['instrucao_continua']
-
-    # Formata o prompt final
-    intro = prompt_base.format(
-        modo=config['modo'],
-        instrucao_comportamento=instrucao_comportamento,
-        objetivos=config['objetivos'],
-        abordagem=config['abordagem'],
-        estilo=config['estilo']
+def resultado_sem_provedor(texto, origem, inicio):
+    """Resposta servida do cache ou do índice de reaproveitamento: nenhum token gasto."""
+    return ResultadoLLM(
+        texto=texto, provedor=origem, tokens_prompt=0, tokens_resposta=0,
+        latencia_ms=(time.perf_counter() - inicio) * 1000
     )
-    
-    prompt_parts = [intro]
-    
-    if historico_conversa and len(historico_conversa) > 0:
-        prompt_parts.append("\n\n=== HISTÓRICO DA CONVERSA ATUAL ===")
-        for i, msg in enumerate(historico_conversa[-10:], 1):
-            pergunta_anterior = msg.get('pergunta', '')
-            resposta_anterior = msg.get('resposta', '')
-            prompt_parts.append(f"\n[Turno {i}]")
-            prompt_parts.append(f"\nUsuário: {pergunta_anterior}")
-            prompt_parts.append(f"\nLyria: {resposta_anterior}")
-        
-        prompt_parts.append("\n=== FIM DO HISTÓRICO ===\n")
-        print(f"📚 Incluídos {len(historico_conversa)} turnos da conversa atual no contexto")
-    
-    if memorias and len(memorias) > 0:
-        prompt_parts.append("\n=== MEMÓRIAS RELEVANTES ===")
-        ultimas_memorias = memorias[-10:] if len(memorias) > 10 else memorias
-        
-        for memoria in ultimas_memorias:
-            if len(memoria) > 10:  
-                prompt_parts.append(f"\n{memoria[:200]}") 
-        
-        prompt_parts.append("\n=== FIM DAS MEMÓRIAS ===\n")
-        print(f"🧠 Incluídas {len(ultimas_memorias)} memórias no contexto")
-    
-    if contexto_web:
-        prompt_parts.append(f"\n=== INFORMAÇÃO ATUALIZADA DA WEB ===")
-        prompt_parts.append(f"\n{contexto_web[:400]}")  
-        prompt_parts.append(f"\n=== FIM DA INFORMAÇÃO DA WEB ===\n")
-        print(f"🌐 Contexto web incluído ({len(contexto_web)} caracteres)")
-    
-    prompt_parts.append(f"\n\n=== PERGUNTA ATUAL ===")
-    prompt_parts.append(f"\nUsuário: {pergunta}")
-    prompt_parts.append("\n\nLyria:")
-    
-    prompt_final = "".join(prompt_parts)
-    
-    print(f"📝 Prompt final: {len(prompt_final)} caracteres")
-    print(f"   - Conversas: {len(historico_conversa) if historico_conversa else 0}")
-    print(f"   - Memórias: {len(memorias) if memorias else 0}")
-    print(f"   - Web: {'Sim' if contexto_web else 'Não'}")
-    
-    resposta = chamar_hf_inference(prompt_final, max_new_tokens=600)
-    print(f"💬 Resposta gerada: {len(resposta) if resposta else 0} caracteres")
-    
-    return resposta
+
+def repassar(fluxo, pedacos):
+    """`yield from` que também guarda os pedaços repassados; devolve o valor de retorno do fluxo."""
+    while True:
+        try:
+            pedaco = next(fluxo)
+        except StopIteration as fim:
+            return fim.value
+        pedacos.append(pedaco)
+        yield pedaco
+
+def perguntar_ollama(pergunta, historico_conversa, memorias, persona, contexto_web=None, usar_cache=False, resumo=None):
+    """Retorna o ResultadoLLM da resposta (texto, provedor, modelo, tokens e latência).
+
+    usar_cache só deve ser ligado quando o prompt é determinado pela entrada (endpoint anônimo).
+    """
+    inicio = time.perf_counter()
+    resposta = buscar_resposta_similar(pergunta, historico_conversa, memorias, persona, contexto_web, resumo)
+    if resposta is not None:
+        return resultado_sem_provedor(resposta, "reuso", inicio)
+
+    prompt = montar_prompt(pergunta, historico_conversa, memorias, persona, contexto_web, resumo)
+
+    chave = chave_cache_resposta(prompt) if usar_cache else None
+    if chave:
+        resposta = cache_respostas.obter(chave)
+        if resposta is not None:
+            print(f"⚡ Resposta servida do cache ({len(resposta)} caracteres)")
+            return resultado_sem_provedor(resposta, "cache", inicio)
+
+    inicio = time.perf_counter()
+    critico_latencia = identificar_persona(persona) in PERSONAS_LATENCIA_CRITICA
+    resultado = gerar_resposta_llm(prompt, max_tokens=600, critico_latencia=critico_latencia)
+    print(f"💬 Resposta gerada: {len(resultado.texto) if resultado.texto else 0} caracteres")
+
+    if chave:
+        guardar_resposta_em_cache(chave, resultado.texto, resultado.provedor, contexto_web, time.perf_counter() - inicio)
+    indexar_resposta(pergunta, resultado.texto, resultado.provedor, historico_conversa, memorias, persona, contexto_web, resumo)
+    return resultado
+
+def perguntar_ollama_stream(pergunta, historico_conversa, memorias, persona, contexto_web=None, usar_cache=False, resumo=None):
+    """Versão em streaming de perguntar_ollama: gera a resposta em pedaços.
+
+    Se o stream do Groq falhar antes do primeiro pedaço, cai no fluxo normal
+    do roteador de provedores e entrega a resposta inteira de uma vez. O valor
+    de retorno do gerador é o ResultadoLLM, como em perguntar_ollama.
+    """
+    inicio = time.perf_counter()
+    resposta = buscar_resposta_similar(pergunta, historico_conversa, memorias, persona, contexto_web, resumo)
+    if resposta is not None:
+        yield resposta
+        return resultado_sem_provedor(resposta, "reuso", inicio)
+
+    prompt = montar_prompt(pergunta, historico_conversa, memorias, persona, contexto_web, resumo)
+
+    chave = chave_cache_resposta(prompt) if usar_cache else None
+    if chave:
+        resposta = cache_respostas.obter(chave)
+        if resposta is not None:
+            print(f"⚡ Resposta servida do cache ({len(resposta)} caracteres)")
+            yield resposta
+            return resultado_sem_provedor(resposta, "cache", inicio)
+
+    inicio = time.perf_counter()
+    pedacos = []
+    try:
+        resultado = yield from repassar(chamar_groq_api_stream(mensagens_groq(prompt), max_tokens=600), pedacos)
+        if pedacos:
+            print(f"💬 Resposta em stream: {resultado.resumo()}")
+            if chave:
+                guardar_resposta_em_cache(chave, resultado.texto, "groq", contexto_web, time.perf_counter() - inicio)
+            indexar_resposta(pergunta, resultado.texto, "groq", historico_conversa, memorias, persona, contexto_web, resumo)
+            return resultado
+    except Exception as e:
+        if pedacos:
+            raise
+        print(f"⚠️ GROQ (stream) indisponível, usando fluxo sem streaming: {e}")
+
+    critico_latencia = identificar_persona(persona) in PERSONAS_LATENCIA_CRITICA
+    resultado = gerar_resposta_llm(prompt, max_tokens=600, critico_latencia=critico_latencia)
+    if chave:
+        guardar_resposta_em_cache(chave, resultado.texto, resultado.provedor, contexto_web, time.perf_counter() - inicio)
+    indexar_resposta(pergunta, resultado.texto, resultado.provedor, historico_conversa, memorias, persona, contexto_web, resumo)
+    yield resultado.texto
+    return resultado
 
 def verificar_ollama_status():
     groq_ok = bool(os.getenv("GROQ_API_KEY"))
@@ -408,10 +750,10 @@ def verificar_ollama_status():
     else:
         return {'status': 'warning', 'detalhes': 'Nenhuma API configurada - modo offline'}
 
-def buscar_na_web(pergunta):
+def buscar_na_serpapi(pergunta, hl="pt-br", gl="br"):
     try:
-        params = {"q": pergunta, "hl": "pt-br", "gl": "br", "api_key": SERPAPI_KEY}
-        res = requests.get("https://serpapi.com/search", params=params, timeout=10)
+        params = {"q": pergunta, "hl": hl, "gl": gl, "api_key": SERPAPI_KEY}
+        res = cliente_http.get("https://serpapi.com/search", params=params, timeout=10)
         res.raise_for_status()
         
         resultados = res.json().get("organic_results", [])
@@ -421,112 +763,16 @@ def buscar_na_web(pergunta):
     except Exception as e:
         return None
 
+def buscar_na_web(pergunta, hl="pt-br", gl="br"):
+    chave = (hl, gl, normalizar_pergunta(pergunta))
+    return coalescencia_busca_web.executar(
+        chave,
+        cache_busca_web.obter_ou_buscar,
+        pergunta, hl, gl, lambda consulta: buscar_na_serpapi(consulta, hl, gl)
+    )
+
 def get_persona_texto(persona_tipo):
-    personas = {
-        'professor': """
-        MODO: EDUCACIONAL
-
-        O QUE VOCÊ DEVE SER:
-        - Você será a professora Lyria
-
-        OBJETIVOS:
-        - Explicar conceitos de forma clara e objetiva
-        - Adaptar linguagem ao nível do usuário
-        - Fornecer exemplos práticos e relevantes
-        - Incentivar aprendizado progressivo
-        - Conectar novos conhecimentos com conhecimentos prévios
-
-        ABORDAGEM:
-        - Priorizar informações atualizadas da web quando disponíveis
-        - Estruturar respostas de forma lógica e sem rodeios
-        - Explicar apenas o necessário, evitando repetições
-        - Usar linguagem simples e direta
-        - Confirmar compreensão antes de avançar para conceitos mais complexos
-
-        ESTILO DE COMUNICAÇÃO:
-        - Tom didático, acessível e objetivo
-        - Respostas curtas e bem estruturadas
-        - Exemplos concretos
-        - Clareza acima de detalhes supérfluos
-
-        RESTRIÇÕES DE CONTEÚDO E ESTILO - INSTRUÇÃO CRÍTICA:
-        - NUNCA use qualquer tipo de formatação especial (asteriscos, negrito, itálico, listas numeradas ou marcadores).
-        - NUNCA invente informações. Se não houver certeza, declare a limitação e sugira buscar dados na web.
-        - NUNCA use palavrões ou linguagem ofensiva.
-        - NUNCA mencione ou apoie atividades ilegais.
-
-        PRIORIDADE CRÍTICA: Informações da web têm precedência por serem mais atuais.
-        """,
-
-        'empresarial': """
-        MODO: CORPORATIVO
-
-        O QUE VOCÊ DEVE SER:
-        - Você será a assistente Lyria
-
-        OBJETIVOS:
-        - Fornecer análises práticas e diretas
-        - Focar em resultados mensuráveis e ROI
-        - Otimizar processos e recursos
-        - Apresentar soluções implementáveis
-        - Considerar impactos financeiros e operacionais
-
-        ABORDAGEM:
-        - Priorizar dados atualizados da web sobre mercado e tendências
-        - Apresentar informações de forma hierárquica e clara
-        - Ser objetiva e evitar rodeios
-        - Foco em eficiência, produtividade e ação imediata
-
-        ESTILO DE COMUNICAÇÃO:
-        - Linguagem profissional, direta e objetiva
-        - Respostas concisas e estruturadas
-        - Terminologia empresarial apropriada
-        - Ênfase em ação e resultados práticos
-
-        RESTRIÇÕES DE CONTEÚDO E ESTILO - INSTRUÇÃO CRÍTICA:
-        - NUNCA use qualquer tipo de formatação especial (asteriscos, negrito, itálico, listas numeradas ou marcadores).
-        - NUNCA invente informações. Se não houver certeza, declare a limitação e sugira buscar dados na web.
-        - NUNCA use palavrões ou linguagem ofensiva.
-        - NUNCA mencione ou apoie atividades ilegais.
-
-        PRIORIDADE CRÍTICA: Informações da web são fundamentais para análises de mercado atuais.
-        """,
-
-        'social': """
-        MODO: SOCIAL E COMPORTAMENTAL
-
-        O QUE VOCÊ DEVE SER:
-        - Você será apenas a Lyria
-
-        OBJETIVOS:
-        - Oferecer suporte em questões sociais e relacionais
-        - Compreender diferentes perspectivas culturais e geracionais
-        - Fornecer conselhos equilibrados, claros e objetivos
-        - Promover autoconhecimento e bem-estar
-        - Sugerir recursos de apoio quando necessário
-
-        ABORDAGEM:
-        - Considerar informações atuais da web sobre comportamento social
-        - Adaptar conselhos ao contexto cultural específico
-        - Ser direta e empática, evitando excesso de explicações
-        - Promover reflexão prática e crescimento pessoal
-
-        ESTILO DE COMUNICAÇÃO:
-        - Linguagem natural, acolhedora e objetiva
-        - Respostas claras e sem enrolação
-        - Tom compreensivo, mas honesto
-        - Perguntas que incentivem insights rápidos
-
-        RESTRIÇÕES DE CONTEÚDO E ESTILO - INSTRUÇÃO CRÍTICA:
-        - NUNCA use qualquer tipo de formatação especial (asteriscos, negrito, itálico, listas numeradas ou marcadores).
-        - NUNCA invente informações. Se não houver certeza, declare a limitação e sugira buscar dados na web.
-        - NUNCA use palavrões ou linguagem ofensiva.
-        - NUNCA mencione ou apoie atividades ilegais.
-
-        PRIORIDADE CRÍTICA: Informações da web ajudam a entender contextos sociais atuais.
-        """
-    }
-    return personas.get(persona_tipo, personas['professor'])
+    return obter_persona(persona_tipo).prefixo(primeira_mensagem=False)
 
 if __name__ == "__main__":
     print("=== LYRIA BOT - VERSÃO DEBUG ===\n")
@@ -579,7 +825,7 @@ if __name__ == "__main__":
             print("🌐 Buscando informações na web...")
             contexto_web = buscar_na_web(entrada)
 
-        resposta = perguntar_ollama(
+        resultado = perguntar_ollama(
             entrada,
             carregar_conversas(usuario),
             carregar_memorias(usuario),
@@ -587,5 +833,5 @@ if __name__ == "__main__":
             contexto_web
         )
 
-        print(f"\nLyria: {resposta}")
-        salvarMensagem(usuario, entrada, resposta, modelo_usado="api", tokens=None)
\ No newline at end of file
+        print(f"\nLyria: {resultado.texto}")
+        salvarMensagem(usuario, entrada, resultado.texto, resultado=resultado, persona=persona_tipo)
\ No newline at end of file